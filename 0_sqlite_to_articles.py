@@ -2,44 +2,193 @@
 # -*- coding: utf-8 -*-
 """
 Extract and format articles from FreshRSS SQLite DB into individual text files.
+
+The FreshRSS DB is opened read-only (URI mode=ro), so extraction never takes a
+write lock on the live database. Allowed feeds are resolved to IDs once, entries
+are filtered with `id_feed IN (...)` plus the date range, and rows are streamed
+from the cursor one at a time instead of loading every HTML body into memory.
+
+With --incremental, the last processed entry.id per feed is kept in a small state
+store (articles/extract_state.sqlite). Only entries newer than that watermark are
+written to the new articles_<timestamp> directory; successful_articles.txt still
+covers the whole window by listing the articles extracted by earlier runs too, and
+new_articles.txt lists just the delta.
+
+HTML is cleaned by html_cleaner.py with the fastest installed parser (selectolax,
+lxml, then BeautifulSoup). Large windows are cleaned in a process pool while the
+cursor keeps streaming; per-article clean time is reported at the end.
+
+With --store, articles go into a single articles.sqlite in the output directory
+(see article_store.py) instead of one text file each; the list files then hold
+"<store>#<id>" references.
 Usage:
-    python 0_sqlite_to_articles.py [--db <DB_PATH>] [--hours 168] [--end-hour 18]
+    python 0_sqlite_to_articles.py [--db <DB_PATH>] [--hours 168] [--end-hour 18] [--incremental]
+                                   [--cleaner auto|selectolax|lxml|bs4] [--workers N] [--store]
 """
 import os
 import sys
 import argparse
 import sqlite3
+from urllib.request import pathname2url
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
+from article_store import BUSY_TIMEOUT, STORE_FILE_NAME, ArticleStore, article_exists, format_article
+from html_cleaner import available_backends, clean_stream, resolve_backend
+import metrics
+
+DEFAULT_STATE_PATH = os.path.join("articles", "extract_state.sqlite")
+# Processed-article records are kept this long past the window start, then pruned
+STATE_RETENTION_DAYS = 30
+# Unless --workers is given, this many entries are cleaned inline before a process pool is started
+PARALLEL_CLEAN_MIN_ENTRIES = 500
+SLOW_CLEAN_SECONDS = 1.0
+SLOWEST_REPORTED = 5
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Extract and format articles from FreshRSS SQLite DB")
     parser.add_argument("--db", help="Path to FreshRSS SQLite database file (overrides DB_PATH in .env)")
     parser.add_argument("--hours", type=int, default=168, help="Time window in hours (default: 168)")
     parser.add_argument("--end-hour", type=int, default=17, help="End hour of day (0-23) for the window end (default: 17)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only extract entries newer than the per-feed watermark from previous runs")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH,
+                        help=f"Incremental state store (default: {DEFAULT_STATE_PATH})")
+    parser.add_argument("--cleaner", choices=["auto"] + list(available_backends()), default="auto",
+                        help="HTML parser used to clean entry content (default: auto, fastest installed)")
+    parser.add_argument("--workers", type=int,
+                        help="Processes for HTML cleaning; 0/1 cleans inline "
+                             f"(default: all CPUs once more than {PARALLEL_CLEAN_MIN_ENTRIES} entries are streamed)")
+    parser.add_argument("--store", action="store_true",
+                        help=f"Write articles into a single {STORE_FILE_NAME} instead of one text file per article")
     return parser.parse_args()
 
 
-def main():
-    load_dotenv() # Load environment variables from .env file
-    args = parse_args()
+class ExtractState:
+    """Per-feed watermarks (last entry.id) and the article files written for each processed entry."""
 
-    db_path = args.db  # Prioritize command-line argument
-    if not db_path:
-        db_path = os.getenv("DB_PATH") # Fallback to .env variable
+    def __init__(self, path):
+        state_dir = os.path.dirname(path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        # Shared by the daemon's poller and incremental pipeline runs
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " feed_id INTEGER PRIMARY KEY, last_id INTEGER NOT NULL, last_date INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " entry_id INTEGER PRIMARY KEY, feed_id INTEGER NOT NULL, date INTEGER NOT NULL, path TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_processed_date ON processed(date);"
+        )
 
-    if not db_path:
-        print("Error: Database path not provided. Set --db argument or DB_PATH in .env file.")
-        sys.exit(1)
+    def watermarks(self):
+        return {feed_id: last_id for feed_id, last_id in self.conn.execute("SELECT feed_id, last_id FROM watermarks")}
+
+    def record(self, entry_id, feed_id, date_val, path):
+        self.conn.execute("INSERT OR REPLACE INTO processed (entry_id, feed_id, date, path) VALUES (?, ?, ?, ?)",
+                          (entry_id, feed_id, date_val, path))
+        self.conn.execute(
+            "INSERT INTO watermarks (feed_id, last_id, last_date) VALUES (?, ?, ?) "
+            "ON CONFLICT(feed_id) DO UPDATE SET last_id = MAX(last_id, excluded.last_id), "
+            "last_date = MAX(last_date, excluded.last_date)",
+            (feed_id, entry_id, date_val),
+        )
+
+    def window_paths(self, start_ts, end_ts, exclude=()):
+        """Article files from earlier runs whose entry date falls inside the window, newest first."""
+        rows = self.conn.execute(
+            "SELECT entry_id, date, path FROM processed WHERE date BETWEEN ? AND ? ORDER BY date DESC",
+            (start_ts, end_ts),
+        )
+        return [(date_val, path) for entry_id, date_val, path in rows if entry_id not in exclude and article_exists(path)]
+
+    def prune(self, before_ts):
+        self.conn.execute("DELETE FROM processed WHERE date < ?", (before_ts,))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def open_readonly(db_path):
+    """Open the FreshRSS DB read-only; in WAL mode this never blocks FreshRSS writers."""
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def resolve_feeds(conn, feed_names, wechat_category_id, wechat_url_pattern):
+    """Map the allowed feed names plus the WeChat category/URL rule to {feed_id: feed_name}."""
+    placeholders = ",".join("?" * len(feed_names))
+    rows = conn.execute(
+        f"SELECT id, name FROM feed WHERE name IN ({placeholders}) OR (category = ? AND url LIKE ?)",
+        (*feed_names, wechat_category_id, f"%{wechat_url_pattern}%"),
+    ).fetchall()
+    found = {name for _, name in rows}
+    missing = [name for name in feed_names if name not in found]
+    if missing:
+        print(f"Warning: feeds not found in database: {', '.join(missing)}")
+    return dict(rows)
+
+
+def check_query_plan(conn, query, params):
+    """Print the plan and warn unless the date range (or the incremental id range) is served by an index."""
+    plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    print("Query plan: " + " | ".join(plan))
+    if not any("INDEX" in step and ("date" in step or "id>" in step) for step in plan):
+        print("Warning: the entry query does not use an index on date and will read far more rows than the window. "
+              "Consider: CREATE INDEX entry_feed_date_index ON entry(id_feed, date);")
+    return plan
+
+
+def clean_workers(requested):
+    """Worker count for HTML cleaning: --workers if given, else one per CPU."""
+    if requested is not None:
+        return max(0, requested)
+    cpus = os.cpu_count() or 1
+    return cpus if cpus >= 2 else 0
+
+
+def report_clean_times(timings):
+    """Print total clean time plus the slowest articles, so pathological HTML is easy to spot."""
+    if not timings:
+        return
+    total = sum(seconds for seconds, _ in timings)
+    slow = sum(1 for seconds, _ in timings if seconds >= SLOW_CLEAN_SECONDS)
+    print(f"HTML cleaning: {total:.2f}s CPU over {len(timings)} articles "
+          f"(avg {total / len(timings) * 1000:.1f} ms, {slow} over {SLOW_CLEAN_SECONDS:g}s)")
+    for seconds, title in sorted(timings, key=lambda item: -item[0])[:SLOWEST_REPORTED]:
+        print(f"  {seconds * 1000:8.1f} ms  {title}")
 
-    # Compute window end timestamp: today at end_hour or yesterday if before end_hour
+
+def window_bounds(hours, end_hour):
+    """(start, end) datetimes of the window ending today at end_hour, or yesterday if before end_hour."""
     now = datetime.now()
-    if now.hour >= args.end_hour:
-        end_dt = now.replace(hour=args.end_hour, minute=0, second=0, microsecond=0)
+    if now.hour >= end_hour:
+        end_dt = now.replace(hour=end_hour, minute=0, second=0, microsecond=0)
+    else:
+        end_dt = (now - timedelta(days=1)).replace(hour=end_hour, minute=0, second=0, microsecond=0)
+    return end_dt - timedelta(hours=hours), end_dt
+
+
+def extract_articles(db_path, hours=168, end_hour=17, incremental=False, state_path=DEFAULT_STATE_PATH,
+                     cleaner="auto", workers=None, store=False, on_article=None, feed_names=None,
+                     end_dt=None):
+    """
+    Extract the window into a new articles_<timestamp> directory. Returns its list file, or None when empty.
+    on_article(path, link, title, text), if given, is called as soon as each new article has been written.
+    feed_names, if given, replaces ALLOWED_FEED_NAMES (multi-digest runs extract the union of their feeds).
+    end_dt, if given, ends the window there instead of at end_hour (daemon.py extracts up to the present).
+    """
+    if end_dt is None:
+        start_dt, end_dt = window_bounds(hours, end_hour)
     else:
-        end_dt = (now - timedelta(days=1)).replace(hour=args.end_hour, minute=0, second=0, microsecond=0)
-    start_dt = end_dt - timedelta(hours=args.hours)
+        start_dt = end_dt - timedelta(hours=hours)
     start_ts = int(start_dt.timestamp())
     end_ts = int(end_dt.timestamp())
     print(f"Extracting entries from {start_dt} to {end_dt} (timestamps {start_ts}-{end_ts})")
@@ -49,12 +198,11 @@ def main():
         print(f"Error: database file '{db_path}' not found.")
         sys.exit(1)
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = open_readonly(db_path)
 
     # Load query conditions from environment variables
     # These are expected to be set in the .env file as they are for customization.
-    allowed_feed_names_str = os.getenv("ALLOWED_FEED_NAMES")
+    allowed_feed_names_str = ",".join(feed_names) if feed_names else os.getenv("ALLOWED_FEED_NAMES")
     # WECHAT_CATEGORY_ID and WECHAT_URL_PATTERN_CONTAINS are optional with defaults.
     wechat_category_id = os.getenv("WECHAT_CATEGORY_ID", "0")
     wechat_url_pattern = os.getenv("WECHAT_URL_PATTERN_CONTAINS", "wechat")
@@ -75,61 +223,128 @@ def main():
         print(f"Error: ALLOWED_FEED_NAMES environment variable was set but resulted in an empty list of feed names. Please provide valid, comma-separated feed names.")
         sys.exit(1)
 
-    # Dynamically build the WHERE clause for feed names
-    feed_name_conditions = " OR ".join(["f.name = ?"] * len(allowed_feed_names))
-    
-    query_template = f'''
-    SELECT e.link, e.title, e.content, e.date, f.name
+    state = ExtractState(state_path) if incremental else None
+    watermarks = state.watermarks() if state else {}
+
+    # Resolve the allowed feeds to IDs once, then filter entries with an IN list on id_feed
+    feeds = resolve_feeds(conn, allowed_feed_names, wechat_category_id, wechat_url_pattern)
+    if not feeds:
+        print("No matching feeds found in the database.")
+        conn.close()
+        return None
+    # In incremental mode, pre-filter on the lowest per-feed watermark; exact per-feed check below
+    min_watermark = min(watermarks.get(feed_id, 0) for feed_id in feeds)
+
+    feed_placeholders = ",".join("?" * len(feeds))
+    # The id condition is only added when there is a watermark, so a plain run keeps the date index
+    id_condition = "AND e.id > ?" if min_watermark else ""
+    query = f'''
+    SELECT e.id, e.id_feed, e.link, e.title, e.content, e.date
     FROM entry e
-    JOIN feed f ON e.id_feed = f.id
-    WHERE e.date BETWEEN ? AND ?
-      AND (
-        {feed_name_conditions}
-        OR (f.category = ? AND f.url LIKE ?)
-      )
+    WHERE e.id_feed IN ({feed_placeholders})
+      AND e.date BETWEEN ? AND ?
+      {id_condition}
     ORDER BY e.date DESC
     '''
-    
-    params = [start_ts, end_ts] + allowed_feed_names + [wechat_category_id, f'%{wechat_url_pattern}%']
-    
-    cursor.execute(query_template, tuple(params))
-    rows = cursor.fetchall()
-    conn.close()
-
-    if not rows:
-        print("No entries found in the specified time window.")
-        sys.exit(0)
+    params = (*feeds, start_ts, end_ts) + ((min_watermark,) if min_watermark else ())
+    check_query_plan(conn, query, params)
+    backend = resolve_backend(cleaner)
+    # Without --workers the pool only starts once the window turns out to be large, so no COUNT(*) pass is needed
+    inline_first = PARALLEL_CLEAN_MIN_ENTRIES if workers is None else 0
+    workers = clean_workers(workers)
+    print(f"HTML cleaner: {backend}" + (f", {workers} worker processes" if workers > 1 else "")
+          + (f" after the first {inline_first} entries" if workers > 1 and inline_first else ""))
 
     # Prepare output directory based on current timestamp
     base_dir = "articles"
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = os.path.join(base_dir, f"articles_{timestamp}")
+    created_dir = not os.path.exists(output_dir)
     os.makedirs(output_dir, exist_ok=True)
     list_file = os.path.join(output_dir, "successful_articles.txt")
+    store = ArticleStore(os.path.join(output_dir, STORE_FILE_NAME)) if store else None
+
+    # Stream rows from the cursor, clean them (in order, possibly in a pool) and write each article as a text file
+    rows = (row for row in conn.execute(query, params) if row[0] > watermarks.get(row[1], 0))
+    new_paths = []
+    new_ids = set()
+    timings = []
+    idx = 0
+    with metrics.span("extract.articles", backend=backend, workers=workers) as span_attrs:
+        for row, text, seconds in clean_stream(rows, lambda row: row[4], backend, workers,
+                                                inline_first=inline_first):
+            entry_id, feed_id, link, title, _, date_val = row
+            idx += 1
+            feed_name = feeds[feed_id]
+            timings.append((seconds, title))
+            metrics.observe("extract.clean", seconds)
+            if store:
+                file_path = store.add(idx, entry_id, link, title, feed_name, date_val, text)
+            else:
+                file_path = os.path.join(output_dir, f"article_{idx}.txt")
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(format_article(link, title, text, date_val, feed_name))
+            new_paths.append((date_val, file_path))
+            new_ids.add(entry_id)
+            if state:
+                state.record(entry_id, feed_id, date_val, os.path.abspath(file_path))
+            if on_article:
+                if store:
+                    store.commit()  # make the row visible to readers before handing the reference on
+                on_article(file_path, link, title, text)
+        span_attrs["articles"] = idx
+
+    conn.close()
+    if store:
+        store.close()
+    report_clean_times(timings)
+
+    previous = state.window_paths(start_ts, end_ts, exclude=new_ids) if state else []
+    if state:
+        print(f"Incremental: {len(new_paths)} new entries, {len(previous)} already extracted in this window")
+
+    if not new_paths and not previous:
+        print("No entries found in the specified time window.")
+        if created_dir:
+            if store:
+                os.remove(store.path)
+            os.rmdir(output_dir)
+        if state:
+            state.close()
+        return None
 
-    # Write each article as a text file and record the path
+    # Full window, newest first: new articles merged with the ones extracted by earlier runs
+    all_paths = sorted(new_paths + previous, key=lambda item: -item[0])
     with open(list_file, "w", encoding="utf-8") as list_f:
-        for idx, (link, title, content, date_val, feed_name) in enumerate(rows, start=1):
-            file_name = f"article_{idx}.txt"
-            file_path = os.path.join(output_dir, file_name)
-            # Clean HTML content
-            soup = BeautifulSoup(content or "", "html.parser")
-            text = soup.get_text().strip()
-            # Format date
-            try:
-                dt_str = datetime.fromtimestamp(date_val).strftime("%Y年%m月%d日")
-            except Exception:
-                dt_str = str(date_val)
-            # Write file
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(link + "\n\n")
-                f.write(title + "\n\n")
-                f.write(f"{feed_name} {dt_str}" + "\n\n")
-                f.write(text)
+        for _, file_path in all_paths:
             list_f.write(file_path + "\n")
 
-    print(f"Extracted {len(rows)} articles. List file: {list_file}")
+    if state:
+        with open(os.path.join(output_dir, "new_articles.txt"), "w", encoding="utf-8") as new_f:
+            for _, file_path in new_paths:
+                new_f.write(file_path + "\n")
+        state.prune(start_ts - STATE_RETENTION_DAYS * 86400)
+        state.commit()
+        state.close()
+
+    print(f"Extracted {len(new_paths)} articles. List file: {list_file}")
+    return list_file
+
+
+def main():
+    load_dotenv() # Load environment variables from .env file
+    args = parse_args()
+
+    db_path = args.db  # Prioritize command-line argument
+    if not db_path:
+        db_path = os.getenv("DB_PATH") # Fallback to .env variable
+
+    if not db_path:
+        print("Error: Database path not provided. Set --db argument or DB_PATH in .env file.")
+        sys.exit(1)
+
+    extract_articles(db_path, args.hours, args.end_hour, args.incremental, args.state, args.cleaner, args.workers, args.store)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -3,56 +3,246 @@
 
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import math
+import json
+import glob
+import argparse
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 import time
-from threading import Lock
 from pathlib import Path
 
+import metrics
+import batch_inference
+from abstract_cache import AbstractCache, make_key
+from archive import NewsArchive
+from article_store import load_article, read_article_list
+from rate_limiter import limiter_from_env
+from token_budget import estimate_tokens, truncate_article
+from concurrency_controller import AdaptiveConcurrencyController
+
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI
 except ImportError:
     print("请先安装相应的 SDK, 例如: pip install openai 或检查引用。")
     sys.exit(1)
 
-# 速率限制器实现
-class RateLimiter:
-    def __init__(self, max_per_minute=1000):
-        self.max_per_minute = max_per_minute
-        self.minute_count = 0
-        self.last_reset_minute = time.time()
-        self.lock = Lock()
-        
-    def acquire(self):
-        with self.lock:
-            current_time = time.time()
-            
-            # 检查是否需要重置分钟计数器
-            if current_time - self.last_reset_minute >= 60:
-                self.minute_count = 0
-                self.last_reset_minute = current_time
-            
-            # 检查是否超过限制
-            if self.minute_count >= self.max_per_minute:
-                sleep_time = 60 - (current_time - self.last_reset_minute)
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                self.minute_count = 0
-                self.last_reset_minute = time.time()
-            
-            # 增加计数器
-            self.minute_count += 1
+# 默认同时在途的请求数（自适应控制的初始值）及其上下限
+DEFAULT_CONCURRENCY = 20
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 100
+# 每完成多少篇输出一次进度
+PROGRESS_EVERY = 20
+# 摘要请求参数（同时参与缓存键计算）
+ABSTRACT_MAX_TOKENS = 500
+ABSTRACT_TEMPERATURE = 0.5
+# 单篇文章输入 token 上限（超出部分保留标题/来源头部、导语与关键段落），0 表示不截断
+DEFAULT_MAX_INPUT_TOKENS = 3000
+# 批量推理（--batch）：轮询间隔（秒）与最长等待时间（小时），超时后取消批量任务并改为实时调用
+DEFAULT_BATCH_POLL_SECONDS = 60
+DEFAULT_BATCH_TIMEOUT_HOURS = 24
+
+def report(message, progress_callback=None):
+    """打印进度信息，并在提供回调时同步转发。"""
+    print(message)
+    if progress_callback:
+        progress_callback(message)
+
+
+class OrderedMarkdownWriter:
+    """
+    按文章原始顺序增量写出摘要：
+    某篇结果到达后，只要它之前的所有文章都已完成（成功或失败），就立即追加写入文件，
+    因此输出文件在运行过程中持续增长，最终内容与一次性合并写出完全一致。
+    """
+
+    def __init__(self, output_md, total):
+        self.output_md = output_md
+        self.total = total
+        self.pending = {}
+        self.next_idx = 0
+        self.written = 0
+        output_dir = os.path.dirname(output_md)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self._f = open(output_md, "w", encoding="utf-8")
+
+    def add(self, idx, md_text):
+        self.pending[idx] = md_text
+        while self.next_idx in self.pending:
+            text = self.pending.pop(self.next_idx)
+            if text:
+                if self.written:
+                    self._f.write("\n\n")
+                self._f.write(text)
+                self.written += 1
+            self.next_idx += 1
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class AbstractJournal:
+    """
+    检查点日志（JSONL），与输出文件同目录：<output_md>.journal.jsonl
+    第一行为头部信息（输入列表文件、输出文件、文章总数），之后每完成一篇追加一行并立即落盘，
+    进程中途退出后可通过 --resume 重新加载，仅提交尚未成功的文章。
+    """
+
+    def __init__(self, output_md, input_articles_file, total, resume=False):
+        self.path = journal_path_for(output_md)
+        self.done = {}
+        if resume and os.path.exists(self.path):
+            self.done = self._load()
+            self._f = open(self.path, "a", encoding="utf-8")
+        else:
+            self._f = open(self.path, "w", encoding="utf-8")
+            header = {
+                "input": os.path.abspath(input_articles_file),
+                "output": os.path.abspath(output_md),
+                "total": total,
+            }
+            self._write(header)
+
+    def _load(self):
+        done = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            next(f, None)  # 跳过头部
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 进程被杀时最后一行可能不完整
+                if entry.get("md_text"):
+                    done[entry["idx"]] = entry["md_text"]
+        return done
+
+    def _write(self, obj):
+        self._f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def record(self, idx, md_text, article_path=None):
+        self._write({"idx": idx, "path": article_path, "md_text": md_text})
+
+    def close(self, remove=False):
+        self._f.close()
+        if remove:
+            os.remove(self.path)
+
+
+def journal_path_for(output_md):
+    return f"{output_md}.journal.jsonl"
+
+
+def find_resumable_output(input_articles_file, search_dir):
+    """在 search_dir 中查找最近一次针对同一输入列表的检查点日志，返回其对应的输出文件路径。"""
+    target = os.path.abspath(input_articles_file)
+    journals = sorted(glob.glob(os.path.join(search_dir, "*.journal.jsonl")), key=os.path.getmtime, reverse=True)
+    for path in journals:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            continue
+        if header.get("input") == target:
+            return header.get("output")
+    return None
+
+
+def prune_journals(search_dir):
+    """
+    删除 search_dir 中已无法恢复的检查点日志：同一输入列表只有最新的一份会被 --resume 使用，
+    更早的以及输入列表已不存在的日志均删除。返回删除的路径列表。
+    """
+    journals = sorted(glob.glob(os.path.join(search_dir, "*.journal.jsonl")), key=os.path.getmtime, reverse=True)
+    seen = set()
+    removed = []
+    for path in journals:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                target = json.loads(f.readline()).get("input")
+        except (OSError, ValueError):
+            continue
+        if target and target not in seen and os.path.exists(target):
+            seen.add(target)
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
+
+
+def clean_abstract_text(md_text):
+    # 如果返回文本不是以 # 开头，则截去 # 之前的部分
+    if not md_text.startswith('#'):
+        start_hash = md_text.find('#')
+        if start_hash != -1:
+            md_text = md_text[start_hash:]
+    return md_text
+
 
-# 创建全局限流器
-rate_limiter = RateLimiter()
+def load_prompt():
+    with open(Path(__file__).parent / 'system_prompt' / 'abstract_prompt.md', 'r', encoding='utf-8') as f:
+        return f.read()
 
-def generate_abstract_from_article(client, model_id, article_path, batch_idx, progress_callback=None):
+
+def archived_abstract(archive, article_path):
+    """归档（archive.py）中该文章 URL 已有的摘要，没有或无法读取时返回 None。"""
+    try:
+        link = load_article(article_path).split("\n", 1)[0].strip()
+    except Exception:
+        return None
+    return archive.abstract_for(link)
+
+
+def build_messages(prompt, article_content):
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": article_content},
+    ]
+
+
+def prepare_article(article_path, batch_idx, prompt, model_id, cache=None, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                    token_stats=None, progress_callback=None):
+    """
+    读取文章并按 token 预算截断，若提供 cache 则查询缓存。
+    返回 (article_content, sent_tokens, cache_key, 缓存中的摘要或 None)；文章无法读取时抛出异常。
+    """
+    article_content = load_article(article_path)
+
+    # 按 token 预算截断过长的正文
+    article_content, original_tokens, sent_tokens = truncate_article(article_content, max_input_tokens)
+    if token_stats is not None:
+        token_stats["original"] += original_tokens
+        token_stats["sent"] += sent_tokens
+    if sent_tokens < original_tokens:
+        if token_stats is not None:
+            token_stats["truncated"] += 1
+        report(f"Article#{batch_idx}: 正文约 {original_tokens} tokens，截断为 {sent_tokens} tokens", progress_callback)
+
+    cache_key = None
+    cached = None
+    if cache is not None:
+        cache_key = make_key(article_content, prompt, model_id, ABSTRACT_TEMPERATURE, ABSTRACT_MAX_TOKENS)
+        cached = cache.get(cache_key)
+    return article_content, sent_tokens, cache_key, cached
+
+
+async def generate_abstract_from_article(client, model_id, article_path, batch_idx, prompt, limiter, controller, progress_callback=None, cache=None,
+                                         max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, token_stats=None):
     """
-    用于并行调用 API 的辅助函数：
+    用于并发调用 API 的协程：
     给定 client, model_id, article_path, 调用接口获取对应 Markdown 摘要。
     
+    每次调用前向共享的令牌桶限流器 limiter 申请请求数与预估 token 数；
+    429 / Retry-After 由限流器统一暂停，其余错误按带抖动的指数退避重试。
+    每次 API 调用占用自适应并发控制器 controller 的一个名额，并上报耗时与错误。
+    文章正文按 max_input_tokens 预算截断，token_stats（若提供）累计原始与实际发送的 token 数。
+    若提供 cache 且命中（文章内容 + 提示词 + 模型 + 采样参数完全一致），直接返回缓存结果，不调用 API。
     包含重试逻辑：如果发生错误，会自动重试最多3次。
     超过重试次数后，对错误情况返回None。
     
@@ -61,235 +251,514 @@ def generate_abstract_from_article(client, model_id, article_path, batch_idx, pr
     MAX_RETRIES = 3
     retry_count = 0
     
-    # 读取文章内容
+    # 读取文章内容（按 token 预算截断并查询缓存）
     try:
-        with open(article_path, 'r', encoding='utf-8') as f:
-            article_content = f.read()
+        article_content, sent_tokens, cache_key, cached = prepare_article(
+            article_path, batch_idx, prompt, model_id, cache, max_input_tokens, token_stats, progress_callback
+        )
     except Exception as e:
         error_message = f"无法读取文章文件 {article_path}: {str(e)}"
-        print(error_message)
-        if progress_callback:
-            progress_callback(error_message)
+        report(error_message, progress_callback)
         return (batch_idx, None, error_message)
+    if cached:
+        metrics.count("abstracts.cache_hits")
+        return (batch_idx, cached, None)
     
-    # 读取系统提示文件
-    with open('./system_prompt/abstract_prompt.md', 'r', encoding='utf-8') as f:
-        prompt = f.read()
+    # 预估本次调用的 token 消耗（输入 + 最大输出），用于 TPM 限流
+    estimated_tokens = estimate_tokens(prompt) + sent_tokens + ABSTRACT_MAX_TOKENS
+    # 指标：排队等待（限流 + 并发名额）累计所有尝试，延迟取最后一次调用
+    queue_wait = 0.0
+    latency = 0.0
     
     while retry_count < MAX_RETRIES:
         try:
-            # 获取速率限制许可
-            rate_limiter.acquire()
-            
-            completion = client.chat.completions.create(
-                model=model_id,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": article_content},
-                ],
-                max_tokens=500,
-                temperature=0.5
-            )
-            md_text = completion.choices[0].message.content
-            
-            # 如果返回文本不是以 # 开头，则截去 # 之前的部分
-            if not md_text.startswith('#'):
-                start_hash = md_text.find('#')
-                if start_hash != -1:
-                    md_text = md_text[start_hash:]
+            wait_start = time.monotonic()
+            # 获取速率限制许可（锁外异步等待，不阻塞其他请求）
+            await limiter.acquire_async(estimated_tokens)
             
+            async with controller.slot():
+                call_start = time.monotonic()
+                queue_wait += call_start - wait_start
+                try:
+                    raw_response = await client.chat.completions.with_raw_response.create(
+                        model=model_id,
+                        messages=build_messages(prompt, article_content),
+                        max_tokens=ABSTRACT_MAX_TOKENS,
+                        temperature=ABSTRACT_TEMPERATURE
+                    )
+                except Exception as e:
+                    latency = time.monotonic() - call_start
+                    report_decision(controller.record(latency, e), progress_callback)
+                    raise
+                latency = time.monotonic() - call_start
+                report_decision(controller.record(latency), progress_callback)
+            limiter.observe_headers(raw_response.headers)
+            completion = raw_response.parse()
+            usage = completion.usage
+            if usage is not None:
+                limiter.settle(estimated_tokens, usage.total_tokens)
+            md_text = clean_abstract_text(completion.choices[0].message.content)
+            metrics.llm_call("abstracts", model_id, latency, queue_wait=queue_wait, retries=retry_count,
+                             prompt_tokens=usage.prompt_tokens if usage else estimated_tokens - ABSTRACT_MAX_TOKENS,
+                             completion_tokens=usage.completion_tokens if usage else estimate_tokens(md_text or ""),
+                             estimated=usage is None)
+            if cache is not None and md_text:
+                cache.put(cache_key, md_text, model_id)
             return (batch_idx, md_text, None)
         
         except Exception as e:
             error_msg = str(e)
             retry_count += 1
             
-            retry_error_message = f"Article#{batch_idx}: API调用出错: {error_msg}，正在重试 ({retry_count}/{MAX_RETRIES})..."
-            print(retry_error_message)
-            if progress_callback:
-                progress_callback(retry_error_message)
+            report(f"Article#{batch_idx}: API调用出错: {error_msg}，正在重试 ({retry_count}/{MAX_RETRIES})...", progress_callback)
             
             if retry_count < MAX_RETRIES:
-                time.sleep(1)  # 延迟一秒后重试
+                await asyncio.sleep(limiter.retry_delay(e, retry_count))
             else:
-                final_error_message = f"Article#{batch_idx}: 已达到最大重试次数，放弃处理此文章..."
-                print(final_error_message)
-                if progress_callback:
-                    progress_callback(final_error_message)
+                report(f"Article#{batch_idx}: 已达到最大重试次数，放弃处理此文章...", progress_callback)
+                metrics.llm_call("abstracts", model_id, latency, queue_wait=queue_wait, retries=retry_count - 1,
+                                 status="error")
                 return (batch_idx, None, error_msg)
 
 
-def main(input_articles_file, output_md=None, progress_callback=None):
+def report_decision(decision, progress_callback=None):
+    if decision:
+        report(f"自适应并发: {decision}", progress_callback)
+
+
+async def run_abstracts(client, model_id, jobs, controller, on_result, limiter, progress_callback=None, cache=None,
+                        max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, token_stats=None):
     """
-    从input_articles_file文件读取文章路径列表，利用多线程并行调用AI生成摘要Markdown文本并合并，
-    最终输出为一个output_md文件（纯Markdown）。
-    从环境变量或.env文件读取API Key、model ID和处理参数。
-    
-    如果未指定output_md，则使用默认路径和文件名：./abstract_md/abstract_md_yyyymmdd_hhmmss.md
-    
-    参数:
-        input_articles_file: 包含文章路径列表的输入文件
-        output_md: 输出Markdown文件路径
-        progress_callback: 进度回调函数，用于实时更新进度信息
+    滑动窗口并发引擎：始终保持最多 controller.limit 个请求在途，
+    任一请求完成后立即补位，而不是等待整批结束；并发上限由 controller 按 AIMD 动态调整。
+
+    jobs: [(idx, article_path), ...]，或流式模式下的 asyncio.Queue（元素同上，None 表示结束）
+    on_result: 每完成一篇即调用 on_result(idx, md_text 或 None, 错误信息或 None)
     """
-    # 如果未指定输出文件，则使用默认路径和文件名
-    if output_md is None:
-        # 确保输出目录存在
-        script_dir = Path(__file__).parent
-        output_dir = script_dir / "abstract_md"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # 生成带时间戳的文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_md = str(output_dir / f"abstract_md_{timestamp}.md")
+    prompt = load_prompt()
+    # 流式模式下 jobs 是由生产者持续填充的 asyncio.Queue，以 None 作为结束标记，总数事先未知
+    streaming = isinstance(jobs, asyncio.Queue)
+    if streaming:
+        queue, total = jobs, None
+    else:
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        total = len(jobs)
+    done = 0
+
+    async def worker():
+        nonlocal done
+        while True:
+            if streaming:
+                job = await queue.get()
+                if job is None:
+                    queue.put_nowait(None)  # 让其他工作协程也看到结束标记
+                    return
+                idx, article_path = job
+            else:
+                try:
+                    idx, article_path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+            try:
+                _, md_text, err_msg = await generate_abstract_from_article(
+                    client, model_id, article_path, idx, prompt, limiter, controller, progress_callback, cache,
+                    max_input_tokens, token_stats
+                )
+            except Exception as e:
+                md_text, err_msg = None, str(e)
+            done += 1
+            metrics.count("abstracts.failed" if err_msg else "abstracts.done")
+            if err_msg:
+                report(f"错误: {err_msg}", progress_callback)
+            on_result(idx, md_text, err_msg)
+            if done % PROGRESS_EVERY == 0 or done == total:
+                report(f"进度: {done}/{total or '?'}，并发上限 {controller.limit}，在途 {controller.in_flight}", progress_callback)
+
+    # 工作协程数量按上限创建，实际在途请求数由 controller.slot() 约束
+    workers = [asyncio.create_task(worker()) for _ in range(controller.max_limit if streaming else min(controller.max_limit, total))]
+    await asyncio.gather(*workers)
+
+
+def batch_state_path_for(output_md):
+    return f"{output_md}.batch.json"
+
+
+async def run_batch_abstracts(client, model_id, jobs, on_result, output_md, progress_callback=None, cache=None,
+                              max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, token_stats=None, resume=False):
+    """
+    离线批量推理：把所有待处理文章写成 OpenAI 兼容的批量请求文件（<output_md>.batch_input.jsonl，
+    custom_id 为文章序号），提交后轮询直至完成，再按序号合并结果。缓存命中的文章不进入批量文件。
+    批量任务 ID 记录在 <output_md>.batch.json 中，中断后 --resume 会继续轮询同一任务而不是重新提交。
+
+    返回需要回退为实时调用的 jobs（读取失败、批量中失败、超时未完成）。
+    """
+    prompt = load_prompt()
+    state_path = batch_state_path_for(output_md)
+    input_path = f"{output_md}.batch_input.jsonl"
+    endpoint = os.getenv("ABSTRACT_BATCH_ENDPOINT", batch_inference.DEFAULT_ENDPOINT)
+    poll_seconds = float(os.getenv("ABSTRACT_BATCH_POLL_SECONDS", DEFAULT_BATCH_POLL_SECONDS))
+    timeout_hours = float(os.getenv("ABSTRACT_BATCH_TIMEOUT_HOURS", DEFAULT_BATCH_TIMEOUT_HOURS))
+    leftovers = []
 
-    # 从.env文件加载环境变量
+    if resume and os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        batch_id = state["batch_id"]
+        job_ids = {str(idx) for idx, _ in jobs}
+        pending = {cid: tuple(entry) for cid, entry in state["pending"].items() if cid in job_ids}
+        leftovers = [(idx, path) for idx, path in jobs if str(idx) not in pending]
+        report(f"继续轮询批量任务 {batch_id}（{len(pending)} 篇）", progress_callback)
+    else:
+        pending = {}
+        requests = []
+        for idx, article_path in jobs:
+            try:
+                article_content, _, cache_key, cached = prepare_article(
+                    article_path, idx, prompt, model_id, cache, max_input_tokens, token_stats, progress_callback
+                )
+            except Exception as e:
+                report(f"错误: 无法读取文章文件 {article_path}: {e}", progress_callback)
+                leftovers.append((idx, article_path))
+                continue
+            if cached:
+                metrics.count("abstracts.cache_hits")
+                metrics.count("abstracts.done")
+                on_result(idx, cached, None)
+                continue
+            pending[str(idx)] = (idx, article_path, cache_key)
+            requests.append(batch_inference.batch_request(
+                idx, model_id, build_messages(prompt, article_content), endpoint,
+                max_tokens=ABSTRACT_MAX_TOKENS, temperature=ABSTRACT_TEMPERATURE,
+            ))
+        if not requests:
+            return leftovers
+        batch_inference.write_batch_file(requests, input_path)
+        batch_id = await batch_inference.submit_batch(client, input_path, endpoint)
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch_id, "pending": pending}, f, ensure_ascii=False)
+        report(f"已提交批量任务 {batch_id}，共 {len(requests)} 篇（缓存命中 {len(jobs) - len(requests) - len(leftovers)} 篇）", progress_callback)
+
+    def on_status(batch):
+        counts = batch.request_counts
+        done = f"，完成 {counts.completed}/{counts.total}，失败 {counts.failed}" if counts else ""
+        report(f"批量任务 {batch.id}: {batch.status}{done}", progress_callback)
+
+    batch = await batch_inference.wait_for_batch(client, batch_id, poll_seconds, timeout_hours * 3600, on_status)
+    if batch.status not in batch_inference.TERMINAL_STATUSES:
+        report(f"批量任务等待超过 {timeout_hours:g} 小时，取消并改为实时调用", progress_callback)
+        # 取消后等待任务进入终态，取消前已完成（已计费）的结果在终态对象的输出文件中
+        batch = await batch_inference.cancel_batch(client, batch_id, min(poll_seconds, 10), on_status=on_status)
+    results = await batch_inference.collect_results(client, batch)
+
+    succeeded = 0
+    for cid, (idx, article_path, cache_key) in pending.items():
+        content, err_msg, usage = results.get(cid, (None, "批量结果缺失", None))
+        md_text = clean_abstract_text(content) if content else None
+        if usage:
+            metrics.llm_call("abstracts", model_id, 0.0, prompt_tokens=usage.get("prompt_tokens"),
+                             completion_tokens=usage.get("completion_tokens"), batch=True)
+        if md_text:
+            succeeded += 1
+            metrics.count("abstracts.done")
+            if cache is not None and cache_key:
+                cache.put(cache_key, md_text, model_id)
+            on_result(idx, md_text, None)
+        else:
+            report(f"Article#{idx}: 批量请求失败（{err_msg}），改为实时调用", progress_callback)
+            leftovers.append((idx, article_path))
+
+    for path in (state_path, input_path):
+        if os.path.exists(path):
+            os.remove(path)
+    report(f"批量任务 {batch_id} 结束（{batch.status}）：成功 {succeeded} 篇，{len(leftovers)} 篇回退为实时调用", progress_callback)
+    return sorted(leftovers)
+
+
+def default_output_md():
+    """默认输出路径：./abstract_md/abstract_md_yyyymmdd_hhmmss.md"""
+    output_dir = Path(__file__).parent / "abstract_md"
+    output_dir.mkdir(exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return str(output_dir / f"abstract_md_{timestamp}.md")
+
+
+def setup_client(concurrency=None, max_concurrency=None, progress_callback=None):
+    """
+    从.env文件加载环境变量，创建 AsyncOpenAI 客户端与自适应并发控制器。
+    返回 (client, model_id, controller)。
+    """
     load_dotenv()
-    
+
     api_key = os.getenv("Volcengine_API_KEY")
     model_id = os.getenv("Volcengine_MODEL_ID")
     base_url = os.getenv("Volcengine_BASE_URL")
-    
-    # 固定max_workers为20
-    max_workers = 20
-    batch_size = max_workers
-    
+
+    if concurrency is None:
+        concurrency = int(os.getenv("ABSTRACT_CONCURRENCY", DEFAULT_CONCURRENCY))
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("ABSTRACT_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+    min_concurrency = int(os.getenv("ABSTRACT_MIN_CONCURRENCY", DEFAULT_MIN_CONCURRENCY))
+    controller = AdaptiveConcurrencyController(
+        initial=concurrency, min_limit=min_concurrency, max_limit=max(concurrency, max_concurrency)
+    )
+
     if not api_key:
-        message = "未找到API_KEY环境变量，请检查.env文件！"
-        print(message)
-        if progress_callback:
-            progress_callback(message)
+        report("未找到API_KEY环境变量，请检查.env文件！", progress_callback)
         sys.exit(1)
-        
+
     if not model_id:
-        message = "未找到MODEL_ID环境变量，请检查.env文件！"
-        print(message)
-        if progress_callback:
-            progress_callback(message)
+        report("未找到MODEL_ID环境变量，请检查.env文件！", progress_callback)
         sys.exit(1)
 
     # 初始化客户端
-    client = OpenAI(
+    # 关闭 SDK 内置重试：由本脚本的限流器与自适应并发控制器统一处理 429 / 超时
+    client = AsyncOpenAI(
         base_url=base_url,
         api_key=api_key,
+        max_retries=0,
     )
+    return client, model_id, controller
+
+
+def report_run(cache, token_stats, succeeded, total_articles, start_time, controller, progress_callback=None):
+    """收尾：淘汰缓存并输出缓存、token 与完成情况统计。"""
+    if cache is not None:
+        evicted = cache.evict()
+        report(f"摘要缓存: {cache.stats_line()} evicted={evicted}", progress_callback)
+        cache.close()
+
+    if token_stats["original"]:
+        saved = token_stats["original"] - token_stats["sent"]
+        report(f"输入 token 估算: 原始 {token_stats['original']}，实际发送 {token_stats['sent']}，"
+               f"截断 {token_stats['truncated']} 篇，节省 {saved} ({saved / token_stats['original']:.1%})", progress_callback)
+    report(f"\n全部处理完成，成功处理 {succeeded}/{total_articles} 篇文章，耗时 {time.time() - start_time:.1f}s，最终并发上限 {controller.limit}\n", progress_callback)
+
+
+def main(input_articles_file, output_md=None, progress_callback=None, concurrency=None, use_cache=True, resume=False,
+         max_concurrency=None, max_input_tokens=None, batch=False, use_archive=False):
+    """
+    从input_articles_file文件读取文章路径列表，利用 AsyncOpenAI 并发调用AI生成摘要Markdown文本，
+    按原始顺序增量写入一个output_md文件（纯Markdown）。
+    从环境变量或.env文件读取API Key、model ID和处理参数。
+    
+    如果未指定output_md，则使用默认路径和文件名：./abstract_md/abstract_md_yyyymmdd_hhmmss.md
+    
+    参数:
+        input_articles_file: 包含文章路径列表的输入文件
+        output_md: 输出Markdown文件路径
+        progress_callback: 进度回调函数，用于实时更新进度信息
+        concurrency: 初始并发数，默认读取 ABSTRACT_CONCURRENCY 环境变量，否则为 20
+        max_concurrency: 自适应并发上限，默认读取 ABSTRACT_MAX_CONCURRENCY，否则为 100；等于 concurrency 时即固定并发
+        max_input_tokens: 单篇文章输入 token 上限，默认读取 ABSTRACT_MAX_INPUT_TOKENS，否则为 3000；0 表示不截断
+        use_cache: 是否使用摘要缓存（abstract_md/abstract_cache.sqlite）
+        resume: 是否从检查点日志恢复，仅处理上次未成功的文章
+        batch: 是否先通过批量推理接口离线处理（价格更低、不占实时限额），失败的文章再实时调用
+        use_archive: 是否先按 URL 查询归档（archive.py），往期已生成过摘要的文章直接复用
+    """
+    # 恢复模式下未指定输出文件时，沿用上次针对同一输入列表的输出文件
+    if output_md is None and resume:
+        output_md = find_resumable_output(input_articles_file, str(Path(__file__).parent / "abstract_md"))
+        if output_md:
+            report(f"从检查点恢复：{output_md}", progress_callback)
+        else:
+            report("未找到可恢复的检查点，将从头开始处理。", progress_callback)
+
+    # 如果未指定输出文件，则使用默认路径和文件名
+    if output_md is None:
+        output_md = default_output_md()
+
+    client, model_id, controller = setup_client(concurrency, max_concurrency, progress_callback)
+    if max_input_tokens is None:
+        max_input_tokens = int(os.getenv("ABSTRACT_MAX_INPUT_TOKENS", DEFAULT_MAX_INPUT_TOKENS))
 
     # 读取包含文章路径的文件
     if not os.path.exists(input_articles_file):
-        message = f"输入文件 {input_articles_file} 不存在！"
-        print(message)
-        if progress_callback:
-            progress_callback(message)
+        report(f"输入文件 {input_articles_file} 不存在！", progress_callback)
         sys.exit(1)
 
-    with open(input_articles_file, "r", encoding="utf-8") as f:
-        article_paths = [line.strip() for line in f if line.strip()]
+    # 文章列表文件（每行一个文件路径或 <store>#<id> 引用），或直接传入 articles.sqlite
+    article_paths = read_article_list(input_articles_file)
 
     total_articles = len(article_paths)
-    total_batches = math.ceil(total_articles / batch_size)
-    message = f"\n开始处理，共{total_articles}篇文章，分{total_batches}批进行（每批{batch_size}篇）...\n"
-    print(message)
-    if progress_callback:
-        progress_callback(message)
 
-    # 并行调用 API
-    results = []  # 用于存放 (idx, md_text) 的结果
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for batch in range(total_batches):
-            start_idx = batch * batch_size
-            end_idx = min((batch + 1) * batch_size, total_articles)
-            batch_articles = article_paths[start_idx:end_idx]
-            current_batch_size = len(batch_articles)
-            remaining_batches = total_batches - batch - 1
-            
-            message = f"正在处理第{batch+1}批，共{current_batch_size}篇文章，还剩{remaining_batches}批"
-            print(message)
-            if progress_callback:
-                progress_callback(message)
-            
-            future_to_idx = {}
-            for i, article_path in enumerate(batch_articles):
-                future = executor.submit(
-                    generate_abstract_from_article, 
-                    client, 
-                    model_id, 
-                    article_path, 
-                    start_idx+i, 
-                    progress_callback
-                )
-                future_to_idx[future] = start_idx+i
+    # 并发调用 API，结果到达即写入检查点日志，并按顺序写入输出文件
+    try:
+        writer = OrderedMarkdownWriter(output_md, total_articles)
+        journal = AbstractJournal(output_md, input_articles_file, total_articles, resume=resume)
+    except Exception as e:
+        report(f"写入文件失败: {e}", progress_callback)
+        return
 
-            for future in as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    (ret_idx, md_text, err_msg) = future.result()
-                    if err_msg:
-                        error_message = f"错误: {err_msg}"
-                        print(error_message)
-                        if progress_callback:
-                            progress_callback(error_message)
-                        continue
-                    results.append((ret_idx, md_text))
-                except Exception as e:
-                    error_message = f"错误: {e}"
-                    print(error_message)
-                    if progress_callback:
-                        progress_callback(error_message)
-
-            batch_complete_message = f"第{batch+1}批处理完成"
-            print(batch_complete_message)
-            if progress_callback:
-                progress_callback(batch_complete_message)
-
-    completion_message = f"\n全部处理完成，成功处理 {len(results)}/{total_articles} 篇文章\n"
-    print(completion_message)
-    if progress_callback:
-        progress_callback(completion_message)
+    # 已在检查点中完成的文章直接写入，只提交缺失的部分
+    for idx in sorted(journal.done):
+        if idx < total_articles:
+            writer.add(idx, journal.done[idx])
+    succeeded = len([idx for idx in journal.done if idx < total_articles])
+    jobs = [(idx, path) for idx, path in enumerate(article_paths) if idx not in journal.done]
+    if journal.done:
+        report(f"检查点中已有 {succeeded} 篇完成，剩余 {len(jobs)} 篇待处理", progress_callback)
+    report(f"\n开始处理，共{total_articles}篇文章，初始并发{controller.limit}（范围 {controller.min_limit}-{controller.max_limit}）...\n", progress_callback)
+
+    def on_result(idx, md_text, err_msg):
+        nonlocal succeeded
+        if md_text:
+            succeeded += 1
+            journal.record(idx, md_text, article_paths[idx])
+        writer.add(idx, md_text)
+
+    if use_archive and jobs:
+        archive = NewsArchive()
+        remaining = []
+        for idx, path in jobs:
+            abstract = archived_abstract(archive, path)
+            if abstract:
+                metrics.count("abstracts.archived")
+                on_result(idx, abstract, None)
+            else:
+                remaining.append((idx, path))
+        archive.close()
+        report(f"归档命中 {len(jobs) - len(remaining)} 篇，剩余 {len(remaining)} 篇待处理", progress_callback)
+        jobs = remaining
 
-    # 按照原先顺序 (idx) 排序并合并所有 Markdown
-    results.sort(key=lambda x: x[0])
-    merged_md = "\n\n".join(r[1] for r in results if r[1])
+    cache = AbstractCache() if use_cache else None
+    token_stats = {"original": 0, "sent": 0, "truncated": 0}
 
-    if not merged_md.strip():
-        empty_message = "未获取到任何有效内容，程序结束。"
-        print(empty_message)
-        if progress_callback:
-            progress_callback(empty_message)
+    async def run_all():
+        remaining, live_stats = jobs, token_stats
+        if batch and jobs:
+            remaining = await run_batch_abstracts(client, model_id, jobs, on_result, output_md, progress_callback, cache,
+                                                  max_input_tokens, token_stats, resume)
+            live_stats = None  # 回退的文章已在批量阶段计入 token 统计
+        if remaining:
+            await run_abstracts(client, model_id, remaining, controller, on_result, limiter_from_env("Volcengine"),
+                                progress_callback, cache, max_input_tokens, live_stats)
+
+    start_time = time.time()
+    try:
+        asyncio.run(run_all())
+    finally:
+        writer.close()
+        # 全部成功后删除检查点；仍有失败时保留，以便 --resume 重试
+        journal.close(remove=succeeded == total_articles)
+        report_run(cache, token_stats, succeeded, total_articles, start_time, controller, progress_callback)
+
+    stale = prune_journals(os.path.dirname(os.path.abspath(output_md)))
+    if stale:
+        report(f"已删除 {len(stale)} 个过期检查点日志：" + "，".join(stale), progress_callback)
+    if succeeded < total_articles:
+        report(f"检查点日志已保留：{journal.path}（可用 --resume 重试失败的文章）", progress_callback)
+
+    if writer.written == 0:
+        os.remove(output_md)
+        report("未获取到任何有效内容，程序结束。", progress_callback)
         return
 
-    # 将合并后的 Markdown 内容写入 .md 文件
+    report(f"已生成Markdown文件：{output_md}", progress_callback)
+    return output_md
+
+
+def main_stream(produce, output_md=None, progress_callback=None, concurrency=None, use_cache=True,
+                max_concurrency=None, max_input_tokens=None, queue_size=None, use_archive=False):
+    """
+    流式模式：文章在产生的同时即提交给摘要协程，无需等待整份文章列表。
+
+    produce(put) 在后台线程中运行（例如从数据库游标逐篇抽取文章），每得到一篇即调用 put(article_path)；
+    队列有界（默认容量为并发上限的 2 倍），摘要跟不上时 put 会阻塞，抽取随之放慢。
+    produce 的返回值作为第二个返回值原样返回。
+    没有检查点日志：中断后重跑时，已完成的摘要由缓存直接命中。
+    use_archive 时，归档中已有摘要的 URL 不进入队列，直接写出往期摘要。
+
+    返回 (output_md 或 None, produce 的返回值)
+    """
+    if output_md is None:
+        output_md = default_output_md()
+    client, model_id, controller = setup_client(concurrency, max_concurrency, progress_callback)
+    if max_input_tokens is None:
+        max_input_tokens = int(os.getenv("ABSTRACT_MAX_INPUT_TOKENS", DEFAULT_MAX_INPUT_TOKENS))
+
+    writer = OrderedMarkdownWriter(output_md, None)
+    archive = NewsArchive() if use_archive else None
+    cache = AbstractCache() if use_cache else None
+    token_stats = {"original": 0, "sent": 0, "truncated": 0}
+    succeeded = 0
+    submitted = 0
+
+    def on_result(idx, md_text, err_msg):
+        nonlocal succeeded
+        if md_text:
+            succeeded += 1
+        writer.add(idx, md_text)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=queue_size or controller.max_limit * 2)
+
+        def put(article_path):
+            nonlocal submitted
+            abstract = archived_abstract(archive, article_path) if archive else None
+            if abstract:
+                metrics.count("abstracts.archived")
+                # on_result 只在事件循环线程中调用，与摘要协程的结果写出不冲突
+                loop.call_soon_threadsafe(on_result, submitted, abstract, None)
+            else:
+                asyncio.run_coroutine_threadsafe(queue.put((submitted, article_path)), loop).result()
+            submitted += 1
+
+        async def feed():
+            try:
+                return await asyncio.to_thread(produce, put)
+            finally:
+                await queue.put(None)  # 结束标记
+
+        feeder = asyncio.create_task(feed())
+        await run_abstracts(client, model_id, queue, controller, on_result, limiter_from_env("Volcengine"),
+                            progress_callback, cache, max_input_tokens, token_stats)
+        return await feeder
+
+    report(f"\n流式处理开始，初始并发{controller.limit}（范围 {controller.min_limit}-{controller.max_limit}）...\n", progress_callback)
+    start_time = time.time()
     try:
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_md)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        with open(output_md, "w", encoding="utf-8") as f:
-            f.write(merged_md)
-        file_message = f"已生成Markdown文件：{output_md}"
-        print(file_message)
-        if progress_callback:
-            progress_callback(file_message)
-        return output_md
-    except Exception as e:
-        error_message = f"写入文件失败: {e}"
-        print(error_message)
-        if progress_callback:
-            progress_callback(error_message)
+        produced = asyncio.run(run())
+    finally:
+        writer.close()
+        if archive:
+            archive.close()
+        report_run(cache, token_stats, succeeded, submitted, start_time, controller, progress_callback)
+
+    if writer.written == 0:
+        os.remove(output_md)
+        report("未获取到任何有效内容。", progress_callback)
+        return None, produced
+
+    report(f"已生成Markdown文件：{output_md}", progress_callback)
+    return output_md, produced
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="并发生成文章摘要 Markdown")
+    parser.add_argument("input_articles_file", help="包含文章路径列表的输入文件 (successful_articles.txt)，或 articles.sqlite 文章库")
+    parser.add_argument("output_md", nargs="?", help="输出 Markdown 文件路径")
+    parser.add_argument("--output-md", dest="output_md_opt", help="输出 Markdown 文件路径（与位置参数等价）")
+    parser.add_argument("--concurrency", "-c", type=int, help=f"初始并发数（默认 ABSTRACT_CONCURRENCY 或 {DEFAULT_CONCURRENCY}）")
+    parser.add_argument("--max-concurrency", type=int, help=f"自适应并发上限（默认 ABSTRACT_MAX_CONCURRENCY 或 {DEFAULT_MAX_CONCURRENCY}）")
+    parser.add_argument("--max-input-tokens", type=int, help=f"单篇文章输入 token 上限（默认 ABSTRACT_MAX_INPUT_TOKENS 或 {DEFAULT_MAX_INPUT_TOKENS}，0 不截断）")
+    parser.add_argument("--no-cache", action="store_true", help="不读写摘要缓存，强制重新调用 API")
+    parser.add_argument("--resume", action="store_true", help="从检查点日志恢复，仅处理上次未成功的文章")
+    parser.add_argument("--batch", action="store_true", help="通过批量推理接口离线生成（批量价格），失败的文章回退为实时调用")
+    parser.add_argument("--archive", action="store_true", help="按 URL 查询归档（archive.py），往期已有摘要的文章不再调用 API")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
     """
     命令行用法示例:
-        python 1b_article_to_abstract_md.py successful_articles.txt [output.md]
+        python 1_article_to_abstract_md.py successful_articles.txt [output.md] [--concurrency 40]
         
     如果不指定输出文件，则使用默认路径和文件名：./abstract_md/abstract_md_yyyymmdd_hhmmss.md
     """
-    if len(sys.argv) < 2:
-        print("用法示例: python 1b_article_to_abstract_md.py successful_articles.txt [output.md]")
-        print("如果不指定输出文件，则使用默认路径和文件名：./abstract_md/abstract_md_yyyymmdd_hhmmss.md")
-        sys.exit(1)
-
-    input_articles_file = sys.argv[1]
-    output_md_path = sys.argv[2] if len(sys.argv) > 2 else None
-    main(input_articles_file, output_md_path) 
\ No newline at end of file
+    args = parse_args()
+    main(args.input_articles_file, args.output_md_opt or args.output_md, concurrency=args.concurrency, max_concurrency=args.max_concurrency,
+         max_input_tokens=args.max_input_tokens, use_cache=not args.no_cache, resume=args.resume, batch=args.batch,
+         use_archive=args.archive)
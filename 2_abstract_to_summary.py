@@ -2,58 +2,252 @@
 # -*- coding: utf-8 -*-
 """
 Generate final summary from abstract Markdown file using Google Gemini API.
+
+Two modes:
+  single     one call over the whole abstract file (original behaviour)
+  mapreduce  abstracts are split into token-budgeted chunks that are pre-classified
+             in parallel (system_prompt/summary_map_prompt.md), then one reduce call
+             with summary_prompt.md runs over the partial results
+  auto       mapreduce once the abstracts exceed SUMMARY_MAPREDUCE_THRESHOLD tokens
+The final summary call is streamed into <deliverable>.partial, which is renamed
+into place only when complete, with time-to-first-output and tokens/sec reported;
+a retry after a partial stream asks the model to continue from where it stopped
+instead of starting over.
 Usage:
-    python 2_abstract_to_summary.py --input-md <ABSTRACT_MD> [--output-md <DELIVERABLE_MD>]
+    python 2_abstract_to_summary.py --input-md <ABSTRACT_MD> [--output-md <DELIVERABLE_MD>] [--mode auto|single|mapreduce]
+                                    [--prompt <file>] [--title "AI News Update"] [--heading "Weekly Summary"]
 """
 import os
 import sys
+import re
 import argparse
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
+import metrics
+from rate_limiter import limiter_from_env
+from token_budget import estimate_tokens
+
 try:
     from openai import OpenAI
 except ImportError:
     print("Please install openai sdk: pip install openai")
     sys.exit(1)
 
+PROMPT_DIR = os.path.join(os.path.dirname(__file__), "system_prompt")
+DEFAULT_CHUNK_TOKENS = 30000
+DEFAULT_MAPREDUCE_THRESHOLD = 60000
+DEFAULT_MAP_WORKERS = 8
+# Seconds between streaming progress lines
+STREAM_PROGRESS_INTERVAL = 5
+CONTINUE_INSTRUCTION = "输出在上一条回复的末尾中断了。请从中断处直接继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。"
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Generate final summary from abstract MD")
     parser.add_argument("--input-md", "-i", required=True, help="Path to abstract markdown file")
     parser.add_argument("--output-md", "-o", help="Path to output deliverable markdown file")
+    parser.add_argument("--mode", choices=["auto", "single", "mapreduce"], default="auto",
+                        help="Summarization mode (default: auto)")
+    parser.add_argument("--chunk-tokens", type=int,
+                        help=f"Token budget per map chunk (default: SUMMARY_CHUNK_TOKENS or {DEFAULT_CHUNK_TOKENS})")
+    parser.add_argument("--map-workers", type=int,
+                        help=f"Parallel map calls (default: SUMMARY_MAP_WORKERS or {DEFAULT_MAP_WORKERS})")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the full completion instead of streaming it")
+    parser.add_argument("--prompt", help="Summary prompt file (default: system_prompt/summary_prompt.md)")
+    parser.add_argument("--title", default="AI News Update", help="Deliverable title and file name prefix (default: AI News Update)")
+    parser.add_argument("--heading", default="Weekly Summary", help="Heading of the summary section (default: Weekly Summary)")
     return parser.parse_args()
 
-def generate_summary(client, model_id, markdown_content):
+def load_prompt(name):
+    with open(os.path.join(PROMPT_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+class SummaryError(Exception):
+    pass
+
+# One client (and HTTP connection pool) per endpoint, reused by every summary made in this process
+_clients = {}
+
+def get_client(api_key, base_url):
+    key = (api_key, base_url)
+    if key not in _clients:
+        _clients[key] = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    return _clients[key]
+
+class StreamProgress:
+    """Receives streamed deltas: forwards them to `sink`, tracks time-to-first-output and tokens/sec."""
+
+    def __init__(self, sink=None, label="summary"):
+        self.sink = sink
+        self.label = label
+        self.start = time.time()
+        self.first_output = None
+        self.tokens = 0
+        self._last_report = self.start
+
+    def __call__(self, delta):
+        now = time.time()
+        if self.first_output is None:
+            self.first_output = now
+            print(f"First output ({self.label}) after {now - self.start:.1f}s")
+        self.tokens += estimate_tokens(delta)
+        if self.sink:
+            self.sink(delta)
+        if now - self._last_report >= STREAM_PROGRESS_INTERVAL:
+            self._last_report = now
+            print(f"  {self.label}: {self.tokens} tokens, {self.rate():.1f} tok/s")
+
+    def rate(self):
+        if self.first_output is None:
+            return 0.0
+        return self.tokens / max(time.time() - self.first_output, 1e-6)
+
+    def summary_line(self):
+        if self.first_output is None:
+            return f"{self.label}: no output received"
+        return (f"{self.label}: time to first output {self.first_output - self.start:.1f}s, "
+                f"{self.tokens} tokens in {time.time() - self.start:.1f}s ({self.rate():.1f} tok/s)")
+
+def call_llm(client, model_id, prompt, markdown_content, limiter, label="summary", on_delta=None):
+    """
+    One chat completion with limiter-aware retries. Raises SummaryError after MAX_RETRIES.
+    With on_delta the completion is streamed and each text delta is passed to it; if the
+    stream breaks, the retry sends the partial answer back and asks the model to continue.
+    Streamed calls ask for usage in the final chunk; token counts are estimated only when none arrives.
+    """
     MAX_RETRIES = 5
     retry_count = 0
-    prompt_path = os.path.join(os.path.dirname(__file__), "system_prompt/summary_prompt.md")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        prompt = f.read()
+    partial = ""
+    estimated_tokens = estimate_tokens(prompt) + estimate_tokens(markdown_content)
+    queue_wait = latency = 0.0
+    stage = "summary.map" if label.startswith("map") else "summary"
     while retry_count < MAX_RETRIES:
         try:
-            completion = client.chat.completions.create(
+            wait_start = call_start = time.monotonic()
+            limiter.acquire(estimated_tokens + estimate_tokens(partial))
+            call_start = time.monotonic()
+            queue_wait += call_start - wait_start
+            messages = [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": markdown_content},
+            ]
+            if partial:
+                messages += [
+                    {"role": "assistant", "content": partial},
+                    {"role": "user", "content": CONTINUE_INSTRUCTION},
+                ]
+            stream_args = {"stream": True, "stream_options": {"include_usage": True}} if on_delta else {}
+            raw_response = client.chat.completions.with_raw_response.create(
                 model=model_id,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": markdown_content},
-                ],
-                temperature=0.5
+                messages=messages,
+                temperature=0.5,
+                **stream_args,
             )
-            return completion.choices[0].message.content
+            limiter.observe_headers(raw_response.headers)
+            if on_delta is None:
+                completion = raw_response.parse()
+                usage = completion.usage
+                if usage is not None:
+                    limiter.settle(estimated_tokens, usage.total_tokens)
+                content = completion.choices[0].message.content
+            else:
+                usage = None
+                for chunk in raw_response.parse():
+                    # With include_usage, usage arrives in a last chunk without choices
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        partial += delta
+                        on_delta(delta)
+                content = partial
+            latency = time.monotonic() - call_start
+            metrics.llm_call(stage, model_id, latency, queue_wait=queue_wait, retries=retry_count,
+                             prompt_tokens=usage.prompt_tokens if usage else estimated_tokens,
+                             completion_tokens=usage.completion_tokens if usage else estimate_tokens(content or ""),
+                             estimated=usage is None)
+            return content
         except Exception as e:
+            latency = time.monotonic() - call_start
             retry_count += 1
-            print(f"Error calling API: {e}, retry {retry_count}/{MAX_RETRIES}")
-            time.sleep(1)
-    print("Max retries reached, exiting.")
-    sys.exit(1)
+            kept = f", continuing after {len(partial)} chars already received" if partial else ""
+            print(f"Error calling API ({label}): {e}, retry {retry_count}/{MAX_RETRIES}{kept}")
+            if retry_count < MAX_RETRIES:
+                time.sleep(limiter.retry_delay(e, retry_count))
+    metrics.llm_call(stage, model_id, latency, queue_wait=queue_wait, retries=retry_count - 1, status="error")
+    raise SummaryError(f"Max retries reached ({label})")
 
-def main():
-    args = parse_args()
-    if not os.path.exists(args.input_md):
-        print(f"Error: input file '{args.input_md}' does not exist.")
+def generate_summary(client, model_id, markdown_content, limiter=None, on_delta=None, prompt=None):
+    if limiter is None:
+        limiter = limiter_from_env("Gemini")
+    try:
+        return call_llm(client, model_id, prompt or load_prompt("summary_prompt.md"), markdown_content, limiter,
+                        on_delta=on_delta)
+    except SummaryError:
+        print("Max retries reached, exiting.")
+        sys.exit(1)
+
+def split_abstracts(markdown_content, max_tokens):
+    """Pack whole abstract entries (each starting with a '#' heading) into chunks of at most max_tokens."""
+    entries = [e.strip() for e in re.split(r"\n(?=#{1,3} )", markdown_content) if e.strip()]
+    chunks, current, current_tokens = [], [], 0
+    for entry in entries:
+        tokens = estimate_tokens(entry)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(entry)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def generate_summary_mapreduce(client, model_id, markdown_content, limiter=None, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                               max_workers=DEFAULT_MAP_WORKERS, on_delta=None, prompt=None):
+    """
+    Map: pre-classify token-budgeted chunks of abstracts in parallel into the five categories.
+    Reduce: run the summary prompt (default summary_prompt.md) over the concatenated partial results (streamed via on_delta).
+    A chunk whose map call fails is passed to the reduce step as raw abstracts.
+    """
+    if limiter is None:
+        limiter = limiter_from_env("Gemini")
+    chunks = split_abstracts(markdown_content, chunk_tokens)
+    if len(chunks) <= 1:
+        return generate_summary(client, model_id, markdown_content, limiter, on_delta, prompt)
+    map_prompt = load_prompt("summary_map_prompt.md")
+    print(f"Map step: {len(chunks)} chunks of <= {chunk_tokens} tokens, {min(max_workers, len(chunks))} in parallel")
+
+    def map_chunk(item):
+        i, chunk = item
+        start = time.time()
+        try:
+            partial = call_llm(client, model_id, map_prompt, chunk, limiter, label=f"map {i + 1}/{len(chunks)}")
+        except SummaryError as e:
+            print(f"{e}; passing chunk {i + 1} to the reduce step unsummarized")
+            return chunk
+        print(f"Map chunk {i + 1}/{len(chunks)} done in {time.time() - start:.1f}s")
+        return partial
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partials = list(executor.map(map_chunk, enumerate(chunks)))
+    reduce_input = "\n\n---\n\n".join(partials)
+    print(f"Reduce step: {estimate_tokens(reduce_input)} tokens (from {estimate_tokens(markdown_content)})")
+    return generate_summary(client, model_id, reduce_input, limiter, on_delta, prompt)
+
+def summarize(input_md, output_md=None, mode="auto", chunk_tokens=None, map_workers=None, stream=True,
+              prompt_file=None, title="AI News Update", heading="Weekly Summary"):
+    """
+    Write the deliverable (summary + abstracts) for an abstract file. Returns the deliverable path.
+    prompt_file replaces system_prompt/summary_prompt.md; title and heading name the deliverable
+    ("<title> YYYY MM DD.md") and its summary section.
+    """
+    if not os.path.exists(input_md):
+        print(f"Error: input file '{input_md}' does not exist.")
         sys.exit(1)
-    with open(args.input_md, "r", encoding="utf-8") as f:
+    with open(input_md, "r", encoding="utf-8") as f:
         abstract_md = f.read()
     load_dotenv()
     api_key = os.getenv("Gemini_API_KEY")
@@ -62,25 +256,63 @@ def main():
     if not api_key or not model_id:
         print("Missing Gemini_API_KEY or Gemini_MODEL_ID in environment.")
         sys.exit(1)
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    print("Generating summary...")
-    summary_text = generate_summary(client, model_id, abstract_md)
-    # Prepare deliverable
+    client = get_client(api_key, base_url)
+    prompt = None
+    if prompt_file:
+        with open(prompt_file, "r", encoding="utf-8") as f:
+            prompt = f.read()
+    chunk_tokens = chunk_tokens or int(os.getenv("SUMMARY_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
+    map_workers = map_workers or int(os.getenv("SUMMARY_MAP_WORKERS", DEFAULT_MAP_WORKERS))
+    threshold = int(os.getenv("SUMMARY_MAPREDUCE_THRESHOLD", DEFAULT_MAPREDUCE_THRESHOLD))
+    if mode == "auto":
+        mode = "mapreduce" if estimate_tokens(abstract_md) > threshold else "single"
+    # Prepare deliverable; the summary section is written as it streams in
     deliverable_dir = os.path.join(os.getcwd(), "deliverable")
     os.makedirs(deliverable_dir, exist_ok=True)
     today = datetime.now().strftime("%Y %m %d")
     display_date = datetime.now().strftime("%Y/%m/%d")
-    filename = f"AI News Update {today}.md"
-    output_path = args.output_md if args.output_md else os.path.join(deliverable_dir, filename)
-    deliverable_content = (
-        f"# AI News Update - {display_date}\n\n"
-        f"## Weekly Summary\n\n{summary_text}\n\n---\n\n"
-        f"## News Abstracts\n\n{abstract_md}"
-    )
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(deliverable_content)
+    filename = f"{title} {today}.md"
+    output_path = output_md if output_md else os.path.join(deliverable_dir, filename)
+    print(f"Generating summary ({mode})...")
+    start = time.time()
+    # Stream into <output>.partial and only move it into place once the deliverable is complete,
+    # so a failed run never leaves a half-written deliverable for the PDF and upload stages
+    partial_path = output_path + ".partial"
+    try:
+        with open(partial_path, "w", encoding="utf-8") as f:
+            f.write(f"# {title} - {display_date}\n\n## {heading}\n\n")
+            f.flush()
+
+            def write_delta(delta):
+                f.write(delta)
+                f.flush()
+
+            progress = StreamProgress(write_delta) if stream else None
+            with metrics.span("summary.generate", mode=mode, input_tokens=estimate_tokens(abstract_md)):
+                if mode == "mapreduce":
+                    summary_text = generate_summary_mapreduce(client, model_id, abstract_md, chunk_tokens=chunk_tokens,
+                                                              max_workers=map_workers, on_delta=progress, prompt=prompt)
+                else:
+                    summary_text = generate_summary(client, model_id, abstract_md, on_delta=progress, prompt=prompt)
+            if progress is None:
+                f.write(summary_text)
+            else:
+                print(progress.summary_line())
+            f.write(f"\n\n---\n\n## News Abstracts\n\n{abstract_md}")
+        os.replace(partial_path, output_path)
+    except BaseException:  # generate_summary exits after the last retry
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    print(f"Summary generated in {time.time() - start:.1f}s")
     print(f"Deliverable saved to {output_path}")
     return output_path
 
+
+def main():
+    args = parse_args()
+    summarize(args.input_md, args.output_md, args.mode, args.chunk_tokens, args.map_workers, stream=not args.no_stream,
+              prompt_file=args.prompt, title=args.title, heading=args.heading)
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
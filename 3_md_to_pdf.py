@@ -1,123 +1,261 @@
 #!/usr/bin/env python3
+"""
+Convert Markdown files to PDF with WeasyPrint.
+
+The stylesheet is compiled once and WeasyPrint's FontConfiguration is reused for
+every file, so fonts are looked up and loaded once per process instead of once
+per document. Set PDF_FONT_LATIN / PDF_FONT_CJK to font files (e.g. calibri.ttf,
+Deng.ttf or NotoSansSC-Regular.otf) to load them directly through @font-face
+instead of resolving 'Calibri' / 'DengXian' through fontconfig. WeasyPrint embeds
+only the glyphs a document uses (font subsetting), so a CJK font adds little to the
+PDF size.
+
+Converted HTML and rendered PDFs are cached per section (the parts between
+`---` page breaks, see render_cache.py). When pypdf is installed, the PDF is
+assembled from the per-section PDFs, so only edited sections are laid out
+again; without it the whole document is rendered from the cached HTML.
+Reference-style links and footnotes only resolve within one conversion, so a
+document whose link or footnote definitions are used in another section is
+converted and rendered as a whole.
+
+Usage:
+    python 3_md_to_pdf.py <markdown_file_or_dir> [more files/dirs ...] [--skip-up-to-date] [--no-cache]
+"""
+import io
 import sys
 import os
-import tempfile
+import time
+import glob
+import argparse
+from html import escape
 import markdown
-import re # Import re module for regex replacement
-from weasyprint import HTML # Import WeasyPrint
+from weasyprint import CSS, HTML, __version__ as WEASYPRINT_VERSION # Import WeasyPrint
+try:
+    from weasyprint.text.fonts import FontConfiguration
+except ImportError:  # WeasyPrint < 53
+    from weasyprint.fonts import FontConfiguration
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+import metrics
+from render_cache import PAGE_BREAK_RE, RenderCache, cross_section_labels, section_key, split_sections
+
+PAGE_BREAK_HTML = '<div style="page-break-after: always;"></div>'
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite']
+
+STYLESHEET = """
+body {
+    font-family: 'Calibri', 'DengXian', sans-serif; /* Use Calibri for English, DengXian for Chinese */
+    line-height: 1.6;
+    margin: 1em;
+    font-size: 14px; /* Base font size */
+}
+h1, h2, h3, h4, h5, h6 {
+    color: #333;
+}
+h1 {
+    font-size: 24px; /* h1 = h2 + 4px */
+    color: #385D4E; /* Custom color for h1 */
+}
+h2 {
+    font-size: 20px; /* h2 = h3 + 6px */
+    color: #385D4E; /* Custom color for h2 */
+}
+h3 {
+    font-size: 16px; /* Base size for h3 */
+}
+code {
+    background-color: #f5f5f5;
+    padding: 2px 4px;
+    border-radius: 4px;
+    font-family: Consolas, monospace; /* Ensure code uses a monospace font */
+}
+pre {
+    background-color: #f5f5f5;
+    padding: 10px;
+    border-radius: 4px;
+    overflow-x: auto;
+    font-family: Consolas, monospace; /* Ensure preformatted text uses a monospace font */
+}
+blockquote {
+    border-left: 4px solid #ddd;
+    padding-left: 1em;
+    color: #777;
+}
+img {
+    max-width: 100%;
+}
+table {
+    border-collapse: collapse;
+    width: 100%;
+}
+table, th, td {
+    border: 1px solid #ddd;
+    padding: 8px;
+}
+"""
+
+
+def font_faces():
+    """@font-face rules binding the body font families to PDF_FONT_LATIN / PDF_FONT_CJK files, if set."""
+    rules = []
+    for env_name, family in (("PDF_FONT_LATIN", "Calibri"), ("PDF_FONT_CJK", "DengXian")):
+        path = os.getenv(env_name)
+        if not path:
+            continue
+        if not os.path.exists(path):
+            print(f"Warning: {env_name} font file '{path}' not found, falling back to system fonts")
+            continue
+        url = "file://" + os.path.abspath(path).replace(os.sep, "/")
+        rules.append(f"@font-face {{ font-family: '{family}'; src: url('{url}'); }}")
+    return "\n".join(rules)
+
+
+def wrap_html(body_html, title):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{escape(title)}</title></head>'
+            f'<body>{body_html}</body></html>')
+
+
+class PdfRenderer:
+    """Holds the compiled stylesheet and font configuration shared by every conversion in this process."""
+
+    def __init__(self, cache=None):
+        self.font_config = FontConfiguration()
+        self.css_text = font_faces() + STYLESHEET
+        self.stylesheet = CSS(string=self.css_text, font_config=self.font_config)
+        self.cache = cache
+
+    def section_html(self, section):
+        key = section_key("html", markdown.__version__, ",".join(MARKDOWN_EXTENSIONS), section)
+        html = self.cache.get_html(key) if self.cache else None
+        if html is None:
+            html = markdown.markdown(section, extensions=MARKDOWN_EXTENSIONS)
+            if self.cache:
+                self.cache.put_html(key, html)
+        return html
+
+    def _write_pdf(self, body_html, title, base_url, target=None):
+        # Use the directory of the markdown file as the base_url to resolve relative paths (e.g., for images)
+        html = HTML(string=wrap_html(body_html, title), base_url=base_url)
+        return html.write_pdf(target, stylesheets=[self.stylesheet], font_config=self.font_config)
+
+    def _write_merged(self, fragments, title, base_url, pdf_file):
+        """One PDF per section (cached), concatenated. Sections start on a new page anyway. Returns sections reused."""
+        writer = PdfWriter()
+        reused = 0
+        for fragment in fragments:
+            if not fragment.strip():
+                continue
+            key = section_key("pdf", WEASYPRINT_VERSION, self.css_text, base_url, fragment)
+            data = self.cache.get_pdf(key)
+            if data is None:
+                data = self._write_pdf(fragment, title, base_url)
+                self.cache.put_pdf(key, data)
+            else:
+                reused += 1
+            writer.append(io.BytesIO(data))
+        writer.add_metadata({"/Title": title})
+        with open(pdf_file, "wb") as f:
+            writer.write(f)
+        return reused
+
+    def render(self, md_file, pdf_file=None):
+        """Render one Markdown file; the PDF goes next to it by default. Returns (pdf_file, seconds, bytes)."""
+        base_name = os.path.splitext(os.path.basename(md_file))[0]
+        output_dir = os.path.dirname(md_file)
+        base_url = os.path.abspath(output_dir or ".")
+        pdf_file = pdf_file or os.path.join(output_dir, f"{base_name}.pdf")
+        start = time.perf_counter()
+        with open(md_file, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        # '---' lines are page breaks; each section between them is converted (and cached) on its own
+        sections = split_sections(md_content)
+        crossing = cross_section_labels(sections)
+        if crossing:
+            # A reference defined in one section and used in another only resolves in a single conversion
+            print(f"Note: link/footnote labels used across page breaks ({', '.join(crossing)}), "
+                  f"rendering '{md_file}' as one document")
+            fragments = [self.section_html(PAGE_BREAK_RE.sub(PAGE_BREAK_HTML, md_content))]
+        else:
+            fragments = [self.section_html(section) for section in sections]
+        with metrics.span("pdf.render", file=os.path.basename(pdf_file), sections=len(fragments)) as attrs:
+            if self.cache and PdfWriter and len(fragments) > 1:
+                attrs["sections_reused"] = self._write_merged(fragments, base_name, base_url, pdf_file)
+            else:
+                self._write_pdf(f"\n{PAGE_BREAK_HTML}\n".join(fragments), base_name, base_url, pdf_file)
+            attrs["bytes"] = os.path.getsize(pdf_file)
+        if self.cache:
+            self.cache.evict()
+        return pdf_file, time.perf_counter() - start, attrs["bytes"]
+
+
+_renderer = None
+
+
+def get_renderer(use_cache=True):
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer(RenderCache() if use_cache else None)
+    return _renderer
+
 
 def md_to_pdf(md_file):
     # Check if input file exists
     if not os.path.exists(md_file):
         print(f"Error: File '{md_file}' not found.")
         return False
-    
-    # Get the base name without extension for output file
-    base_name_with_ext = os.path.basename(md_file) # Get filename with extension
-    base_name = os.path.splitext(base_name_with_ext)[0] # Get base name
-    
-    # Define output directory as the same directory where the markdown file resides
-    output_dir = os.path.dirname(md_file) 
-    # Ensure the directory exists (it should, if the input file exists)
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Construct the PDF filename using the base name and place it in the correct output directory
-    pdf_file = os.path.join(output_dir, f"{base_name}.pdf")
-    
     try:
-        # Read markdown content
-        with open(md_file, 'r', encoding='utf-8') as f:
-            md_content = f.read()
-
-        # Replace '---' with a page break element before converting to HTML
-        # Use regex to handle potential whitespace around '---' and ensure it's on its own line
-        md_content_with_breaks = re.sub(r'^---\s*$', r'<div style="page-break-after: always;"></div>', md_content, flags=re.MULTILINE)
-        
-        # Convert potentially modified markdown to HTML
-        html_content = markdown.markdown(md_content_with_breaks, extensions=['extra', 'codehilite'])
-        
-        # Add custom styling
-        styled_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>{os.path.basename(base_name)}</title>
-            <style>
-                body {{
-                    font-family: 'Calibri', 'DengXian', sans-serif; /* Use Calibri for English, DengXian for Chinese */
-                    line-height: 1.6;
-                    margin: 1em;
-                    font-size: 14px; /* Base font size */
-                }}
-                h1, h2, h3, h4, h5, h6 {{
-                    color: #333;
-                }}
-                h1 {{
-                    font-size: 24px; /* h1 = h2 + 4px */
-                    color: #385D4E; /* Custom color for h1 */
-                }}
-                 h2 {{
-                    font-size: 20px; /* h2 = h3 + 6px */
-                    color: #385D4E; /* Custom color for h2 */
-                }}
-                 h3 {{
-                    font-size: 16px; /* Base size for h3 */
-                }}
-                code {{
-                    background-color: #f5f5f5;
-                    padding: 2px 4px;
-                    border-radius: 4px;
-                    font-family: Consolas, monospace; /* Ensure code uses a monospace font */
-                }}
-                pre {{
-                    background-color: #f5f5f5;
-                    padding: 10px;
-                    border-radius: 4px;
-                    overflow-x: auto;
-                    font-family: Consolas, monospace; /* Ensure preformatted text uses a monospace font */
-                }}
-                blockquote {{
-                    border-left: 4px solid #ddd;
-                    padding-left: 1em;
-                    color: #777;
-                }}
-                img {{
-                    max-width: 100%;
-                }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                }}
-                table, th, td {{
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                }}
-            </style>
-        </head>
-        <body>
-            {html_content}
-        </body>
-        </html>
-        """
-        
-        # Convert HTML string to PDF using WeasyPrint
-        # Use the directory of the markdown file as the base_url to resolve relative paths (e.g., for images)
-        html = HTML(string=styled_html, base_url=output_dir)
-        html.write_pdf(pdf_file)
-
-        print(f"Successfully converted '{md_file}' to '{pdf_file}'")
-        return True
-    
+        pdf_file, seconds, size = get_renderer().render(md_file)
     except Exception as e:
         print(f"Error converting file: {e}")
         return False
+    print(f"Successfully converted '{md_file}' to '{pdf_file}' in {seconds:.2f}s ({size / 1024:.0f} KB)")
+    return True
+
+
+def collect_inputs(paths):
+    """Markdown files named on the command line, plus every *.md file in directories named there."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.md"))))
+        else:
+            files.append(path)
+    return files
+
+
+def is_up_to_date(md_file):
+    pdf_file = os.path.splitext(md_file)[0] + ".pdf"
+    return os.path.exists(pdf_file) and os.path.getmtime(pdf_file) >= os.path.getmtime(md_file)
+
+
+def convert_many(paths, skip_up_to_date=False):
+    """Convert all inputs in this process with one renderer. Returns the number of failures."""
+    files = collect_inputs(paths)
+    if skip_up_to_date:
+        skipped = [f for f in files if is_up_to_date(f)]
+        files = [f for f in files if f not in skipped]
+        if skipped:
+            print(f"Skipping {len(skipped)} file(s) whose PDF is newer than the Markdown")
+    start = time.perf_counter()
+    failures = sum(1 for md_file in files if not md_to_pdf(md_file))
+    if len(files) > 1:
+        print(f"Converted {len(files) - failures}/{len(files)} files in {time.perf_counter() - start:.1f}s")
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert Markdown files to PDF")
+    parser.add_argument("inputs", nargs="+", help="Markdown files, or directories whose *.md files are converted")
+    parser.add_argument("--skip-up-to-date", action="store_true",
+                        help="Skip files whose PDF already exists and is newer than the Markdown")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the section render cache")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python 3_md_to_pdf.py <markdown_file>")
-        sys.exit(1)
-    
-    md_file = sys.argv[1]
-    success = md_to_pdf(md_file)
-    sys.exit(0 if success else 1) 
\ No newline at end of file
+    args = parse_args()
+    get_renderer(use_cache=not args.no_cache)
+    sys.exit(1 if convert_many(args.inputs, args.skip_up_to_date) else 0)
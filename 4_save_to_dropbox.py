@@ -1,41 +1,142 @@
+"""
+Upload files to Dropbox (app folder root, overwriting).
+
+Files are uploaded in parallel (DROPBOX_UPLOAD_WORKERS, default 4). A file is
+skipped when its Dropbox content hash matches the remote file's content_hash,
+so re-runs and archive backfills only send what changed. Files above one chunk
+(DROPBOX_CHUNK_MB, default 8) go through an upload session, streamed from disk
+one chunk at a time; every API call is retried with backoff.
+
+Usage:
+    python 4_save_to_dropbox.py <file_or_dir> [more ...] [--workers 4] [--force]
+"""
 import argparse
+import hashlib
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import dropbox
 from dotenv import load_dotenv
 
-def upload_to_dropbox(file_path, dbx):
-    """Uploads a file to Dropbox."""
+import metrics
+
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_CHUNK_MB = 8  # upload session chunks should be a multiple of 4 MB
+UPLOAD_RETRIES = 5
+# Dropbox content hash: sha256 over the concatenated sha256 digests of 4 MB blocks
+CONTENT_HASH_BLOCK = 4 * 1024 * 1024
+
+
+def dropbox_content_hash(file_path):
+    """Local equivalent of the content_hash Dropbox reports in file metadata."""
+    block_hashes = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(CONTENT_HASH_BLOCK), b""):
+            block_hashes.update(hashlib.sha256(block).digest())
+    return block_hashes.hexdigest()
+
+
+def with_retries(call, label, attempts=UPLOAD_RETRIES):
+    """Retry transient failures (network, 5xx, rate limits) with backoff. Endpoint errors (ApiError) are raised at once."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return call()
+        except (dropbox.exceptions.ApiError, dropbox.exceptions.AuthError, dropbox.exceptions.BadInputError):
+            raise
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            backoff = getattr(e, "backoff", None) if isinstance(e, dropbox.exceptions.RateLimitError) else None
+            delay = backoff or min(60, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"{label}: {e}, retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def remote_content_hash(dbx, dropbox_path):
+    """content_hash of the remote file, or None if it doesn't exist (or isn't a file)."""
     try:
-        file_name = os.path.basename(file_path)
-        dropbox_path = f"/{file_name}"
-        with open(file_path, "rb") as f:
-            # Check file size, if > 150MB, use upload_session
-            if os.path.getsize(file_path) > 150 * 1024 * 1024:
-                print(f"File {file_name} is larger than 150MB, using chunked upload.")
-                upload_session_start_result = dbx.files_upload_session_start(f.read(150 * 1024 * 1024))
-                cursor = dropbox.files.UploadSessionCursor(session_id=upload_session_start_result.session_id,
-                                                           offset=f.tell())
-                commit = dropbox.files.CommitInfo(path=dropbox_path, mode=dropbox.files.WriteMode('overwrite'))
-                
-                while f.tell() < os.path.getsize(file_path):
-                    if (os.path.getsize(file_path) - f.tell()) <= 150 * 1024 * 1024:
-                        dbx.files_upload_session_finish(f.read(150 * 1024 * 1024), cursor, commit)
-                    else:
-                        dbx.files_upload_session_append_v2(f.read(150 * 1024 * 1024), cursor)
-                        cursor.offset = f.tell()
-            else:
-                 dbx.files_upload(f.read(), dropbox_path, mode=dropbox.files.WriteMode('overwrite'))
-
-        print(f"Successfully uploaded {file_name} to Dropbox path: {dropbox_path}")
-    except dropbox.exceptions.ApiError as err:
-        print(f"*** Dropbox API error: {err}")
-        return None
-    except Exception as e:
-        print(f"*** Error uploading {file_path}: {e}")
+        metadata = with_retries(lambda: dbx.files_get_metadata(dropbox_path), f"metadata {dropbox_path}")
+    except dropbox.exceptions.ApiError:
         return None
+    return getattr(metadata, "content_hash", None)
 
-def main():
-    """Main function to handle argument parsing and file uploads."""
+
+def _correct_offset(err):
+    """The server's offset from an upload session 'incorrect_offset' error (a retried chunk that had landed), else None."""
+    error = getattr(err, "error", None)
+    if error is not None and hasattr(error, "is_lookup_failed") and error.is_lookup_failed():
+        error = error.get_lookup_failed()
+    if error is not None and hasattr(error, "is_incorrect_offset") and error.is_incorrect_offset():
+        return error.get_incorrect_offset().correct_offset
+    return None
+
+
+def _upload_session(dbx, f, size, dropbox_path, chunk_size, label):
+    """Chunked upload streamed from the open file; at most one chunk is held in memory."""
+    first = f.read(chunk_size)
+    session = with_retries(lambda: dbx.files_upload_session_start(first), label)
+    cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(first))
+    commit = dropbox.files.CommitInfo(path=dropbox_path, mode=dropbox.files.WriteMode('overwrite'))
+    while True:
+        f.seek(cursor.offset)
+        chunk = f.read(chunk_size)
+        try:
+            if cursor.offset + len(chunk) >= size:
+                with_retries(lambda: dbx.files_upload_session_finish(chunk, cursor, commit), label)
+                return
+            with_retries(lambda: dbx.files_upload_session_append_v2(chunk, cursor), label)
+            cursor.offset += len(chunk)
+        except dropbox.exceptions.ApiError as err:
+            offset = _correct_offset(err)
+            if offset is None or offset == cursor.offset:
+                raise
+            cursor.offset = offset
+
+
+def upload_to_dropbox(file_path, dbx, force=False, chunk_size=None):
+    """Uploads a file to Dropbox unless an identical copy is already there. Returns the Dropbox path, or None on failure."""
+    chunk_size = chunk_size or int(float(os.getenv("DROPBOX_CHUNK_MB", DEFAULT_CHUNK_MB)) * 1024 * 1024)
+    file_name = os.path.basename(file_path)
+    dropbox_path = f"/{file_name}"
+    size = os.path.getsize(file_path)
+    with metrics.span("upload", file=file_name, bytes=size) as attrs:
+        try:
+            if not force and remote_content_hash(dbx, dropbox_path) == dropbox_content_hash(file_path):
+                attrs["skipped"] = True
+                metrics.count("upload.skipped")
+                print(f"Skipped {file_name}: unchanged on Dropbox ({dropbox_path})")
+                return dropbox_path
+            with open(file_path, "rb") as f:
+                if size > chunk_size:
+                    print(f"File {file_name} is larger than {chunk_size // (1024 * 1024)}MB, using chunked upload.")
+                    _upload_session(dbx, f, size, dropbox_path, chunk_size, f"upload {file_name}")
+                else:
+                    data = f.read()
+                    with_retries(lambda: dbx.files_upload(data, dropbox_path, mode=dropbox.files.WriteMode('overwrite')),
+                                 f"upload {file_name}")
+            attrs["uploaded"] = True
+            print(f"Successfully uploaded {file_name} to Dropbox path: {dropbox_path}")
+            return dropbox_path
+        except dropbox.exceptions.ApiError as err:
+            attrs["uploaded"] = False
+            print(f"*** Dropbox API error: {err}")
+            return None
+        except Exception as e:
+            attrs["uploaded"] = False
+            print(f"*** Error uploading {file_path}: {e}")
+            return None
+
+
+_connections = {}
+
+
+def connect_dropbox():
+    """
+    Returns a connected Dropbox client, or None if credentials are missing or invalid.
+    The client is kept per process, so later calls (daemon mode, multi-digest runs) reuse its connection.
+    """
     # Load environment variables from .env file
     load_dotenv()
     app_key = os.getenv("DROPBOX_APP_KEY")
@@ -44,30 +145,72 @@ def main():
 
     if not all([app_key, app_secret, refresh_token]):
         print("Error: DROPBOX_APP_KEY, DROPBOX_APP_SECRET, and DROPBOX_REFRESH_TOKEN must be set in the .env file.")
-        return
-
-    # Setup argument parser
-    parser = argparse.ArgumentParser(description="Upload files to Dropbox.")
-    parser.add_argument('files', nargs='+', help='List of files to upload.')
-    args = parser.parse_args()
+        return None
+    key = (app_key, refresh_token)
+    if key in _connections:
+        return _connections[key]
 
     try:
         dbx = dropbox.Dropbox(
             app_key=app_key,
             app_secret=app_secret,
-            oauth2_refresh_token=refresh_token
+            oauth2_refresh_token=refresh_token,
+            # with_retries() handles retries; the SDK's own would multiply its attempts
+            max_retries_on_error=0,
+            max_retries_on_rate_limit=0,
         )
-        dbx.users_get_current_account()
+        with_retries(dbx.users_get_current_account, "Dropbox account")
         print("Successfully connected to Dropbox.")
     except Exception as e:
         print(f"Error connecting to Dropbox: {e}")
-        return
+        return None
+    _connections[key] = dbx
+    return dbx
+
+
+def collect_files(paths):
+    """Files named directly, plus the files directly inside named directories."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if os.path.isfile(os.path.join(path, name))))
+        else:
+            files.append(path)
+    return files
+
 
-    for file_path in args.files:
+def upload_files(file_paths, dbx, workers=None, force=False):
+    """Uploads each existing file, several at a time. Returns True if all of them were uploaded (or unchanged)."""
+    existing = []
+    ok = True
+    for file_path in file_paths:
         if os.path.exists(file_path):
-            upload_to_dropbox(file_path, dbx)
+            existing.append(file_path)
         else:
             print(f"File not found: {file_path}")
+            ok = False
+    if not existing:
+        return ok
+    workers = workers or int(os.getenv("DROPBOX_UPLOAD_WORKERS", DEFAULT_UPLOAD_WORKERS))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(existing)))) as pool:
+        results = list(pool.map(lambda path: upload_to_dropbox(path, dbx, force), existing))
+    return ok and all(result is not None for result in results)
+
+
+def main():
+    """Main function to handle argument parsing and file uploads."""
+    # Setup argument parser
+    parser = argparse.ArgumentParser(description="Upload files to Dropbox.")
+    parser.add_argument('files', nargs='+', help='Files to upload, or directories whose files are uploaded.')
+    parser.add_argument('--workers', type=int, help=f'Parallel uploads (default: DROPBOX_UPLOAD_WORKERS or {DEFAULT_UPLOAD_WORKERS})')
+    parser.add_argument('--force', action='store_true', help='Upload even if the remote file has the same content hash')
+    args = parser.parse_args()
+
+    dbx = connect_dropbox()
+    if dbx is None:
+        return
+    upload_files(collect_files(args.files), dbx, args.workers, args.force)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
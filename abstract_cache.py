@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for article abstracts.
+
+Entries are keyed by a SHA-256 over the article text, the system prompt, the
+model ID and the sampling parameters, so any change to one of them produces a
+miss. The cache is a single SQLite file (default: abstract_md/abstract_cache.sqlite)
+with age- and size-based eviction.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+
+from article_store import BUSY_TIMEOUT
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abstract_md", "abstract_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_AGE_DAYS = 60
+
+
+def make_key(article_content, prompt, model_id, temperature, max_tokens):
+    h = hashlib.sha256()
+    for part in (model_id, str(temperature), str(max_tokens), prompt, article_content):
+        data = (part or "").encode("utf-8")
+        # Length-prefix each part so boundaries can't be shifted between fields
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class AbstractCache:
+    def __init__(self, path=None, max_entries=None, max_age_days=None):
+        self.path = path or os.getenv("ABSTRACT_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("ABSTRACT_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.max_age_days = float(max_age_days if max_age_days is not None else os.getenv("ABSTRACT_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS abstracts ("
+            " key TEXT PRIMARY KEY,"
+            " md_text TEXT NOT NULL,"
+            " model_id TEXT,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_abstracts_accessed ON abstracts(accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT md_text, created_at FROM abstracts WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age_days > 0 and now - row[1] > self.max_age_days * 86400):
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE abstracts SET accessed_at = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, md_text, model_id=None):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO abstracts (key, md_text, model_id, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, md_text, model_id, now, now),
+        )
+        self.conn.commit()
+        self.stores += 1
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones beyond max_entries. Returns rows removed."""
+        removed = 0
+        if self.max_age_days > 0:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += self.conn.execute("DELETE FROM abstracts WHERE created_at < ?", (cutoff,)).rowcount
+        if self.max_entries > 0:
+            removed += self.conn.execute(
+                "DELETE FROM abstracts WHERE key IN ("
+                " SELECT key FROM abstracts ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.conn.commit()
+        return removed
+
+    def stats_line(self):
+        lookups = self.hits + self.misses
+        rate = (self.hits / lookups * 100) if lookups else 0.0
+        return f"cache hits={self.hits} misses={self.misses} stored={self.stores} hit_rate={rate:.1f}%"
+
+    def close(self):
+        self.conn.close()
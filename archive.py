@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent, searchable archive of articles and their abstracts across runs.
+
+One SQLite file (default: archive/news_archive.sqlite, NEWS_ARCHIVE_PATH) keyed
+by normalized URL, holding each article's title, feed, date, cleaned text,
+abstract, category and the deliverable week it went into. Title, text and
+abstract are indexed with FTS5 (trigram tokenizer, so Chinese substrings
+match too); without FTS5 the search falls back to LIKE. Categories are the five
+summary categories, assigned locally from keyword lexicons (no LLM call).
+
+Stage 2 can look abstracts up by URL here (--archive) to skip articles it has
+already abstracted in earlier weeks, and `search --format md` prints matching
+abstracts in the abstract-file layout, ready for 2_abstract_to_summary.py.
+
+Usage:
+    python archive.py index [--articles <list> ...] [--abstracts <md> ...] [--deliverable <md> ...]
+    python archive.py search [keywords ...] [--feed <name>] [--category <name>] [--since YYYY-MM-DD]
+                             [--until YYYY-MM-DD] [--limit 20] [--format text|md|json]
+    python archive.py stats
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+from article_store import BUSY_TIMEOUT, load_record, read_article_list, split_ref
+from dedup_articles import normalize_url, read_article
+
+DEFAULT_ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive", "news_archive.sqlite")
+OTHER_CATEGORY = "Other"
+
+# Category -> term weights, in the order of the summary prompt's five categories
+CATEGORY_KEYWORDS = {
+    "AI Model": {
+        "model": 1, "llm": 2, "gpt": 2, "open-source": 1, "open source": 1, "weights": 1, "benchmark": 1,
+        "pretraining": 2, "pre-training": 2, "reasoning": 1, "multimodal": 1, "fine-tuning": 1, "parameters": 1,
+        "大模型": 2, "模型": 1, "开源": 1, "预训练": 2, "推理模型": 2, "多模态": 1, "参数": 1, "基准": 1,
+    },
+    "AI Application": {
+        "app": 1, "agent": 2, "agents": 2, "copilot": 2, "assistant": 1, "product": 1, "users": 1, "feature": 1,
+        "chatbot": 2, "search": 1, "应用": 2, "智能体": 2, "助手": 1, "产品": 1, "用户": 1, "功能": 1, "上线": 1,
+    },
+    "AI Investment": {
+        "funding": 3, "raises": 3, "raised": 2, "valuation": 3, "acquisition": 3, "acquires": 3, "investment": 2,
+        "investors": 2, "series a": 3, "series b": 3, "ipo": 3, "partnership": 1, "fund": 1,
+        "融资": 3, "估值": 3, "收购": 3, "并购": 3, "投资": 2, "领投": 3, "上市": 2, "基金": 1, "战略合作": 1,
+    },
+    "Cloud Service Provider": {
+        "cloud": 2, "aws": 3, "azure": 3, "google cloud": 3, "data center": 2, "datacenter": 2, "compute": 1,
+        "hosting": 1, "api": 1, "云": 1, "云计算": 3, "阿里云": 3, "腾讯云": 3, "火山引擎": 3, "算力": 2, "数据中心": 2,
+    },
+    "AI Semi": {
+        "chip": 3, "chips": 3, "gpu": 2, "nvidia": 2, "semiconductor": 3, "tsmc": 3, "hbm": 3, "asic": 3,
+        "tpu": 2, "wafer": 3, "芯片": 3, "半导体": 3, "英伟达": 2, "晶圆": 3, "台积电": 3, "昇腾": 2, "存储": 1,
+    },
+}
+_ASCII_TERM = re.compile(r"^[a-z0-9 .\-]+$")
+_HEADING_LINK_RE = re.compile(r"^#{1,3}\s*\[(?P<title>.+?)\]\((?P<url>[^)\s]+)\)")
+_HEADING_RE = re.compile(r"^#{1,3}\s+(?P<title>.+)$", re.MULTILINE)
+_CN_DATE_RE = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日")
+_DELIVERABLE_DATE_RE = re.compile(r"(\d{4})[ _-](\d{2})[ _-](\d{2})")
+
+
+def _compile_categories(categories):
+    compiled = {}
+    for category, keywords in categories.items():
+        patterns = []
+        for term, weight in keywords.items():
+            if _ASCII_TERM.match(term):
+                patterns.append((re.compile(r"(?<![a-z0-9])" + re.escape(term) + r"(?![a-z0-9])"), weight))
+            else:
+                patterns.append((re.compile(re.escape(term)), weight))
+        compiled[category] = patterns
+    return compiled
+
+
+_CATEGORY_PATTERNS = _compile_categories(CATEGORY_KEYWORDS)
+
+
+def classify(title, text):
+    """Best-scoring summary category for an article (title hits count triple), or 'Other' without any hit."""
+    title, text = (title or "").lower(), (text or "").lower()
+    best, best_score = OTHER_CATEGORY, 0
+    for category, patterns in _CATEGORY_PATTERNS.items():
+        score = sum(weight * (3 * len(p.findall(title)) + len(p.findall(text))) for p, weight in patterns)
+        if score > best_score:
+            best, best_score = category, score
+    return best
+
+
+def parse_cn_date(text):
+    """Unix timestamp of the first 'YYYY年MM月DD日' in text, or None."""
+    match = _CN_DATE_RE.search(text or "")
+    if not match:
+        return None
+    try:
+        return int(datetime(*map(int, match.groups())).timestamp())
+    except ValueError:
+        return None
+
+
+def week_of(deliverable_path):
+    """ISO week ('2025-W27') of a deliverable, from the date in its file name, else its modification time."""
+    match = _DELIVERABLE_DATE_RE.search(os.path.basename(deliverable_path))
+    try:
+        day = datetime(*map(int, match.groups())) if match else datetime.fromtimestamp(os.path.getmtime(deliverable_path))
+    except ValueError:
+        day = datetime.fromtimestamp(os.path.getmtime(deliverable_path))
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def article_fields(ref):
+    """dict(link, title, feed, date, text) for an article file path or store reference."""
+    if split_ref(ref):
+        record = load_record(ref)
+        return {key: record[key] for key in ("link", "title", "feed", "date", "text")}
+    link, title, source, body = read_article(ref)
+    # Source line is "<feed name> YYYY年MM月DD日"
+    feed = _CN_DATE_RE.sub("", source).strip()
+    return {"link": link, "title": title, "feed": feed, "date": parse_cn_date(source), "text": body}
+
+
+def parse_abstracts(md_text):
+    """
+    (link, title, source line, abstract markdown) for every '### [title](url)' entry of an abstract file or
+    deliverable. Entries whose heading lost its link come back with link None and the heading text as title.
+    """
+    entries = []
+    for block in re.split(r"\n(?=### )", md_text):
+        block = block.strip()
+        match = _HEADING_LINK_RE.match(block) if block.startswith("### ") else None
+        if match:
+            link, title = match.group("url"), match.group("title")
+        elif block.startswith("### "):
+            link, title = None, _HEADING_RE.match(block).group("title").strip()
+        else:
+            continue
+        lines = [line.strip() for line in block.split("\n")[1:] if line.strip()]
+        entries.append((link, title, lines[0] if lines else "", block))
+    return entries
+
+
+def _fts_query(terms):
+    # Quote each term so FTS5 syntax characters in user input are taken literally
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class NewsArchive:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("NEWS_ARCHIVE_PATH", DEFAULT_ARCHIVE_PATH)
+        archive_dir = os.path.dirname(self.path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " id INTEGER PRIMARY KEY,"
+            " url_key TEXT NOT NULL UNIQUE,"
+            " link TEXT NOT NULL,"
+            " title TEXT,"
+            " feed TEXT,"
+            " date INTEGER,"
+            " text TEXT,"
+            " abstract TEXT,"
+            " category TEXT,"
+            " week TEXT,"
+            " deliverable TEXT,"
+            " archived_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_date ON articles(date)")
+        self.fts = self._create_fts()
+        self.conn.commit()
+
+    def _create_fts(self):
+        """External-content FTS5 index kept in sync by triggers. Returns False if this SQLite has no FTS5."""
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'").fetchone():
+            return True
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE articles_fts USING fts5("
+                    f" title, text, abstract, content='articles', content_rowid='id', tokenize='{tokenizer}')"
+                )
+                break
+            except sqlite3.OperationalError:
+                continue
+        else:
+            print("Warning: SQLite has no FTS5; archive search falls back to LIKE")
+            return False
+        columns, old = "title, text, abstract", "old.title, old.text, old.abstract"
+        self.conn.executescript(f"""
+            CREATE TRIGGER articles_ai AFTER INSERT ON articles BEGIN
+                INSERT INTO articles_fts(rowid, {columns}) VALUES (new.id, new.title, new.text, new.abstract);
+            END;
+            CREATE TRIGGER articles_ad AFTER DELETE ON articles BEGIN
+                INSERT INTO articles_fts(articles_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+            END;
+            CREATE TRIGGER articles_au AFTER UPDATE ON articles BEGIN
+                INSERT INTO articles_fts(articles_fts, rowid, {columns}) VALUES ('delete', old.id, {old});
+                INSERT INTO articles_fts(rowid, {columns}) VALUES (new.id, new.title, new.text, new.abstract);
+            END;
+            INSERT INTO articles_fts(articles_fts) VALUES ('rebuild');
+        """)
+        return True
+
+    def upsert(self, link, title=None, feed=None, date=None, text=None, abstract=None, week=None, deliverable=None):
+        """Insert or update by normalized URL. Fields passed as None keep their stored value."""
+        url_key = normalize_url(link)
+        if not url_key:
+            return
+        category = classify(title, abstract or text) if (abstract or text) else None
+        self.conn.execute(
+            "INSERT INTO articles (url_key, link, title, feed, date, text, abstract, category, week, deliverable, archived_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(url_key) DO UPDATE SET"
+            "  title = COALESCE(excluded.title, title), feed = COALESCE(excluded.feed, feed),"
+            "  date = COALESCE(excluded.date, date), text = COALESCE(excluded.text, text),"
+            "  abstract = COALESCE(excluded.abstract, abstract),"
+            "  category = CASE WHEN excluded.abstract IS NOT NULL OR category IS NULL"
+            "             THEN COALESCE(excluded.category, category) ELSE category END,"
+            "  week = COALESCE(excluded.week, week), deliverable = COALESCE(excluded.deliverable, deliverable)",
+            (url_key, link, title, feed or None, date, text, abstract, category, week, deliverable, time.time()),
+        )
+
+    def attach_by_title(self, title, abstract, week=None, deliverable=None):
+        """Set the abstract of the most recent article with this exact title (for abstracts whose heading has no link)."""
+        row = self.conn.execute("SELECT link FROM articles WHERE title = ? ORDER BY date DESC LIMIT 1", (title,)).fetchone()
+        if row:
+            self.upsert(row[0], title=title, abstract=abstract, week=week, deliverable=deliverable)
+        return row is not None
+
+    def abstract_for(self, link):
+        row = self.conn.execute("SELECT abstract FROM articles WHERE url_key = ? AND abstract IS NOT NULL",
+                                (normalize_url(link),)).fetchone()
+        return row[0] if row else None
+
+    def search(self, keywords=(), feed=None, category=None, since=None, until=None, limit=20):
+        """Rows (dicts) matching all keywords and filters, newest first. since/until are Unix timestamps."""
+        conditions, params = [], []
+        fts_terms = [k for k in keywords if len(k) >= 3] if self.fts else []
+        for keyword in keywords:
+            if keyword in fts_terms:
+                continue
+            # Terms the trigram index can't match (under 3 characters), or no FTS5 at all
+            conditions.append("(a.title LIKE ? OR a.text LIKE ? OR a.abstract LIKE ?)")
+            params += [f"%{keyword}%"] * 3
+        if fts_terms:
+            conditions.append("a.id IN (SELECT rowid FROM articles_fts WHERE articles_fts MATCH ?)")
+            params.append(_fts_query(fts_terms))
+        if feed:
+            conditions.append("a.feed LIKE ?")
+            params.append(f"%{feed}%")
+        if category:
+            conditions.append("a.category = ?")
+            params.append(category)
+        if since is not None:
+            conditions.append("a.date >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("a.date < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.conn.execute(
+            "SELECT a.link, a.title, a.feed, a.date, a.category, a.week, a.abstract FROM articles a"
+            f" {where} ORDER BY a.date DESC LIMIT ?", (*params, limit))
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def stats(self):
+        total, with_abstract, first, last = self.conn.execute(
+            "SELECT COUNT(*), COUNT(abstract), MIN(date), MAX(date) FROM articles").fetchone()
+        categories = dict(self.conn.execute(
+            "SELECT COALESCE(category, '?'), COUNT(*) FROM articles GROUP BY category ORDER BY COUNT(*) DESC"))
+        return {"articles": total, "with_abstract": with_abstract, "first_date": first, "last_date": last,
+                "categories": categories, "fts": self.fts}
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def index_run(archive, articles_lists=(), abstract_files=(), deliverables=()):
+    """Add one or more runs' outputs to the archive. Returns the number of rows written."""
+    written = 0
+    for list_file in articles_lists:
+        for ref in read_article_list(list_file):
+            try:
+                archive.upsert(**article_fields(ref))
+                written += 1
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: skipping {ref}: {e}")
+        archive.commit()
+    for md_file, is_deliverable in [(f, False) for f in abstract_files] + [(f, True) for f in deliverables]:
+        with open(md_file, "r", encoding="utf-8") as f:
+            md_text = f.read()
+        week = week_of(md_file) if is_deliverable else None
+        deliverable = os.path.abspath(md_file) if is_deliverable else None
+        for link, title, source, abstract in parse_abstracts(md_text):
+            if link is None:
+                written += archive.attach_by_title(title, abstract, week, deliverable)
+                continue
+            archive.upsert(link, title=title, feed=_CN_DATE_RE.sub("", source).strip() or None,
+                           date=parse_cn_date(source), abstract=abstract, week=week, deliverable=deliverable)
+            written += 1
+        archive.commit()
+    return written
+
+
+def _date_arg(value):
+    return int(datetime.strptime(value, "%Y-%m-%d").timestamp())
+
+
+def print_results(rows, fmt):
+    if fmt == "json":
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if fmt == "md":
+        # Same layout as an abstract file; articles without an abstract are left out
+        print("\n\n".join(row["abstract"] for row in rows if row["abstract"]))
+        return
+    for row in rows:
+        day = datetime.fromtimestamp(row["date"]).strftime("%Y-%m-%d") if row["date"] else "?"
+        print(f"{day}  [{row['category'] or '?'}]  {row['feed'] or '?'}  {row['title'] or ''}")
+        print(f"            {row['link']}" + (f"  ({row['week']})" if row["week"] else ""))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Searchable archive of articles and abstracts across runs")
+    parser.add_argument("--archive", help=f"Archive file (default: NEWS_ARCHIVE_PATH or {DEFAULT_ARCHIVE_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="Add extracted articles, abstract files and deliverables")
+    index.add_argument("--articles", nargs="+", default=[], help="Article list files or articles.sqlite stores")
+    index.add_argument("--abstracts", nargs="+", default=[], help="Abstract Markdown files (abstract_md/*.md)")
+    index.add_argument("--deliverable", nargs="+", default=[], help="Deliverable Markdown files (sets the week)")
+    search = commands.add_parser("search", help="Query by keyword, feed, category and date range")
+    search.add_argument("keywords", nargs="*", help="All must match title, text or abstract")
+    search.add_argument("--feed", help="Feed name (substring)")
+    search.add_argument("--category", choices=list(CATEGORY_KEYWORDS) + [OTHER_CATEGORY])
+    search.add_argument("--since", type=_date_arg, help="From this date (YYYY-MM-DD)")
+    search.add_argument("--until", type=_date_arg, help="Up to, not including, this date (YYYY-MM-DD)")
+    search.add_argument("--days", type=int, help="Only the last N days (instead of --since)")
+    search.add_argument("--limit", type=int, default=20, help="Maximum results (default: 20)")
+    search.add_argument("--format", choices=["text", "md", "json"], default="text",
+                        help="md prints the abstracts as an abstract file for 2_abstract_to_summary.py")
+    commands.add_parser("stats", help="Archive size, date range and category counts")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archive = NewsArchive(args.archive)
+    if args.command == "index":
+        if not (args.articles or args.abstracts or args.deliverable):
+            print("Nothing to index: pass --articles, --abstracts and/or --deliverable")
+            sys.exit(1)
+        count = index_run(archive, args.articles, args.abstracts, args.deliverable)
+        print(f"Indexed {count} entries into {archive.path}")
+    elif args.command == "search":
+        since = int((datetime.now() - timedelta(days=args.days)).timestamp()) if args.days else args.since
+        print_results(archive.search(args.keywords, args.feed, args.category, since, args.until, args.limit), args.format)
+    else:
+        print(json.dumps(archive.stats(), ensure_ascii=False, indent=2))
+    archive.close()
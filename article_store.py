@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-file article store: one SQLite database per extraction run instead of
+one article_N.txt per entry.
+
+Each row keeps the structured fields (entry id, link, title, feed, date,
+cleaned text) plus a sha256 content hash. Articles in a store are referenced
+as "<store path>#<id>", and these references go into successful_articles.txt
+exactly like file paths, so every list-based step (dedup, relevance filter,
+abstracts) works on either layout through load_article().
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.request import pathname2url
+
+STORE_FILE_NAME = "articles.sqlite"
+STORE_SUFFIX = ".sqlite"
+# Seconds a writer waits for another process's lock (daemon poller vs. a pipeline run) before "database is locked"
+BUSY_TIMEOUT = 30
+# Read-only connections kept open per thread; a long-running daemon makes a new store on every poll
+MAX_OPEN_READERS = 8
+
+_local = threading.local()
+
+
+def format_article(link, title, text, date_val, feed_name):
+    """Article text as laid out in article files: link, title, source line, then body."""
+    try:
+        dt_str = datetime.fromtimestamp(date_val).strftime("%Y年%m月%d日")
+    except Exception:
+        dt_str = str(date_val)
+    return f"{link}\n\n{title}\n\n{feed_name} {dt_str}\n\n{text}"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ArticleStore:
+    """Writable article store; add() returns the reference to list for the new article."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " id INTEGER PRIMARY KEY, entry_id INTEGER, link TEXT NOT NULL, title TEXT NOT NULL,"
+            " feed TEXT NOT NULL, date INTEGER NOT NULL, text TEXT NOT NULL, content_hash TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_articles_hash ON articles(content_hash);"
+        )
+
+    def add(self, article_id, entry_id, link, title, feed_name, date_val, text):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO articles (id, entry_id, link, title, feed, date, text, content_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (article_id, entry_id, link or "", title or "", feed_name, date_val, text, content_hash(text)),
+        )
+        return article_ref(self.path, article_id)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def article_ref(store_path, article_id):
+    return f"{store_path}#{article_id}"
+
+
+def split_ref(ref):
+    """(store_path, id) for a store reference, None for a plain file path."""
+    store_path, sep, article_id = ref.rpartition("#")
+    if sep and store_path.endswith(STORE_SUFFIX) and article_id.isdigit():
+        return store_path, int(article_id)
+    return None
+
+
+def is_store(path):
+    return path.endswith(STORE_SUFFIX)
+
+
+def _reader(store_path):
+    # Read-only connections are cached per thread, so a list of refs costs one open per store;
+    # the least recently used is closed once a thread has more than MAX_OPEN_READERS open
+    readers = getattr(_local, "readers", None)
+    if readers is None:
+        readers = _local.readers = OrderedDict()
+    conn = readers.get(store_path)
+    if conn is not None:
+        readers.move_to_end(store_path)
+        return conn
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"article store not found: {store_path}")
+    uri = f"file:{pathname2url(os.path.abspath(store_path))}?mode=ro"
+    conn = readers[store_path] = sqlite3.connect(uri, uri=True)
+    while len(readers) > MAX_OPEN_READERS:
+        readers.popitem(last=False)[1].close()
+    return conn
+
+
+def load_record(ref):
+    """Structured fields of a store reference: dict with link/title/feed/date/text/content_hash."""
+    store_path, article_id = split_ref(ref)
+    row = _reader(store_path).execute(
+        "SELECT link, title, feed, date, text, content_hash FROM articles WHERE id = ?", (article_id,)
+    ).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"article {article_id} not found in {store_path}")
+    return dict(zip(("link", "title", "feed", "date", "text", "content_hash"), row))
+
+
+def load_article(ref):
+    """Full article text for a file path or a store reference."""
+    if split_ref(ref) is None:
+        with open(ref, "r", encoding="utf-8") as f:
+            return f.read()
+    record = load_record(ref)
+    return format_article(record["link"], record["title"], record["text"], record["date"], record["feed"])
+
+
+def article_exists(ref):
+    parsed = split_ref(ref)
+    return os.path.exists(parsed[0] if parsed else ref)
+
+
+def list_refs(store_path):
+    """References to every article in a store, in insertion (newest-first) order."""
+    return [article_ref(store_path, article_id)
+            for (article_id,) in _reader(store_path).execute("SELECT id FROM articles ORDER BY id")]
+
+
+def read_article_list(list_file):
+    """Article references from a list file, or every article when given a store directly."""
+    if is_store(list_file):
+        return list_refs(list_file)
+    with open(list_file, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline batch inference through an OpenAI-compatible Batch API.
+
+Requests are written one per line to a JSONL batch file (custom_id chosen by the
+caller), uploaded with purpose "batch", and run as a single batch job. Batch jobs
+are billed at the provider's batch discount and do not count against the live
+RPM/TPM limits; results arrive within the completion window. wait_for_batch()
+polls until the job reaches a terminal state, and collect_results() downloads
+the output and error files and maps each custom_id to (content, error, usage).
+
+All functions take an AsyncOpenAI client.
+"""
+import json
+import time
+import asyncio
+
+DEFAULT_ENDPOINT = "/v1/chat/completions"
+DEFAULT_COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# A cancelled batch stays "cancelling" while in-flight requests finish (up to ~10 minutes at OpenAI)
+DEFAULT_CANCEL_TIMEOUT = 900
+
+
+def batch_request(custom_id, model, messages, endpoint=DEFAULT_ENDPOINT, **params):
+    return {
+        "custom_id": str(custom_id),
+        "method": "POST",
+        "url": endpoint,
+        "body": {"model": model, "messages": messages, **params},
+    }
+
+
+def write_batch_file(requests, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return path
+
+
+async def submit_batch(client, path, endpoint=DEFAULT_ENDPOINT, completion_window=DEFAULT_COMPLETION_WINDOW, metadata=None):
+    """Upload the batch file and create the batch job. Returns the batch id."""
+    with open(path, "rb") as f:
+        uploaded = await client.files.create(file=f, purpose="batch")
+    extra = {"metadata": metadata} if metadata else {}
+    batch = await client.batches.create(input_file_id=uploaded.id, endpoint=endpoint,
+                                        completion_window=completion_window, **extra)
+    return batch.id
+
+
+async def wait_for_batch(client, batch_id, poll_interval=60, timeout=None, on_status=None):
+    """
+    Poll until the batch reaches a terminal status, or until `timeout` seconds have passed.
+    on_status(batch) is called whenever the status or completed count changes. Returns the last batch object.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    last = None
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        marker = (batch.status, counts.completed if counts else None, counts.failed if counts else None)
+        if marker != last and on_status:
+            on_status(batch)
+        last = marker
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline and time.monotonic() >= deadline:
+            return batch
+        await asyncio.sleep(poll_interval)
+
+
+async def cancel_batch(client, batch_id, poll_interval=10, timeout=DEFAULT_CANCEL_TIMEOUT, on_status=None):
+    """
+    Cancel the batch and poll until it is final. Returns the final batch object, whose output file holds
+    the requests that completed (and were billed) before the cancel; collect_results() on the batch object
+    from before the cancel would miss them.
+    """
+    await client.batches.cancel(batch_id)
+    return await wait_for_batch(client, batch_id, poll_interval, timeout, on_status)
+
+
+async def _read_file_lines(client, file_id):
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+
+async def collect_results(client, batch):
+    """
+    {custom_id: (content or None, error message or None, usage dict or None)} from the batch's
+    output and error files.
+    """
+    results = {}
+    for line in await _read_file_lines(client, batch.output_file_id) + await _read_file_lines(client, batch.error_file_id):
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        error = line.get("error")
+        if not error and response.get("status_code", 200) == 200 and body.get("choices"):
+            results[custom_id] = (body["choices"][0]["message"]["content"], None, body.get("usage"))
+        else:
+            detail = error or body.get("error")
+            message = detail.get("message") if isinstance(detail, dict) else detail
+            results[custom_id] = (None, message or f"HTTP {response.get('status_code')}", None)
+    return results
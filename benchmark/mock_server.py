@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local mock of an OpenAI-compatible chat-completions endpoint for benchmarks.
+
+POST /v1/chat/completions answers after a log-normal "time to first token"
+plus completion_tokens / tokens-per-second of generation time, streaming the
+output in chunks when `stream` is set. A configurable share of requests get a
+429 with Retry-After. Answers are shaped like the pipeline expects: an abstract
+("### <title>" plus bullets) for article prompts, a short markdown summary otherwise.
+GET /stats returns request counts and latency percentiles; POST /reset clears them.
+
+Usage:
+    python benchmark/mock_server.py [--port 18080] [--latency-median 0.8] [--latency-sigma 0.5]
+                                    [--rate-429 0.02] [--tokens-per-second 80] [--completion-tokens 150]
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import percentile  # noqa: E402
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 overflows at benchmark concurrency; clients then stall on SYN
+    # retries and the pipeline's controller backs off on latency the mock itself caused
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self._clear()
+
+    def _clear(self):
+        self.requests = 0
+        self.rate_limited = 0
+        self.streamed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = []
+        self.max_in_flight = 0
+
+    def reset(self):
+        with self.lock:
+            self._clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "streamed": self.streamed,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "max_in_flight": self.max_in_flight,
+                "latency_p50": round(percentile(self.latencies, 50), 4),
+                "latency_p95": round(percentile(self.latencies, 95), 4),
+                "latency_p99": round(percentile(self.latencies, 99), 4),
+            }
+
+
+def make_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, obj, headers=None):
+            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send_json(200, stats.snapshot())
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.rstrip("/") == "/reset":
+                stats.reset()
+                self._send_json(200, {"ok": True})
+                return
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            start = time.monotonic()
+            with stats.lock:
+                stats.requests += 1
+                stats.in_flight += 1
+                stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            try:
+                self._complete(body, start)
+            finally:
+                with stats.lock:
+                    stats.in_flight -= 1
+
+        def _complete(self, body, start):
+            if random.random() < config.rate_429:
+                with stats.lock:
+                    stats.rate_limited += 1
+                self._send_json(429, {"error": {"message": "Rate limit exceeded (mock)"}},
+                                {"Retry-After": str(config.retry_after)})
+                return
+            messages = body.get("messages", [])
+            user = messages[-1]["content"] if messages else ""
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            completion_tokens = min(body.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+            text = self._answer(user, completion_tokens)
+            time.sleep(random.lognormvariate(math.log(config.latency_median), config.latency_sigma))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if body.get("stream"):
+                self._stream(body, text, completion_tokens, usage)
+            else:
+                time.sleep(completion_tokens / config.tokens_per_second)
+                self._send_json(200, {
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage,
+                }, {"x-ratelimit-remaining-requests": "1000", "x-ratelimit-remaining-tokens": "1000000"})
+            with stats.lock:
+                stats.latencies.append(time.monotonic() - start)
+                stats.prompt_tokens += prompt_tokens
+                stats.completion_tokens += completion_tokens
+
+        def _stream(self, body, text, completion_tokens, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunks = max(1, min(20, completion_tokens // 10))
+            step = math.ceil(len(text) / chunks)
+            for i in range(0, len(text), step):
+                time.sleep(completion_tokens / chunks / config.tokens_per_second)
+                chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]}
+                self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+            final = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+            # Like the OpenAI API: usage only on request, in an extra chunk with no choices
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                               "model": body.get("model"), "choices": [], "usage": usage}
+                self.wfile.write(b"data: " + json.dumps(usage_chunk).encode("utf-8") + b"\n\n")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+            with stats.lock:
+                stats.streamed += 1
+
+        @staticmethod
+        def _answer(user, completion_tokens):
+            parts = user.split("\n\n", 3)
+            if len(parts) >= 3 and parts[0].startswith("http"):
+                title = parts[1].strip()[:80]
+                return f"### {title}\n\n" + "\n".join(f"- Point {i + 1}: mock abstract text." for i in range(3))
+            words = " ".join("summary" for _ in range(max(1, completion_tokens // 2)))
+            return f"### Overview\n\n- {words}\n\n### Trends\n\n- mock trend"
+
+    return Handler
+
+
+def start_server(config, port=0):
+    """Start the mock in a background thread. Returns (server, stats); server.server_address has the bound port."""
+    stats = MockStats()
+    server = MockHTTPServer(("127.0.0.1", port), make_handler(config, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-median", type=float, default=0.8, help="Median time to first token in seconds (default: 0.8)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal sigma of that latency (default: 0.5)")
+    parser.add_argument("--rate-429", type=float, default=0.02, help="Share of requests answered with 429 (default: 0.02)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s (default: 1)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Generation speed (default: 80)")
+    parser.add_argument("--completion-tokens", type=int, default=150, help="Completion tokens per answer (default: 150)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat-completions server")
+    parser.add_argument("--port", type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, _ = start_server(args, args.port)
+    print(f"Mock server listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
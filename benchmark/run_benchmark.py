@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of pipeline stages 0-3 (extract, dedup, abstracts, summary, PDF).
+
+Builds a synthetic FreshRSS DB (synthetic_db.py), starts the mock
+OpenAI-compatible server (mock_server.py) in a subprocess, points both LLM
+stages at it and runs the stages in-process in a scratch directory. The JSON
+report has per-stage wall time, throughput and peak RSS, plus the mock's
+request counts, 429s and latency percentiles for the abstract and summary
+calls and the pipeline's own per-call metrics (metrics.py). With --baseline, stages slower than the baseline by more than
+--tolerance are listed as regressions and the exit status is 1.
+
+No network access or API keys are needed. The PDF stage is skipped when
+WeasyPrint is not installed.
+
+Usage:
+    python benchmark/run_benchmark.py [--entries 2000] [--html medium] [--output report.json]
+                                      [--baseline previous.json] [--tolerance 0.25] [mock server options]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import resource
+import importlib
+import subprocess
+import contextlib
+import urllib.request
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import metrics  # noqa: E402
+import mock_server  # noqa: E402
+import synthetic_db  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args, port):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", str(port),
+           "--latency-median", str(args.latency_median), "--latency-sigma", str(args.latency_sigma),
+           "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after),
+           "--tokens-per-second", str(args.tokens_per_second), "--completion-tokens", str(args.completion_tokens)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            mock_request(port, "/stats")
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock server did not start")
+
+
+def mock_request(port, path, method="GET"):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method=method, data=b"{}" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def count_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def configure_env(args, workdir, db_path, feed_names, port):
+    base_url = f"http://127.0.0.1:{port}/v1"
+    os.environ.update({
+        "DB_PATH": db_path,
+        "ALLOWED_FEED_NAMES": ",".join(feed_names),
+        "WECHAT_CATEGORY_ID": str(synthetic_db.WECHAT_CATEGORY_ID),
+        "WECHAT_URL_PATTERN_CONTAINS": "wechat",
+        "Volcengine_API_KEY": "benchmark", "Volcengine_MODEL_ID": "mock-abstract", "Volcengine_BASE_URL": base_url,
+        "Gemini_API_KEY": "benchmark", "Gemini_MODEL_ID": "mock-summary", "Gemini_BASE_URL": base_url,
+        "Volcengine_RPM": "0", "Volcengine_TPM": "0", "Gemini_RPM": "0", "Gemini_TPM": "0",
+        "ABSTRACT_CONCURRENCY": str(args.concurrency),
+        "ABSTRACT_MAX_CONCURRENCY": str(args.max_concurrency),
+        "ABSTRACT_CACHE_PATH": os.path.join(workdir, "abstract_cache.sqlite"),
+    })
+
+
+def run_stage(report, name, func, log, items=None):
+    """Run one stage with its output sent to the log. items(result) gives the count used for throughput."""
+    print(f"  {name} ...", end="", flush=True)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        result = func()
+    wall = time.perf_counter() - start
+    entry = {"wall_seconds": round(wall, 3), "rss_peak_mb": peak_rss_mb()}
+    if items and result:
+        count = items(result)
+        entry["items"] = count
+        entry["items_per_second"] = round(count / wall, 2) if wall else None
+    report["stages"][name] = entry
+    print(f" {wall:.2f}s")
+    return result
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for name, entry in report["stages"].items():
+        old = baseline.get("stages", {}).get(name, {}).get("wall_seconds")
+        if old and entry.get("wall_seconds") and entry["wall_seconds"] > old * (1 + tolerance):
+            regressions.append(f"{name}: {entry['wall_seconds']:.2f}s vs baseline {old:.2f}s "
+                               f"(+{entry['wall_seconds'] / old - 1:.0%})")
+    return regressions
+
+
+def run_benchmark(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="news_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    extract = importlib.import_module("0_sqlite_to_articles")
+    start_dt, end_dt = extract.window_bounds(args.hours, args.end_hour)
+    db_path = os.path.join(workdir, "freshrss.db")
+    feed_names = synthetic_db.create_db(db_path, args.entries, args.feeds, args.html, args.paragraphs,
+                                        args.duplicate_rate, end=end_dt, hours=args.hours, seed=args.seed)
+    port = free_port()
+    proc = start_mock(args, port)
+    configure_env(args, workdir, db_path, feed_names, port)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "workdir", "keep")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "stages": {},
+        "llm": {},
+    }
+    print(f"Benchmark in {workdir} ({args.entries} entries, {args.html} HTML, mock on port {port})")
+    log_path = os.path.join(workdir, "stages.log")
+    recorder = metrics.start_run()
+    total_start = time.perf_counter()
+    try:
+        with open(log_path, "w", encoding="utf-8") as log:
+            list_file = run_stage(report, "extract", lambda: extract.extract_articles(
+                db_path, args.hours, args.end_hour, cleaner=args.cleaner, workers=args.workers), log, count_lines)
+            if not list_file:
+                raise RuntimeError("extraction produced no articles")
+            deduped = run_stage(report, "dedup", lambda: importlib.import_module("dedup_articles").dedup_article_list(list_file),
+                                log, count_lines)
+            abstracts = importlib.import_module("1_article_to_abstract_md")
+            abstract_md = run_stage(report, "abstracts", lambda: abstracts.main(
+                deduped, os.path.join(workdir, "abstracts.md"), use_cache=False), log,
+                lambda path: sum(1 for line in open(path, encoding="utf-8") if line.startswith("### ")))
+            report["llm"]["abstracts"] = mock_request(port, "/stats")
+            mock_request(port, "/reset", "POST")
+            summary = importlib.import_module("2_abstract_to_summary")
+            summary_md = run_stage(report, "summary", lambda: summary.summarize(
+                abstract_md, os.path.join(workdir, "summary.md"), mode=args.summary_mode), log)
+            report["llm"]["summary"] = mock_request(port, "/stats")
+            try:
+                md_to_pdf = importlib.import_module("3_md_to_pdf").md_to_pdf
+            except (ImportError, OSError) as e:  # OSError: WeasyPrint installed without Pango
+                report["stages"]["pdf"] = {"skipped": str(e)}
+                print(f"  pdf skipped ({e})")
+            else:
+                run_stage(report, "pdf", lambda: md_to_pdf(summary_md), log)
+    finally:
+        os.chdir(cwd)
+        proc.terminate()
+        proc.wait()
+    report["total_wall_seconds"] = round(time.perf_counter() - total_start, 3)
+    # Client-side view of the same calls (queue wait, retries, tokens), from the pipeline's own metrics
+    report["client_llm"], _ = recorder.llm_summary(prices={})
+    report["rss_peak_mb"] = peak_rss_mb()
+    report["log"] = log_path
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+        report["log"] = None
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the news pipeline against a mock LLM server")
+    parser.add_argument("--entries", type=int, default=2000, help="Synthetic entries (default: 2000)")
+    parser.add_argument("--feeds", type=int, default=20, help="Synthetic feeds (default: 20)")
+    parser.add_argument("--html", choices=synthetic_db.HTML_LEVELS, default="medium", help="HTML complexity (default: medium)")
+    parser.add_argument("--paragraphs", type=int, default=8, help="Typical paragraphs per article (default: 8)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of near-duplicates (default: 0.05)")
+    parser.add_argument("--hours", type=int, default=168, help="Extraction window in hours (default: 168)")
+    parser.add_argument("--end-hour", type=int, default=datetime.now().hour,
+                        help="Window end hour (default: the current hour, so the whole DB is in the window)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cleaner", default="auto", help="HTML cleaner backend for extraction (default: auto)")
+    parser.add_argument("--workers", type=int, help="HTML cleaning processes (default: extraction's own choice)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Initial abstract concurrency (default: 20)")
+    parser.add_argument("--max-concurrency", type=int, default=100, help="Abstract concurrency ceiling (default: 100)")
+    parser.add_argument("--summary-mode", choices=["auto", "single", "mapreduce"], default="auto")
+    mock_server.add_arguments(parser)
+    parser.add_argument("--output", help="Write the JSON report here (default: print it)")
+    parser.add_argument("--baseline", help="Earlier report to compare stage wall times against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (default: 0.25)")
+    parser.add_argument("--workdir", help="Scratch directory to use and keep (default: a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary scratch directory")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_benchmark(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Report written to {args.output} (total {report['total_wall_seconds']:.1f}s)")
+    else:
+        print(output)
+    for line in regressions:
+        print(f"Regression: {line}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate a synthetic FreshRSS SQLite database for benchmarking.
+
+Only the parts of the FreshRSS schema the pipeline reads are created: `feed`
+(id, name, url, category) and `entry` (id, id_feed, link, title, content,
+date) with the (id_feed, date) index. Entries are spread evenly over the
+window, mix English and Chinese text, and are wrapped in HTML of selectable
+complexity:
+  simple  plain paragraphs
+  medium  nested divs, links, images, lists
+  heavy   medium plus scripts, styles, nav/footer chrome, tables and inline SVG
+A share of entries are near-duplicates of earlier ones (same story, new URL).
+
+Usage:
+    python benchmark/synthetic_db.py out.db [--entries 2000] [--feeds 20] [--html medium] [--hours 168]
+"""
+import os
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+HTML_LEVELS = ("simple", "medium", "heavy")
+WECHAT_CATEGORY_ID = 5
+
+_EN_WORDS = ("model", "inference", "GPU", "training", "agent", "benchmark", "open-source", "latency", "tokens",
+             "startup", "funding", "chip", "dataset", "reasoning", "release", "partnership", "cloud", "robotics")
+_ZH_WORDS = ("大模型", "推理", "算力", "芯片", "智能体", "开源", "训练", "数据中心", "融资", "发布", "机器人", "多模态")
+
+
+def feed_names(count):
+    return [f"Feed {i + 1}" for i in range(count)]
+
+
+def _sentence(rng):
+    words = [rng.choice(_EN_WORDS) if rng.random() < 0.6 else rng.choice(_ZH_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + f" {rng.randint(1, 999)}%."
+
+
+def _paragraphs(rng, count):
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(2, 5))) for _ in range(count)]
+
+
+def render_html(paragraphs, level, rng):
+    if level == "simple":
+        return "".join(f"<p>{p}</p>" for p in paragraphs)
+    body = []
+    for i, p in enumerate(paragraphs):
+        body.append(f'<div class="section"><div class="inner"><p>{p} <a href="https://example.com/{i}">link</a></p></div></div>')
+        if i % 3 == 0:
+            body.append(f'<img src="https://img.example.com/{rng.randint(1, 10**6)}.png" alt="figure {i}">')
+        if i % 4 == 0:
+            body.append("<ul>" + "".join(f"<li>{rng.choice(_EN_WORDS)} {rng.randint(1, 100)}</li>" for _ in range(4)) + "</ul>")
+    if level == "heavy":
+        chrome = ('<nav>' + "".join(f'<a href="/{w}">{w}</a>' for w in _EN_WORDS) + '</nav>'
+                  '<style>.section{margin:0}.inner{padding:1px}' + ".c{color:#333}" * 50 + '</style>'
+                  '<script>window.dataLayer=[];' + "track('view');" * 100 + '</script>')
+        table = "<table>" + "".join(
+            "<tr>" + "".join(f"<td>{rng.randint(1, 1000)}</td>" for _ in range(6)) + "</tr>" for _ in range(10)
+        ) + "</table>"
+        svg = '<svg width="100" height="100">' + "".join(
+            f'<path d="M{rng.randint(0, 99)} {rng.randint(0, 99)} L{rng.randint(0, 99)} {rng.randint(0, 99)}"/>' for _ in range(200)
+        ) + "</svg>"
+        body = [chrome] + body + [table, svg, "<footer>© Example Media. All rights reserved.</footer>"]
+    return "<html><head><meta charset='utf-8'></head><body>" + "".join(body) + "</body></html>"
+
+
+def create_db(path, entries=2000, feeds=20, html="medium", paragraphs=8, duplicate_rate=0.05, end=None, hours=168, seed=42):
+    """Write the synthetic DB to `path` (replacing it). `end` defaults to now; entries fall in [end - hours, end)."""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE feed (id INTEGER PRIMARY KEY, name TEXT, url TEXT, category INTEGER);"
+        "CREATE TABLE entry (id INTEGER PRIMARY KEY, id_feed INTEGER, link TEXT, title TEXT, content TEXT, date INTEGER);"
+        "CREATE INDEX entry_feed_date_index ON entry(id_feed, date);"
+    )
+    names = feed_names(feeds)
+    conn.executemany("INSERT INTO feed (id, name, url, category) VALUES (?, ?, ?, ?)",
+                     [(i + 1, name, f"https://feeds.example.com/{i + 1}", 1) for i, name in enumerate(names)])
+    # One WeChat-style feed picked up through the category/URL rule instead of by name
+    conn.execute("INSERT INTO feed (id, name, url, category) VALUES (?, ?, ?, ?)",
+                 (feeds + 1, "WeChat Account", "https://wechat.example.com/rss", WECHAT_CATEGORY_ID))
+
+    end_ts = int((end or datetime.now()).timestamp())
+    span = int(timedelta(hours=hours).total_seconds())
+    rows = []
+    for i in range(entries):
+        entry_id = i + 1
+        if rows and rng.random() < duplicate_rate:
+            source = rng.choice(rows)
+            title, content = source[3], source[4].replace("</p>", " (updated)</p>", 1)
+        else:
+            title = f"{_sentence(rng)[:60]} #{entry_id}"
+            content = render_html(_paragraphs(rng, rng.randint(max(1, paragraphs // 2), paragraphs * 2)), html, rng)
+        date_val = end_ts - 1 - int(span * i / max(entries, 1))
+        rows.append((entry_id, rng.randint(1, feeds + 1), f"https://news.example.com/a/{entry_id}", title, content, date_val))
+    conn.executemany("INSERT INTO entry (id, id_feed, link, title, content, date) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return names
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic FreshRSS SQLite database")
+    parser.add_argument("path", help="Output database file")
+    parser.add_argument("--entries", type=int, default=2000, help="Number of entries (default: 2000)")
+    parser.add_argument("--feeds", type=int, default=20, help="Number of named feeds (default: 20)")
+    parser.add_argument("--html", choices=HTML_LEVELS, default="medium", help="HTML complexity (default: medium)")
+    parser.add_argument("--paragraphs", type=int, default=8, help="Typical paragraphs per article (default: 8)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of near-duplicate entries (default: 0.05)")
+    parser.add_argument("--hours", type=int, default=168, help="Window the entry dates are spread over (default: 168)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    names = create_db(args.path, args.entries, args.feeds, args.html, args.paragraphs, args.duplicate_rate,
+                      hours=args.hours, seed=args.seed)
+    print(f"Wrote {args.entries} entries in {len(names)} feeds to {args.path}")
+    print(f"ALLOWED_FEED_NAMES={','.join(names)} WECHAT_CATEGORY_ID={WECHAT_CATEGORY_ID}")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AIMD concurrency controller for LLM calls.
+
+Each API attempt runs inside `async with controller.slot():`. After every
+window of completed attempts the controller looks at p95 latency and the
+error rate: a healthy window raises the limit by one (additive increase),
+overload signals (429, 5xx, timeouts) or p95 inflation cut it
+multiplicatively. The latency baseline is the lowest p95 of the last
+BASELINE_WINDOWS windows, so one unusually fast window only sets it for a
+while instead of for the rest of the run. Decisions are returned as short
+strings so callers can surface them in their progress output.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import percentile
+
+OVERLOAD_STATUS = {408, 429}
+# Windows whose p95 make up the latency baseline, and the successes a window needs to count towards it
+BASELINE_WINDOWS = 10
+MIN_BASELINE_SAMPLES = 5
+TIMEOUT_ERROR_NAMES = {"APITimeoutError", "TimeoutError", "ReadTimeout", "ConnectTimeout", "APIConnectionError"}
+
+
+def is_overload_error(error):
+    """True for errors that mean the provider is saturated: 429/408, 5xx and timeouts."""
+    status = getattr(error, "status_code", None)
+    if status is not None and (status in OVERLOAD_STATUS or status >= 500):
+        return True
+    return type(error).__name__ in TIMEOUT_ERROR_NAMES or isinstance(error, asyncio.TimeoutError)
+
+
+class AdaptiveConcurrencyController:
+    def __init__(self, initial=20, min_limit=1, max_limit=100, window=None,
+                 max_error_rate=0.05, latency_tolerance=2.0, backoff_factor=0.5, latency_backoff_factor=0.75):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.latency_tolerance = latency_tolerance
+        self.backoff_factor = backoff_factor
+        self.latency_backoff_factor = latency_backoff_factor
+        self.in_flight = 0
+        self.baseline_p95 = None
+        self.last_decision = None
+        self._recent_p95 = deque(maxlen=BASELINE_WINDOWS)
+        self._wake_tasks = set()
+        self._latencies = []
+        self._errors = 0
+        self._overloads = 0
+        self._cooldown = 0
+        self._cond = None
+
+    def _condition(self):
+        # Created lazily so the controller can be built outside the running event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    @asynccontextmanager
+    async def slot(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with cond:
+                self.in_flight -= 1
+                cond.notify_all()
+
+    def record(self, latency, error=None):
+        """Record one finished attempt. Returns a decision string when the limit changed, else None."""
+        self._cooldown = max(0, self._cooldown - 1)
+        if error is None:
+            self._latencies.append(latency)
+        else:
+            self._errors += 1
+            if is_overload_error(error):
+                self._overloads += 1
+                # Back off immediately on overload instead of waiting for the window to fill,
+                # but only once per round of requests that were already in flight
+                if not self._cooldown:
+                    return self._decide()
+        if len(self._latencies) + self._errors >= (self.window or self.limit):
+            return self._decide()
+        return None
+
+    def _decide(self):
+        samples = len(self._latencies) + self._errors
+        error_rate = self._errors / samples if samples else 0.0
+        p95 = percentile(self._latencies, 95)
+        old = self.limit
+        if self._overloads:
+            self.limit = max(self.min_limit, int(self.limit * self.backoff_factor))
+            reason = f"overload x{self._overloads}"
+        elif error_rate > self.max_error_rate:
+            self.limit = max(self.min_limit, int(self.limit * self.backoff_factor))
+            reason = f"error rate {error_rate:.0%}"
+        elif self.baseline_p95 and p95 > self.baseline_p95 * self.latency_tolerance:
+            self.limit = max(self.min_limit, int(self.limit * self.latency_backoff_factor))
+            reason = f"p95 {p95:.1f}s > {self.latency_tolerance:g}x baseline {self.baseline_p95:.1f}s"
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+            reason = f"healthy p95 {p95:.1f}s"
+        if len(self._latencies) >= MIN_BASELINE_SAMPLES:
+            self._recent_p95.append(p95)
+            self.baseline_p95 = min(self._recent_p95)
+        self._latencies = []
+        self._errors = 0
+        self._overloads = 0
+        if self.limit < old:
+            self._cooldown = old
+        if self.limit != old:
+            self.last_decision = f"concurrency {old} -> {self.limit} ({reason})"
+            if self._cond is not None:
+                # Keep a reference until the task finishes, or it can be garbage-collected while pending
+                task = asyncio.get_running_loop().create_task(self._wake())
+                self._wake_tasks.add(task)
+                task.add_done_callback(self._wake_tasks.discard)
+            return self.last_decision
+        return None
+
+    async def _wake(self):
+        cond = self._condition()
+        async with cond:
+            cond.notify_all()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Service mode: one long-running process instead of cron starting run.sh for every run.
+
+  watcher    polls the FreshRSS DB (size/mtime of the file and its WAL) every
+             DAEMON_POLL_SECONDS (default 60). When it has changed, new entries are
+             extracted incrementally up to the present (the same watermarks as
+             `pipeline.py --incremental`) and queued to the abstract worker.
+  worker     stage 2 for the life of the process: one event loop, AsyncOpenAI client
+             (and connection pool), rate limiter and concurrency controller. Abstracts
+             go into the abstract cache.
+  scheduler  runs the pipeline in-process (incremental) at each DAEMON_SCHEDULE time,
+             after the worker has caught up. Every article of the window is already
+             abstracted by then, so the abstract stage is all cache hits and the run is
+             mostly summary, PDF and upload; the summary and Dropbox clients and the PDF
+             renderer are kept between runs.
+  HTTP       GET /healthz (JSON status; 503 when degraded) and GET /metrics (Prometheus
+             text: daemon gauges plus the run metrics since the last scheduled run) on
+             127.0.0.1:DAEMON_HTTP_PORT (default 9108).
+
+Schedules are "<mon..sun|daily> HH:MM", comma-separated in DAEMON_SCHEDULE or one per
+--schedule; the default is Friday at --end-hour. Pipeline options (--filter, --store,
+--archive, --digests, --no-upload, ...) apply to the scheduled runs; --filter also
+keeps off-topic articles out of the worker's queue.
+
+Usage:
+    python daemon.py --db <DB_PATH> [--schedule "fri 17:00" ...] [--poll-seconds 60] [--port 9108]
+                     [pipeline options]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import asyncio
+import argparse
+import importlib
+import threading
+import traceback
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+import metrics
+import pipeline
+from abstract_cache import AbstractCache
+from rate_limiter import limiter_from_env
+
+DEFAULT_POLL_SECONDS = 60
+DEFAULT_HTTP_PORT = 9108
+# Longest wait for the worker to finish queued articles before a scheduled run starts anyway
+DEFAULT_DRAIN_TIMEOUT = 1800
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def parse_schedule(spec):
+    """'fri 17:00' (weekly) or 'daily 08:30' -> (weekday index or None, hour, minute)."""
+    parts = spec.strip().lower().split()
+    day = parts[0][:3] if parts else ""
+    if len(parts) != 2 or (parts[0] != "daily" and day not in WEEKDAYS):
+        raise ValueError(f"invalid schedule '{spec}', expected '<mon..sun|daily> HH:MM'")
+    hour, _, minute = parts[1].partition(":")
+    hour, minute = int(hour), int(minute or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"invalid time in schedule '{spec}'")
+    return (None if parts[0] == "daily" else WEEKDAYS.index(day)), hour, minute
+
+
+def next_run(schedules, after):
+    """Earliest scheduled time strictly after `after`."""
+    times = []
+    for weekday, hour, minute in schedules:
+        at = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if weekday is not None:
+            at += timedelta(days=(weekday - at.weekday()) % 7)
+        if at <= after:
+            at += timedelta(days=1 if weekday is None else 7)
+        times.append(at)
+    return min(times)
+
+
+class AbstractWorker:
+    """Stage 2 running for the life of the process on its own event loop thread, fed through a queue."""
+
+    def __init__(self):
+        self.abstracts = importlib.import_module("1_article_to_abstract_md")
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.error = None
+        self.controller = None
+        self._loop = None
+        self._queue = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="abstract-worker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self.error is None
+
+    def _run(self):
+        try:
+            asyncio.run(self._main())
+        except BaseException as e:  # setup_client exits on missing configuration
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Abstract worker stopped: {self.error}")
+            self._ready.set()
+
+    async def _main(self):
+        abstracts = self.abstracts
+        client, model_id, self.controller = abstracts.setup_client()
+        max_input_tokens = int(os.getenv("ABSTRACT_MAX_INPUT_TOKENS", abstracts.DEFAULT_MAX_INPUT_TOKENS))
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        await abstracts.run_abstracts(client, model_id, self._queue, self.controller, self._on_result,
+                                      limiter_from_env("Volcengine"), cache=AbstractCache(),
+                                      max_input_tokens=max_input_tokens)
+
+    def _on_result(self, idx, md_text, err_msg):
+        if md_text:
+            self.done += 1
+        else:
+            self.failed += 1
+
+    def submit(self, article_path):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (self.submitted, article_path))
+        self.submitted += 1
+
+    @property
+    def pending(self):
+        return self.submitted - self.done - self.failed
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    def wait_idle(self, timeout):
+        """Wait until every submitted article has finished. Returns False on timeout."""
+        deadline = time.time() + timeout
+        while self.pending and self.alive and time.time() < deadline:
+            time.sleep(1)
+        return not self.pending
+
+    def stop(self, timeout=30):
+        if self.alive and self._loop:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+            self._thread.join(timeout)
+
+
+class Daemon:
+    def __init__(self, args, schedules):
+        self.args = args
+        self.schedules = schedules
+        self.extract = importlib.import_module("0_sqlite_to_articles")
+        self.worker = AbstractWorker()
+        self.stopping = threading.Event()
+        self.started = time.time()
+        self.state = "starting"
+        self.polls = 0
+        self.poll_errors = 0
+        self.last_poll = None
+        self.last_poll_error = None
+        self.last_new_articles = 0
+        self.last_signature = None
+        self.last_run = None
+        self.next_run = None
+        self.score_article = self.threshold = None
+        if args.filter:
+            relevance = importlib.import_module("relevance_filter")
+            self.score_article, self.threshold = relevance.load_scorer(), relevance.default_threshold()
+
+    def poll(self):
+        """Extract and queue entries added since the last poll. Returns the number queued."""
+        signature = pipeline.db_signature(self.args.db)
+        if signature == self.last_signature:
+            return 0
+        self.state = "polling"
+        queued = 0
+
+        def on_article(path, link, title, text):
+            nonlocal queued
+            if self.score_article and self.score_article(title, text) < self.threshold:
+                metrics.count("daemon.filtered")
+                return
+            self.worker.submit(path)
+            queued += 1
+
+        try:
+            with metrics.span("daemon.poll") as attrs:
+                list_file = self.extract.extract_articles(
+                    self.args.db, self.args.hours, self.args.end_hour, incremental=True, store=self.args.store,
+                    on_article=on_article, end_dt=datetime.now())
+                attrs["queued"] = queued
+        except (Exception, SystemExit) as e:
+            self.poll_errors += 1
+            self.last_poll_error = f"{type(e).__name__}: {e}"
+            print(f"Poll failed: {self.last_poll_error}")
+            return queued
+        finally:
+            self.polls += 1
+            self.last_poll = time.time()
+            self.state = "idle"
+        self.last_signature = signature
+        self.last_poll_error = None
+        self.last_new_articles = queued
+        new_list = os.path.join(os.path.dirname(list_file), "new_articles.txt") if list_file else None
+        if new_list and os.path.exists(new_list) and os.path.getsize(new_list) == 0:
+            # Nothing new: drop the directory instead of keeping one per DB change
+            shutil.rmtree(os.path.dirname(list_file), ignore_errors=True)
+        if queued:
+            print(f"Queued {queued} new articles ({self.worker.pending} pending)")
+        return queued
+
+    def run_scheduled(self):
+        self.state = "scheduled run"
+        print(f"\n=== scheduled run {datetime.now():%Y-%m-%d %H:%M} ===")
+        if not self.worker.wait_idle(float(os.getenv("DAEMON_DRAIN_TIMEOUT", DEFAULT_DRAIN_TIMEOUT))):
+            print(f"Abstract worker still has {self.worker.pending} articles pending; the run abstracts them itself")
+        # Keep what the watcher recorded since the last run; the pipeline starts its own recorder
+        recorder = metrics.current()
+        recorder.write_json(os.path.join(self.args.report_dir, f"watch_{recorder.run_id}.json"), "watch")
+        try:
+            success = pipeline.run_pipeline(self.args)
+        except Exception:
+            traceback.print_exc()
+            success = False
+        self.last_run = {"finished": time.time(), "success": success}
+        metrics.start_run()
+        self.state = "idle"
+
+    def serve(self):
+        self.next_run = next_run(self.schedules, datetime.now())
+        print(f"Next scheduled run: {self.next_run:%Y-%m-%d %H:%M}")
+        self.state = "idle"
+        while not self.stopping.is_set():
+            if datetime.now() >= self.next_run:
+                self.run_scheduled()
+                self.next_run = next_run(self.schedules, datetime.now())
+                print(f"Next scheduled run: {self.next_run:%Y-%m-%d %H:%M}")
+            else:
+                self.poll()
+            wait = (self.next_run - datetime.now()).total_seconds()
+            self.stopping.wait(max(0.0, min(self.args.poll_seconds, wait)))
+
+    def health(self):
+        degraded = not self.worker.alive or self.last_poll_error is not None
+        last_run = None
+        if self.last_run:
+            last_run = {"finished": _iso(self.last_run["finished"]), "success": self.last_run["success"]}
+        return {
+            "status": "degraded" if degraded else "ok",
+            "state": self.state,
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "worker": {"alive": self.worker.alive, "error": self.worker.error,
+                       "concurrency": self.worker.controller.limit if self.worker.controller else None,
+                       "submitted": self.worker.submitted, "done": self.worker.done,
+                       "failed": self.worker.failed, "pending": self.worker.pending},
+            "last_poll": _iso(self.last_poll),
+            "last_poll_error": self.last_poll_error,
+            "last_poll_new_articles": self.last_new_articles,
+            "polls": self.polls,
+            "last_run": last_run,
+            "next_run": self.next_run.isoformat(timespec="seconds") if self.next_run else None,
+        }
+
+    def prometheus_text(self):
+        worker = self.worker
+        lines = []
+        for name, help_text, value in (
+            ("daemon_up", "1 while the daemon's abstract worker is running.", 1 if worker.alive else 0),
+            ("daemon_uptime_seconds", "Seconds since the daemon started.", round(time.time() - self.started, 1)),
+            ("daemon_articles_submitted", "Articles queued to the abstract worker.", worker.submitted),
+            ("daemon_abstracts_done", "Abstracts completed by the worker.", worker.done),
+            ("daemon_abstracts_failed", "Articles the worker failed to abstract.", worker.failed),
+            ("daemon_queue_pending", "Articles queued and not yet finished.", worker.pending),
+            ("daemon_polls", "DB polls since the daemon started.", self.polls),
+            ("daemon_poll_errors", "Failed DB polls since the daemon started.", self.poll_errors),
+            ("daemon_last_poll_timestamp_seconds", "Unix time of the last DB poll.", round(self.last_poll or 0, 3)),
+            ("daemon_next_run_timestamp_seconds", "Unix time of the next scheduled run.",
+             round(self.next_run.timestamp(), 3) if self.next_run else 0),
+        ):
+            lines.extend(metrics.gauge_lines(name, help_text, [({}, value)]))
+        if self.last_run:
+            lines.extend(metrics.gauge_lines("daemon_last_run_success", "1 if the last scheduled run completed.",
+                                             [({}, 1 if self.last_run["success"] else 0)]))
+            lines.extend(metrics.gauge_lines("daemon_last_run_timestamp_seconds",
+                                             "Unix time the last scheduled run finished.",
+                                             [({}, round(self.last_run["finished"], 3))]))
+        return "\n".join(lines) + "\n" + metrics.current().prometheus_text(run_gauges=False)
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp else None
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/healthz"):
+            health = service.health()
+            code = 200 if health["status"] == "ok" else 503
+            body, content_type = json.dumps(health, ensure_ascii=False, indent=2) + "\n", "application/json"
+        elif path == "/metrics":
+            code, body, content_type = 200, service.prometheus_text(), "text/plain; version=0.0.4"
+        else:
+            code, body, content_type = 404, "not found\n", "text/plain"
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http(service, host, port):
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, name="http", daemon=True).start()
+    print(f"Health and metrics on http://{host}:{port}/healthz and /metrics")
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the AI news pipeline as a long-running service")
+    pipeline.add_arguments(parser)
+    parser.add_argument("--schedule", action="append",
+                        help="When to run the pipeline, '<mon..sun|daily> HH:MM'; repeatable "
+                             "(default: DAEMON_SCHEDULE, or Friday at --end-hour)")
+    parser.add_argument("--poll-seconds", type=float,
+                        help=f"Seconds between DB polls (default: DAEMON_POLL_SECONDS or {DEFAULT_POLL_SECONDS})")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the health/metrics endpoint (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int,
+                        help=f"Port of the health/metrics endpoint, 0 to disable (default: DAEMON_HTTP_PORT or {DEFAULT_HTTP_PORT})")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    args.db = args.db or os.getenv("DB_PATH")
+    args.prometheus_textfile = args.prometheus_textfile or os.getenv("PROMETHEUS_TEXTFILE")
+    args.poll_seconds = args.poll_seconds or float(os.getenv("DAEMON_POLL_SECONDS", DEFAULT_POLL_SECONDS))
+    args.port = args.port if args.port is not None else int(os.getenv("DAEMON_HTTP_PORT", DEFAULT_HTTP_PORT))
+    if not args.db:
+        print("Error: --db <DB_PATH> is required (or set DB_PATH in .env).")
+        sys.exit(1)
+    if args.stream or args.resume:
+        print("Error: --stream and --resume are not used in daemon mode.")
+        sys.exit(1)
+    # The watcher keeps the extraction watermarks current, so scheduled runs only extract what is left
+    args.incremental = True
+    specs = args.schedule or [s for s in os.getenv("DAEMON_SCHEDULE", "").split(",") if s.strip()]
+    try:
+        schedules = [parse_schedule(spec) for spec in specs or [f"fri {args.end_hour:02d}:00"]]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    service = Daemon(args, schedules)
+    if not service.worker.start():
+        sys.exit(1)
+    server = start_http(service, args.host, args.port) if args.port else None
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: service.stopping.set())
+    try:
+        service.serve()
+    finally:
+        print("Shutting down...")
+        service.worker.stop()
+        if server:
+            server.shutdown()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Collapse duplicate and near-duplicate articles before abstract generation.
+
+Two passes over the article files written by 0_sqlite_to_articles.py:
+  1. exact: normalized URL (no scheme/www/tracking params/fragment) or normalized title
+  2. near-duplicate: one-permutation MinHash over character 5-grams of the cleaned
+     text, with LSH banding to find candidates in roughly linear time
+Each cluster keeps one representative (the longest body); the others are
+recorded in duplicate_clusters.json next to the input list.
+
+Usage:
+    python dedup_articles.py <successful_articles.txt> [--threshold 0.8]
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import time
+import argparse
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from article_store import load_article, read_article_list
+
+SHINGLE_SIZE = 5
+NUM_BINS = 64
+BANDS = 16
+# Only the start of very long articles is fingerprinted; syndicated copies share their lead
+MAX_FINGERPRINT_CHARS = 2000
+DEFAULT_THRESHOLD = 0.8
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|spm|from|scene|chksm|sessionid|share_token|ref|src|isappinstalled|clicktime|enterid)$", re.I)
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_EMPTY = 1 << 32
+
+
+def normalize_url(url):
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k)]
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{urlencode(sorted(query))}" if query else "")
+
+
+def normalize_text(text):
+    return _NON_WORD.sub("", (text or "").lower())
+
+
+def read_article(path):
+    """Split an article (file path or store reference) into (link, title, source line, body) as laid out by 0_sqlite_to_articles.py."""
+    parts = load_article(path).split("\n\n", 3)
+    parts += [""] * (4 - len(parts))
+    return parts[0].strip(), parts[1].strip(), parts[2].strip(), parts[3]
+
+
+def minhash_signature(text):
+    """One-permutation MinHash: each shingle hash lands in one of NUM_BINS bins, keep the minimum per bin."""
+    text = normalize_text(text)[:MAX_FINGERPRINT_CHARS]
+    sig = [_EMPTY] * NUM_BINS
+    if len(text) < SHINGLE_SIZE:
+        return sig
+    # Fixed-width encoding so shingles are plain byte slices (no per-shingle encode)
+    data = text.encode("utf-32-le")
+    width = 4 * SHINGLE_SIZE
+    for shingle in {data[i:i + width] for i in range(0, len(data) - width + 4, 4)}:
+        h = zlib.crc32(shingle)
+        b = h % NUM_BINS
+        if h < sig[b]:
+            sig[b] = h
+    return sig
+
+
+def signature_similarity(a, b):
+    """Estimated Jaccard similarity: share of bins (non-empty in either) holding the same minimum."""
+    total = NUM_BINS - sum(1 for x, y in zip(a, b) if x == y == _EMPTY)
+    same = sum(1 for x, y in zip(a, b) if x == y != _EMPTY)
+    return same / total if total else 0.0
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def cluster_articles(articles, threshold=DEFAULT_THRESHOLD):
+    """
+    articles: list of dicts with link/title/body keys.
+    Returns a list of clusters (lists of indices), each in input order.
+    """
+    n = len(articles)
+    uf = _UnionFind(n)
+
+    # Pass 1: exact URL / title matches
+    seen = {}
+    for i, art in enumerate(articles):
+        for key in (("url", normalize_url(art["link"])), ("title", normalize_text(art["title"]))):
+            if not key[1]:
+                continue
+            if key in seen:
+                uf.union(seen[key], i)
+            else:
+                seen[key] = i
+
+    # Pass 2: MinHash LSH candidates, verified against the similarity threshold
+    rows = NUM_BINS // BANDS
+    signatures = [minhash_signature(art["body"]) for art in articles]
+    buckets = {}
+    for i, sig in enumerate(signatures):
+        if sig.count(_EMPTY) == NUM_BINS:
+            continue
+        checked = set()
+        for band in range(BANDS):
+            key = (band, tuple(sig[band * rows:(band + 1) * rows]))
+            if all(v == _EMPTY for v in key[1]):
+                continue
+            for j in buckets.setdefault(key, []):
+                if j in checked:
+                    continue
+                checked.add(j)
+                if uf.find(i) != uf.find(j) and signature_similarity(sig, signatures[j]) >= threshold:
+                    uf.union(i, j)
+            buckets[key].append(i)
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(uf.find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda members: members[0])
+
+
+class StreamingDeduplicator:
+    """
+    Online variant for streaming runs: each article is checked against the ones kept so far, by the
+    same exact keys and MinHash LSH bands as cluster_articles(). The first copy seen is kept.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.kept = []
+        self.clusters = {}
+        self._keys = {}
+        self._buckets = {}
+        self._signatures = []
+
+    def add(self, path, link, title, body):
+        """Returns True if the article is new (and keeps it), False if it duplicates a kept article."""
+        keys = [key for key in (("url", normalize_url(link)), ("title", normalize_text(title))) if key[1]]
+        match = next((self._keys[key] for key in keys if key in self._keys), None)
+        sig = minhash_signature(body)
+        rows = NUM_BINS // BANDS
+        bands = []
+        if sig.count(_EMPTY) < NUM_BINS:
+            for band in range(BANDS):
+                key = (band, tuple(sig[band * rows:(band + 1) * rows]))
+                if not all(v == _EMPTY for v in key[1]):
+                    bands.append(key)
+        if match is None:
+            for key in bands:
+                for j in self._buckets.get(key, ()):
+                    if signature_similarity(sig, self._signatures[j]) >= self.threshold:
+                        match = j
+                        break
+                if match is not None:
+                    break
+        if match is not None:
+            self.clusters.setdefault(match, []).append({"path": path, "link": link, "title": title})
+            return False
+        i = len(self.kept)
+        self.kept.append({"path": path, "title": title})
+        self._signatures.append(sig)
+        for key in keys:
+            self._keys[key] = i
+        for key in bands:
+            self._buckets.setdefault(key, []).append(i)
+        return True
+
+    def write(self, output_list, clusters_file):
+        with open(output_list, "w", encoding="utf-8") as f:
+            for entry in self.kept:
+                f.write(entry["path"] + "\n")
+        report = [{"representative": self.kept[i]["path"], "title": self.kept[i]["title"], "members": members}
+                  for i, members in sorted(self.clusters.items())]
+        with open(clusters_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        removed = sum(len(members) for members in self.clusters.values())
+        print(f"Streaming dedup: kept {len(self.kept)}, dropped {removed} duplicates. List file: {output_list}")
+        return output_list
+
+
+def dedup_article_list(list_file, threshold=DEFAULT_THRESHOLD, output_list=None, clusters_file=None):
+    """
+    Read an article list, write the deduplicated list and the cluster report.
+    Returns the path of the deduplicated list.
+    """
+    base_dir = os.path.dirname(list_file)
+    output_list = output_list or os.path.join(base_dir, "deduped_articles.txt")
+    clusters_file = clusters_file or os.path.join(base_dir, "duplicate_clusters.json")
+
+    start = time.time()
+    paths = read_article_list(list_file)
+
+    articles = []
+    for path in paths:
+        try:
+            link, title, source, body = read_article(path)
+        except OSError as e:
+            print(f"Skipping unreadable article {path}: {e}")
+            continue
+        articles.append({"path": path, "link": link, "title": title, "source": source, "body": body})
+
+    clusters = cluster_articles(articles, threshold)
+
+    kept = []
+    report = []
+    for members in clusters:
+        # Keep the most complete copy; ties go to the earliest (newest-first order from stage 1)
+        rep = max(members, key=lambda i: (len(articles[i]["body"]), -i))
+        kept.append(rep)
+        if len(members) > 1:
+            report.append({
+                "representative": articles[rep]["path"],
+                "title": articles[rep]["title"],
+                "members": [
+                    {k: articles[i][k] for k in ("path", "link", "title", "source")}
+                    for i in members if i != rep
+                ],
+            })
+    kept.sort()
+
+    with open(output_list, "w", encoding="utf-8") as f:
+        for i in kept:
+            f.write(articles[i]["path"] + "\n")
+    with open(clusters_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    removed = len(articles) - len(kept)
+    print(f"Deduplicated {len(articles)} articles -> {len(kept)} ({removed} duplicates in {len(report)} clusters) "
+          f"in {time.time() - start:.2f}s. List file: {output_list}")
+    return output_list
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remove duplicate and near-duplicate articles from an article list")
+    parser.add_argument("list_file", help="Article list (or articles.sqlite store) produced by 0_sqlite_to_articles.py")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Estimated Jaccard similarity above which two articles are duplicates (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--output", help="Path for the deduplicated list (default: deduped_articles.txt next to the input)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not os.path.exists(args.list_file):
+        print(f"Error: list file '{args.list_file}' not found.")
+        sys.exit(1)
+    dedup_article_list(args.list_file, args.threshold, args.output)
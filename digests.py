@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Digest definitions for multi-digest runs (pipeline.py --digests).
+
+A digests file is a JSON list; each entry describes one deliverable:
+    name     short identifier, used in file and stage names (required)
+    title    deliverable title and file name prefix (default: "AI News Update")
+    heading  heading of the summary section (default: "Weekly Summary")
+    hours    window length, ending at the run's --end-hour (default: 168)
+    feeds    feed names to include (default: every extracted article)
+    prompt   summary prompt, a file in system_prompt/ or a path (default: summary_prompt.md)
+
+The pipeline extracts the union of all windows and feeds once and abstracts it
+once; select_articles() then picks each digest's articles from that shared
+list by feed and publication time, and only the summary and PDF are made per
+digest. Dedup runs over the shared list, so the copy it kept of a story may
+come from a feed (or fall outside the window) of another digest; such a digest
+gets its own copy from the duplicate cluster instead, which is abstracted
+separately.
+
+Usage:
+    python digests.py <digests.json> <articles_list.txt> [--end-hour 17]
+"""
+import os
+import sys
+import json
+import argparse
+import importlib
+from datetime import timedelta
+
+from archive import article_fields
+from article_store import read_article_list, split_ref
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompt")
+DEFAULT_TITLE = "AI News Update"
+DEFAULT_HEADING = "Weekly Summary"
+DEFAULT_HOURS = 168
+DEFAULT_PROMPT = "summary_prompt.md"
+DIGEST_KEYS = {"name", "title", "heading", "hours", "feeds", "prompt"}
+
+
+class DigestError(Exception):
+    pass
+
+
+def prompt_path(prompt):
+    return prompt if os.path.isabs(prompt) or os.path.exists(prompt) else os.path.join(PROMPT_DIR, prompt)
+
+
+def load_digests(path):
+    """Validated digest dicts, with defaults filled in."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise DigestError(f"{path}: expected a non-empty JSON list of digests")
+    digests = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise DigestError(f"{path}: digest {i + 1} needs a 'name'")
+        unknown = set(entry) - DIGEST_KEYS
+        if unknown:
+            raise DigestError(f"{path}: digest '{entry['name']}' has unknown keys: {', '.join(sorted(unknown))}")
+        digest = {
+            "name": str(entry["name"]),
+            "title": entry.get("title") or DEFAULT_TITLE,
+            "heading": entry.get("heading") or DEFAULT_HEADING,
+            "hours": int(entry.get("hours", DEFAULT_HOURS)),
+            "feeds": [name.strip() for name in entry.get("feeds") or [] if name.strip()],
+            "prompt": prompt_path(entry.get("prompt") or DEFAULT_PROMPT),
+        }
+        if digest["hours"] <= 0:
+            raise DigestError(f"{path}: digest '{digest['name']}' needs a positive 'hours'")
+        if not os.path.exists(digest["prompt"]):
+            raise DigestError(f"{path}: prompt '{digest['prompt']}' of digest '{digest['name']}' not found")
+        digests.append(digest)
+    # Deliverables are named after the title, so two digests sharing one would overwrite each other
+    for key in ("name", "title"):
+        values = [d[key] for d in digests]
+        duplicates = sorted({v for v in values if values.count(v) > 1})
+        if duplicates:
+            raise DigestError(f"{path}: duplicate digest {key}(s): {', '.join(duplicates)}")
+    return digests
+
+
+def union_window(digests):
+    """Hours covering every digest's window (they all end at the same hour)."""
+    return max(d["hours"] for d in digests)
+
+
+def union_feeds(digests, default_feeds):
+    """Feed names to extract: the configured feeds (if any digest takes every feed) plus each digest's own."""
+    feeds = list(default_feeds) if any(not d["feeds"] for d in digests) else []
+    for digest in digests:
+        feeds.extend(name for name in digest["feeds"] if name not in feeds)
+    return feeds
+
+
+def cluster_members(clusters_file):
+    """Representative -> other members' references, from dedup_articles.py's duplicate_clusters.json."""
+    if not clusters_file or not os.path.exists(clusters_file):
+        return {}
+    with open(clusters_file, "r", encoding="utf-8") as f:
+        clusters = json.load(f)
+    return {c["representative"]: [m["path"] for m in c["members"]] for c in clusters}
+
+
+def select_articles(list_file, digest, end_dt, output_file, clusters_file=None):
+    """
+    Write the articles of list_file that belong to the digest (feed, and date within its window) to output_file.
+    Store references carry the exact publication time; article files only the day, so those are kept
+    from the first day of the window on. When a kept article doesn't belong to the digest but a duplicate
+    of it (per clusters_file) does, that duplicate is selected in its place. Returns the number of articles selected.
+    """
+    start_dt = end_dt - timedelta(hours=digest["hours"])
+    start_ts, end_ts = start_dt.timestamp(), end_dt.timestamp()
+    day_start_ts = start_dt.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    feeds = set(digest["feeds"])
+
+    def belongs(ref):
+        fields = article_fields(ref)
+        if feeds and fields["feed"] not in feeds:
+            return False
+        date = fields["date"]
+        return date is None or (start_ts if split_ref(ref) else day_start_ts) <= date <= end_ts
+
+    members = cluster_members(clusters_file)
+    selected = []
+    for ref in read_article_list(list_file):
+        if not belongs(ref):
+            ref = next((member for member in members.get(ref, []) if belongs(member)), None)
+            if ref is None:
+                continue
+        selected.append(ref)
+    with open(output_file, "w", encoding="utf-8") as f:
+        for ref in selected:
+            f.write(ref + "\n")
+    return len(selected)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show which articles of a list each digest would include")
+    parser.add_argument("digests_file", help="JSON list of digest definitions")
+    parser.add_argument("articles_list", help="Article list (or articles.sqlite) to select from")
+    parser.add_argument("--end-hour", type=int, default=17, help="End hour of day (0-23) for the windows (default: 17)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        digests = load_digests(args.digests_file)
+    except (OSError, ValueError, DigestError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    _, end_dt = importlib.import_module("0_sqlite_to_articles").window_bounds(0, args.end_hour)
+    base_dir = os.path.dirname(os.path.abspath(args.articles_list))
+    clusters_file = os.path.join(base_dir, "duplicate_clusters.json")
+    for digest in digests:
+        output_file = os.path.join(base_dir, f"digest_{digest['name']}.txt")
+        count = select_articles(args.articles_list, digest, end_dt, output_file, clusters_file)
+        feeds = ", ".join(digest["feeds"]) or "all feeds"
+        print(f"{digest['name']}: {count} articles ({digest['hours']}h, {feeds}) -> {output_file}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML-to-text cleaning for extracted articles.
+
+Backends, fastest first: selectolax, lxml, BeautifulSoup (html.parser). "auto"
+picks the first one installed. All backends drop scripts, styles and page
+boilerplate (nav/header/footer/aside/forms/iframes), keep block boundaries as
+line breaks and normalise whitespace. clean_stream() can fan the work out to a
+process pool while keeping rows in order and only a bounded number in flight;
+with inline_first it cleans that many rows inline first and only starts the
+pool if more follow, so small batches don't pay for the worker start-up.
+"""
+import re
+import time
+from itertools import chain
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:  # selectolax < 0.3 has only the Modest backend (removed in 1.0)
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+from bs4 import BeautifulSoup
+
+STRIP_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "form", "nav", "header", "footer", "aside", "button"]
+BLOCK_TAGS = ["p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "blockquote", "pre"]
+
+_INLINE_SPACE_RE = re.compile(r"[ \t\r\f\v\u00a0\u3000]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+_BLOCK_END_RE = re.compile(r"(</(?:" + "|".join(BLOCK_TAGS) + r")\s*>|<br\s*/?>)", re.IGNORECASE)
+
+
+def _mark_blocks(html):
+    """Put a newline after block-level closing tags so every backend keeps paragraph boundaries."""
+    return _BLOCK_END_RE.sub("\\1\n", html)
+
+
+def normalize_whitespace(text):
+    lines = (_INLINE_SPACE_RE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(line for line in lines if line)).strip()
+
+
+def _clean_selectolax(html):
+    tree = HTMLParser(html)
+    tree.strip_tags(STRIP_TAGS)
+    root = tree.body or tree.root
+    return root.text(separator="") if root is not None else ""
+
+
+def _clean_lxml(html):
+    root = lxml.html.document_fromstring(html)
+    for element in list(root.iter(*STRIP_TAGS)):
+        element.drop_tree()
+    return root.text_content()
+
+
+def _clean_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(STRIP_TAGS):
+        element.decompose()
+    return soup.get_text()
+
+
+BACKENDS = {"selectolax": _clean_selectolax, "lxml": _clean_lxml, "bs4": _clean_bs4}
+
+
+def available_backends():
+    names = []
+    if HTMLParser is not None:
+        names.append("selectolax")
+    if lxml is not None:
+        names.append("lxml")
+    names.append("bs4")
+    return names
+
+
+def resolve_backend(name="auto"):
+    if name == "auto":
+        return available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"HTML cleaner backend '{name}' is not installed (available: {', '.join(available_backends())})")
+    return name
+
+
+def clean_html(html, backend="bs4"):
+    if not html:
+        return ""
+    html = _mark_blocks(html)
+    try:
+        text = BACKENDS[backend](html)
+    except Exception:
+        # Fragments some parsers reject (e.g. lxml on bare text) fall back to the tolerant parser
+        text = _clean_bs4(html)
+    return normalize_whitespace(text)
+
+
+def clean_html_timed(html, backend="bs4"):
+    """Process-pool entry point: returns (text, seconds spent cleaning)."""
+    start = time.perf_counter()
+    text = clean_html(html, backend)
+    return text, time.perf_counter() - start
+
+
+def clean_stream(rows, html_of, backend="bs4", workers=0, max_pending=None, inline_first=0):
+    """
+    Yield (row, text, seconds) for each row in order. html_of(row) returns the HTML to clean.
+    With workers > 1, cleaning runs in a process pool with at most max_pending rows in flight,
+    started after the first inline_first rows (cleaned inline) if any rows are left.
+    """
+    rows = iter(rows)
+    if workers > 1 and inline_first:
+        for _, row in zip(range(inline_first), rows):
+            text, seconds = clean_html_timed(html_of(row), backend)
+            yield row, text, seconds
+        following = next(rows, None)
+        if following is None:
+            return
+        rows = chain([following], rows)
+    if workers <= 1:
+        for row in rows:
+            text, seconds = clean_html_timed(html_of(row), backend)
+            yield row, text, seconds
+        return
+    max_pending = max_pending or workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for row in rows:
+            pending.append((row, executor.submit(clean_html_timed, html_of(row), backend)))
+            if len(pending) >= max_pending:
+                row_done, future = pending.popleft()
+                yield (row_done, *future.result())
+        while pending:
+            row_done, future = pending.popleft()
+            yield (row_done, *future.result())
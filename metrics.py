@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured run metrics for the pipeline.
+
+One RunMetrics recorder per process collects:
+  spans      timed sections (extract, summary, pdf, upload, ...) with attributes
+  timings    high-volume durations kept as aggregates only (e.g. per-article HTML cleaning)
+  LLM calls  one record per request: stage, model, queue wait, latency, retries,
+             prompt/completion tokens (from completion.usage, estimated when absent)
+  counters   plain counts (abstracts done, cache hits, ...)
+
+The stage modules record into the module-level recorder through span(),
+observe(), llm_call() and count(); pipeline.py writes the JSON run report and,
+optionally, a Prometheus textfile (node_exporter textfile collector format);
+daemon.py serves the same text on its /metrics endpoint.
+
+Estimated cost uses LLM_PRICES, per million prompt/completion tokens per model:
+    LLM_PRICES=deepseek-v3-250324=0.27/1.10,google/gemini-2.5-pro=1.25/10
+Batch API calls are priced at LLM_BATCH_PRICE_FACTOR (default 0.5) of that.
+Models without a price are listed under cost.unpriced_models.
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime
+
+DEFAULT_BATCH_PRICE_FACTOR = 0.5
+PROMETHEUS_PREFIX = "news_pipeline"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))]
+
+
+def summarize_values(values):
+    return {
+        "count": len(values),
+        "total": round(sum(values), 6),
+        "mean": round(sum(values) / len(values), 6) if values else 0.0,
+        "p50": round(percentile(values, 50), 6),
+        "p95": round(percentile(values, 95), 6),
+        "max": round(max(values), 6) if values else 0.0,
+    }
+
+
+def load_prices(spec=None):
+    """{model: (prompt_price, completion_price)} per million tokens from LLM_PRICES."""
+    spec = os.getenv("LLM_PRICES", "") if spec is None else spec
+    prices = {}
+    for item in spec.split(","):
+        model, _, price = item.strip().rpartition("=")
+        if not model or "/" not in price:
+            continue
+        prompt_price, _, completion_price = price.rpartition("/")
+        try:
+            prices[model.strip()] = (float(prompt_price), float(completion_price))
+        except ValueError:
+            print(f"Warning: ignoring malformed LLM_PRICES entry '{item.strip()}'")
+    return prices
+
+
+class RunMetrics:
+    def __init__(self, run_id=None):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.timings = {}
+        self.llm_calls = []
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Time the enclosed block. Yields the attrs dict so the block can add attributes (items, bytes, ...)."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield attrs
+        except BaseException as e:
+            status = "error"
+            attrs.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            record = {"name": name, "start": round(start - self._t0, 4),
+                      "seconds": round(time.perf_counter() - start, 4), "status": status}
+            record.update(attrs)
+            with self._lock:
+                self.spans.append(record)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def llm_call(self, stage, model, latency, queue_wait=0.0, retries=0, prompt_tokens=None,
+                 completion_tokens=None, status="ok", estimated=False, batch=False):
+        record = {"stage": stage, "model": model, "latency": round(latency, 4), "queue_wait": round(queue_wait, 4),
+                  "retries": retries, "prompt_tokens": prompt_tokens or 0, "completion_tokens": completion_tokens or 0,
+                  "status": status, "estimated": estimated, "batch": batch}
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def llm_summary(self, prices=None, batch_factor=None):
+        """Per stage/model aggregates plus estimated cost."""
+        prices = load_prices() if prices is None else prices
+        if batch_factor is None:
+            batch_factor = float(os.getenv("LLM_BATCH_PRICE_FACTOR", DEFAULT_BATCH_PRICE_FACTOR))
+        with self._lock:
+            calls = list(self.llm_calls)
+        groups = {}
+        for call in calls:
+            groups.setdefault((call["stage"], call["model"]), []).append(call)
+        summary = {}
+        cost_by_model = {}
+        unpriced = set()
+        for (stage, model), group in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            live = [c for c in group if not c["batch"]]
+            entry = {
+                "stage": stage,
+                "model": model,
+                "calls": len(group),
+                "failed": sum(1 for c in group if c["status"] != "ok"),
+                "batch_calls": len(group) - len(live),
+                "retries": sum(c["retries"] for c in group),
+                "prompt_tokens": sum(c["prompt_tokens"] for c in group),
+                "completion_tokens": sum(c["completion_tokens"] for c in group),
+                "tokens_estimated": any(c["estimated"] for c in group),
+                "latency": summarize_values([c["latency"] for c in live]),
+                "queue_wait": summarize_values([c["queue_wait"] for c in live]),
+                "cost": None,
+            }
+            if model in prices:
+                prompt_price, completion_price = prices[model]
+                cost = sum((c["prompt_tokens"] * prompt_price + c["completion_tokens"] * completion_price) / 1e6
+                           * (batch_factor if c["batch"] else 1.0) for c in group)
+                entry["cost"] = round(cost, 6)
+                cost_by_model[model] = round(cost_by_model.get(model, 0.0) + cost, 6)
+            else:
+                unpriced.add(str(model))
+            summary[f"{stage}/{model}"] = entry
+        cost = {"total": round(sum(cost_by_model.values()), 6), "by_model": cost_by_model,
+                "unpriced_models": sorted(unpriced)}
+        return summary, cost
+
+    def report(self, status=None, **extra):
+        llm, cost = self.llm_summary()
+        with self._lock:
+            report = {
+                "run_id": self.run_id,
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "finished": datetime.now().isoformat(timespec="seconds"),
+                "wall_seconds": round(time.perf_counter() - self._t0, 3),
+                "status": status,
+                "spans": sorted(self.spans, key=lambda s: s["start"]),
+                "timings": {name: summarize_values(values) for name, values in self.timings.items()},
+                "counters": dict(self.counters),
+            }
+        report["llm"] = llm
+        report["cost"] = cost
+        report.update(extra)
+        return report
+
+    def write_json(self, path, status=None, **extra):
+        report = self.report(status, **extra)
+        _atomic_write(path, json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+        return report
+
+    def write_prometheus(self, path, status=None):
+        """Gauges for the run just finished, for the node_exporter textfile collector."""
+        _atomic_write(path, self.prometheus_text(status))
+
+    def prometheus_text(self, status=None, run_gauges=True):
+        """Prometheus exposition text of this recorder. run_gauges=False leaves out the last_run_* gauges."""
+        report = self.report(status)
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.extend(gauge_lines(name, help_text, samples))
+
+        if run_gauges:
+            metric("last_run_timestamp_seconds", "Unix time the last run finished.", [({}, round(time.time(), 3))])
+            metric("last_run_success", "1 if the last run completed, 0 otherwise.",
+                   [({}, 1 if status in (None, "completed", "stopped early") else 0)])
+            metric("last_run_wall_seconds", "Wall time of the last run.", [({}, report["wall_seconds"])])
+        stage_seconds = {}
+        for span in report["spans"]:
+            stage_seconds[span["name"]] = stage_seconds.get(span["name"], 0.0) + span["seconds"]
+        metric("span_seconds", "Seconds spent in each span in the last run (summed over repeats).",
+               [({"span": name}, round(seconds, 4)) for name, seconds in stage_seconds.items()])
+        metric("timing_seconds_total", "Total seconds of aggregated timings in the last run.",
+               [({"name": name}, t["total"]) for name, t in report["timings"].items()])
+        llm = report["llm"].values()
+        metric("llm_calls", "LLM calls in the last run.",
+               [({"stage": e["stage"], "model": e["model"]}, e["calls"]) for e in llm])
+        metric("llm_failed_calls", "LLM calls that failed after all retries in the last run.",
+               [({"stage": e["stage"], "model": e["model"]}, e["failed"]) for e in llm])
+        metric("llm_retries", "LLM request retries in the last run.",
+               [({"stage": e["stage"], "model": e["model"]}, e["retries"]) for e in llm])
+        metric("llm_tokens", "LLM tokens used in the last run.",
+               [({"stage": e["stage"], "model": e["model"], "kind": kind}, e[f"{kind}_tokens"])
+                for e in llm for kind in ("prompt", "completion")])
+        metric("llm_latency_seconds", "LLM call latency quantiles in the last run.",
+               [({"stage": e["stage"], "model": e["model"], "quantile": q}, e["latency"][key])
+                for e in llm for q, key in (("0.5", "p50"), ("0.95", "p95"))])
+        metric("llm_queue_wait_seconds", "Time LLM calls waited for rate limits and concurrency slots (quantiles).",
+               [({"stage": e["stage"], "model": e["model"], "quantile": q}, e["queue_wait"][key])
+                for e in llm for q, key in (("0.5", "p50"), ("0.95", "p95"))])
+        metric("llm_cost_estimate", "Estimated LLM cost of the last run (LLM_PRICES units).",
+               [({"model": model}, cost) for model, cost in report["cost"]["by_model"].items()])
+        metric("counter", "Run counters.", [({"name": name}, value) for name, value in report["counters"].items()])
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name, help_text, samples):
+    """Exposition lines of one gauge (name gets the PROMETHEUS_PREFIX); samples are (labels dict, value) pairs."""
+    full = f"{PROMETHEUS_PREFIX}_{name}"
+    lines = [f"# HELP {full} {help_text}", f"# TYPE {full} gauge"]
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{full}{{{label_str}}} {value}" if label_str else f"{full} {value}")
+    return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _atomic_write(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_current = RunMetrics()
+
+
+def current():
+    return _current
+
+
+def start_run(run_id=None):
+    """Start a fresh recorder (one per pipeline run) and return it."""
+    global _current
+    _current = RunMetrics(run_id)
+    return _current
+
+
+def span(name, **attrs):
+    return _current.span(name, **attrs)
+
+
+def observe(name, seconds):
+    _current.observe(name, seconds)
+
+
+def count(name, value=1):
+    _current.count(name, value)
+
+
+def llm_call(stage, model, latency, **fields):
+    _current.llm_call(stage, model, latency, **fields)
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run the whole pipeline in one Python process:
+extract -> dedup -> [relevance filter] -> abstracts -> summary -> PDF -> Dropbox.
+
+Stage modules are imported once and artifacts are handed from stage to stage by
+explicit path, so there are no `ls -td` lookups that can pick up another run's
+output. Each stage's input fingerprint and output are kept in
+deliverable/pipeline_state.json; a stage whose inputs haven't changed since its
+last successful run is skipped and its previous output reused (--force reruns
+everything). Per-stage wall times are printed at the end and stored with the state.
+Each run also writes a JSON run report (spans, LLM calls and tokens, estimated
+cost; see metrics.py) to deliverable/run_reports/, plus a Prometheus textfile
+with --prometheus-textfile or PROMETHEUS_TEXTFILE.
+
+With --stream, extraction, dedup, filtering and abstracts run as one overlapped
+stage (see run_streaming), and uploads start as soon as each file is written.
+
+With --digests <file>, several deliverables (daily, weekly, per-topic; see
+digests.py) are made from one extraction and one abstract pass over the union
+of their windows and feeds; only the summaries and PDFs are made per digest,
+in parallel.
+
+With --archive, abstracts already in the cross-run archive (archive.py) are
+reused by URL instead of regenerated, and the run's articles, abstracts and
+deliverable are added to the archive at the end.
+
+Usage:
+    python pipeline.py --db <DB_PATH> [--hours 168] [--end-hour 17] [--resume] [--filter] [--incremental] [--store]
+                       [--stream] [--batch] [--archive] [--digests <file>] [--force] [--no-upload] [--prometheus-textfile <path>]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import metrics
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATE_PATH = os.path.join("deliverable", "pipeline_state.json")
+DEFAULT_REPORT_DIR = os.path.join("deliverable", "run_reports")
+
+
+class PipelineError(Exception):
+    pass
+
+
+class NothingToDo(Exception):
+    pass
+
+
+def stage_module(name):
+    """Stage scripts have numeric names, so they are imported by string (and only when their stage runs)."""
+    return importlib.import_module(name)
+
+
+def fingerprint(*parts):
+    """sha256 over the given inputs: existing file paths contribute their bytes, anything else its repr."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str) and os.path.isfile(part):
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        else:
+            h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def db_signature(db_path):
+    """Cheap change marker for a live SQLite DB: size and mtime of the file and its WAL."""
+    signature = []
+    for path in (db_path, db_path + "-wal"):
+        if os.path.exists(path):
+            st = os.stat(path)
+            signature.append((st.st_size, st.st_mtime_ns))
+    return signature
+
+
+class Pipeline:
+    def __init__(self, state_path=DEFAULT_STATE_PATH, force=False, report_dir=DEFAULT_REPORT_DIR, textfile=None):
+        self.state_path = state_path
+        self.force = force
+        self.report_dir = report_dir
+        self.textfile = textfile
+        self.metrics = metrics.start_run()
+        self.state = {"stages": {}}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.timings = []
+        self.started = time.time()
+        # Stages may run on worker threads in --stream mode
+        self._lock = threading.Lock()
+
+    def _save(self):
+        with self._lock:
+            state_dir = os.path.dirname(self.state_path)
+            if state_dir:
+                os.makedirs(state_dir, exist_ok=True)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def previous_output(self, name):
+        return self.state["stages"].get(name, {}).get("output")
+
+    def run(self, name, func, inputs=None, rerun=False):
+        """
+        Run one stage. func() returns the stage's output path (None means failure).
+        With inputs, the stage is skipped when their fingerprint matches the last successful run, unless rerun is set.
+        """
+        key = fingerprint(*inputs) if inputs is not None else None
+        previous = self.state["stages"].get(name, {})
+        output = previous.get("output")
+        if (key and not (self.force or rerun) and previous.get("fingerprint") == key
+                and output and all(os.path.exists(path) for path in output.split("\n"))):
+            print(f"\n=== {name}: inputs unchanged, reusing {output} ===")
+            self.timings.append((name, 0.0, "skipped"))
+            return output
+
+        print(f"\n=== {name} ===")
+        start = time.time()
+        with metrics.span(f"stage.{name}") as attrs:
+            try:
+                output = func()
+            except NothingToDo:
+                attrs["outcome"] = "nothing to do"
+                raise
+            except SystemExit:
+                # Stage scripts exit on configuration errors; turn that into a pipeline failure
+                output = None
+            except Exception:
+                traceback.print_exc()
+                output = None
+            attrs["outcome"] = "ran" if output else "failed"
+        elapsed = time.time() - start
+        if not output:
+            self.timings.append((name, elapsed, "failed"))
+            raise PipelineError(f"stage '{name}' failed after {elapsed:.1f}s")
+        self.timings.append((name, elapsed, "ran"))
+        with self._lock:
+            self.state["stages"][name] = {"fingerprint": key, "output": output,
+                                          "finished": datetime.now().isoformat(timespec="seconds")}
+        self._save()
+        return output
+
+    def report(self, status):
+        wall = time.time() - self.started
+        total = sum(seconds for _, seconds, _ in self.timings)
+        print(f"\nPipeline {status} in {wall:.1f}s (stages add up to {total:.1f}s)")
+        for name, seconds, outcome in self.timings:
+            print(f"  {name:<16} {seconds:8.1f}s  {outcome}")
+        self.state["last_run"] = {
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "status": status,
+            "wall_seconds": round(wall, 3),
+            "timings": {name: round(seconds, 3) for name, seconds, _ in self.timings},
+        }
+        self._save()
+        self.write_metrics(status)
+
+    def write_metrics(self, status):
+        """JSON run report (spans, LLM calls, estimated cost) and, if configured, the Prometheus textfile."""
+        skipped = [name for name, _, outcome in self.timings if outcome == "skipped"]
+        report_path = os.path.join(self.report_dir, f"run_{self.metrics.run_id}.json")
+        report = self.metrics.write_json(report_path, status, skipped_stages=skipped)
+        for entry in report["llm"].values():
+            latency = entry["latency"]
+            cost = f", est. cost {entry['cost']:.4f}" if entry["cost"] is not None else ""
+            print(f"  LLM {entry['stage']:<12} {entry['model']}: {entry['calls']} calls ({entry['failed']} failed, "
+                  f"{entry['retries']} retries), {entry['prompt_tokens']}+{entry['completion_tokens']} tokens, "
+                  f"p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s{cost}")
+        if report["cost"]["by_model"]:
+            print(f"  Estimated LLM cost: {report['cost']['total']:.4f}")
+        print(f"Run report: {report_path}")
+        if self.textfile:
+            self.metrics.write_prometheus(self.textfile, status)
+            print(f"Prometheus textfile: {self.textfile}")
+
+
+def run_abstract_pass(pipeline, args, hours=None, feed_names=None, store=None):
+    """Extract, dedup, [filter] and abstract one window. Returns (articles list, abstract file)."""
+    hours = hours or args.hours
+    store = args.store if store is None else store
+    extract = stage_module("0_sqlite_to_articles")
+    start_dt, end_dt = extract.window_bounds(hours, args.end_hour)
+
+    def extract_stage():
+        list_file = extract.extract_articles(args.db, hours, args.end_hour, args.incremental, store=store,
+                                             feed_names=feed_names)
+        if list_file is None:
+            raise NothingToDo("no articles in the time window")
+        return list_file
+
+    previous_list = pipeline.previous_output("extract")
+    if args.resume and previous_list and os.path.exists(previous_list):
+        print(f"\n=== extract: resuming with previously extracted articles in {os.path.dirname(previous_list)} ===")
+        articles_list = previous_list
+        pipeline.timings.append(("extract", 0.0, "skipped"))
+    else:
+        extract_inputs = [db_signature(args.db), start_dt.isoformat(), end_dt.isoformat(),
+                          args.incremental, store] + ([feed_names] if feed_names else [])
+        articles_list = pipeline.run("extract", extract_stage, extract_inputs)
+
+    articles_list = pipeline.run(
+        "dedup", lambda: stage_module("dedup_articles").dedup_article_list(articles_list))
+    if args.filter:
+        articles_list = pipeline.run(
+            "filter", lambda: stage_module("relevance_filter").filter_article_list(articles_list))
+
+    abstracts = stage_module("1_article_to_abstract_md")
+    previous_md = pipeline.previous_output("abstracts")
+    # A leftover checkpoint journal means the last run had failed articles; run again to retry them
+    incomplete = bool(previous_md) and os.path.exists(abstracts.journal_path_for(previous_md))
+    abstract_md = pipeline.run(
+        "abstracts",
+        lambda: abstracts.main(articles_list, resume=args.resume or incomplete, batch=args.batch,
+                               use_archive=args.archive),
+        [articles_list, os.path.join(SCRIPT_DIR, "system_prompt", "abstract_prompt.md"),
+         os.getenv("Volcengine_MODEL_ID"), os.getenv("ABSTRACT_MAX_INPUT_TOKENS"), args.archive],
+        rerun=incomplete,
+    )
+    return articles_list, abstract_md
+
+
+def run_sequential(pipeline, args):
+    articles_list, abstract_md = run_abstract_pass(pipeline, args)
+    summary_md = run_summary(pipeline, abstract_md)
+    pdf_file = run_pdf(pipeline, summary_md)
+    if not args.no_upload:
+        def upload_stage():
+            dropbox_stage = stage_module("4_save_to_dropbox")
+            dbx = dropbox_stage.connect_dropbox()
+            if dbx is None or not dropbox_stage.upload_files([summary_md, pdf_file], dbx):
+                return None
+            return f"{summary_md}\n{pdf_file}"
+        pipeline.run("upload", upload_stage, [summary_md, pdf_file])
+    if args.archive:
+        run_archive(pipeline, articles_list, abstract_md, [summary_md])
+
+
+def run_summary(pipeline, abstract_md, name="summary", digest=None):
+    prompt_file = digest["prompt"] if digest else os.path.join(SCRIPT_DIR, "system_prompt", "summary_prompt.md")
+    options = {"prompt_file": prompt_file, "title": digest["title"], "heading": digest["heading"]} if digest else {}
+    inputs = [abstract_md, prompt_file, os.getenv("Gemini_MODEL_ID"), datetime.now().strftime("%Y%m%d")]
+    return pipeline.run(
+        name,
+        lambda: stage_module("2_abstract_to_summary").summarize(abstract_md, **options),
+        inputs + ([digest["title"], digest["heading"]] if digest else []),
+    )
+
+
+def run_pdf(pipeline, summary_md, name="pdf"):
+    pdf_file = os.path.splitext(summary_md)[0] + ".pdf"
+    return pipeline.run(
+        name,
+        lambda: pdf_file if stage_module("3_md_to_pdf").md_to_pdf(summary_md) else None,
+        [summary_md],
+    )
+
+
+def run_archive(pipeline, articles_list, abstract_md, summary_mds):
+    def archive_stage():
+        archive_module = stage_module("archive")
+        archive = archive_module.NewsArchive()
+        try:
+            written = archive_module.index_run(archive, [articles_list], [abstract_md], summary_mds)
+            print(f"Archived {written} records into {archive.path}")
+            return archive.path
+        finally:
+            archive.close()
+    return pipeline.run("archive", archive_stage, [articles_list, abstract_md] + summary_mds)
+
+
+def run_streaming(pipeline, args):
+    """
+    Overlapped mode: articles go from the DB cursor through online dedup/filtering straight into the
+    abstract workers (bounded queue), and each upload starts as soon as its file exists: the abstracts
+    upload runs alongside the summary call, the deliverable markdown upload alongside PDF rendering.
+    """
+    extract = stage_module("0_sqlite_to_articles")
+    dedup = stage_module("dedup_articles")
+    abstracts = stage_module("1_article_to_abstract_md")
+    deduplicator = dedup.StreamingDeduplicator()
+    score_article = threshold = None
+    if args.filter:
+        relevance = stage_module("relevance_filter")
+        score_article, threshold = relevance.load_scorer(), relevance.default_threshold()
+
+    extracted = {}
+
+    def produce(put):
+        submitted = set()
+        dropped = 0
+
+        def on_article(path, link, title, text):
+            nonlocal dropped
+            submitted.add(path)
+            if not deduplicator.add(path, link, title, text):
+                return
+            if score_article and score_article(title, text) < threshold:
+                dropped += 1
+                return
+            put(path)
+
+        list_file = extract.extract_articles(args.db, args.hours, args.end_hour, args.incremental,
+                                             store=args.store, on_article=on_article)
+        if list_file is None:
+            return None
+        # Incremental runs: articles of this window extracted by earlier runs follow the new ones
+        for path in stage_module("article_store").read_article_list(list_file):
+            if path not in submitted:
+                link, title, _, body = dedup.read_article(path)
+                on_article(path, link, title, body)
+        base_dir = os.path.dirname(list_file)
+        deduplicator.write(os.path.join(base_dir, "deduped_articles.txt"),
+                           os.path.join(base_dir, "duplicate_clusters.json"))
+        if score_article:
+            print(f"Relevance filter (threshold {threshold}): dropped {dropped}")
+        extracted["list_file"] = list_file
+        return list_file
+
+    def stream_stage():
+        abstract_md, list_file = abstracts.main_stream(produce, use_archive=args.archive)
+        if list_file is None:
+            raise NothingToDo("no articles in the time window")
+        return abstract_md
+
+    abstract_md = pipeline.run("stream", stream_stage)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        uploads = []
+        dbx = None
+        if not args.no_upload:
+            dropbox_stage = stage_module("4_save_to_dropbox")
+            dbx = pool.submit(dropbox_stage.connect_dropbox)
+
+            def upload(name, path):
+                def upload_stage():
+                    client = dbx.result()
+                    return path if client is not None and dropbox_stage.upload_files([path], client) else None
+                uploads.append(pool.submit(pipeline.run, name, upload_stage, [path]))
+
+            upload("upload-abstracts", abstract_md)
+        summary_md = run_summary(pipeline, abstract_md)
+        if dbx:
+            upload("upload-summary", summary_md)
+        pdf_file = run_pdf(pipeline, summary_md)
+        if dbx:
+            upload("upload-pdf", pdf_file)
+        for future in uploads:
+            future.result()
+    if args.archive:
+        run_archive(pipeline, extracted["list_file"], abstract_md, [summary_md])
+
+
+def run_digests(pipeline, args):
+    """
+    Multi-digest mode (see digests.py): the union of all digests' windows and feeds is extracted and
+    abstracted once. Each digest's abstract file is then assembled from the abstract cache (no API calls
+    for articles of the shared pass; only a digest's own copy of a story dedup kept from another feed is
+    abstracted), and the digests' summaries, PDFs and uploads run in parallel.
+    """
+    digest_module = stage_module("digests")
+    try:
+        digests = digest_module.load_digests(args.digests)
+    except (OSError, ValueError, digest_module.DigestError) as e:
+        raise PipelineError(f"cannot load digests: {e}")
+    default_feeds = [name.strip() for name in os.getenv("ALLOWED_FEED_NAMES", "").split(",") if name.strip()]
+    hours = digest_module.union_window(digests)
+    feeds = digest_module.union_feeds(digests, default_feeds)
+    print(f"Digests: {', '.join(d['name'] for d in digests)} (shared window {hours}h, {len(feeds)} feeds)")
+    # The store keeps each article's exact publication time, which the per-digest windows are cut by
+    articles_list, abstract_md = run_abstract_pass(pipeline, args, hours, feeds, store=True)
+    _, end_dt = stage_module("0_sqlite_to_articles").window_bounds(hours, args.end_hour)
+
+    abstracts = stage_module("1_article_to_abstract_md")
+    base_dir = os.path.dirname(articles_list)
+    # Written by the dedup stage; maps each kept article to the duplicates it replaced
+    clusters_file = os.path.join(base_dir, "duplicate_clusters.json")
+    selected = []
+    for digest in digests:
+        name = digest["name"]
+        subset = os.path.join(base_dir, f"digest_{name}.txt")
+        count = digest_module.select_articles(articles_list, digest, end_dt, subset, clusters_file)
+        if count == 0:
+            print(f"Digest '{name}': no articles in its window, skipped")
+            continue
+        digest_md = os.path.splitext(abstract_md)[0] + f"_{name}.md"
+        digest_md = pipeline.run(
+            f"abstracts:{name}",
+            lambda: abstracts.main(subset, output_md=digest_md, use_archive=args.archive),
+            [subset, abstract_md],
+        )
+        selected.append((digest, digest_md))
+    if not selected:
+        raise NothingToDo("no digest has articles in its window")
+
+    dbx = None
+    if not args.no_upload:
+        dropbox_stage = stage_module("4_save_to_dropbox")
+        dbx = dropbox_stage.connect_dropbox()
+    # The PDF renderer (fonts, stylesheet, render cache) is shared, so documents are laid out one at a time
+    pdf_lock = threading.Lock()
+
+    def deliver(digest, digest_md):
+        name = digest["name"]
+        summary_md = run_summary(pipeline, digest_md, f"summary:{name}", digest)
+        with pdf_lock:
+            pdf_file = run_pdf(pipeline, summary_md, f"pdf:{name}")
+        if not args.no_upload:
+            def upload_stage():
+                if dbx is None or not dropbox_stage.upload_files([summary_md, pdf_file], dbx):
+                    return None
+                return f"{summary_md}\n{pdf_file}"
+            pipeline.run(f"upload:{name}", upload_stage, [summary_md, pdf_file])
+        return summary_md
+
+    with ThreadPoolExecutor(max_workers=len(selected)) as pool:
+        futures = [pool.submit(deliver, digest, digest_md) for digest, digest_md in selected]
+        summary_mds = [future.result() for future in futures]
+    if args.archive:
+        run_archive(pipeline, articles_list, abstract_md, summary_mds)
+
+
+def run_pipeline(args):
+    pipeline = Pipeline(args.state, args.force, args.report_dir, args.prometheus_textfile)
+    try:
+        if args.digests:
+            run_digests(pipeline, args)
+        elif args.stream:
+            run_streaming(pipeline, args)
+        else:
+            run_sequential(pipeline, args)
+    except NothingToDo as e:
+        print(f"Nothing to do: {e}")
+        pipeline.report("stopped early")
+        return True
+    except PipelineError as e:
+        print(f"Error: {e}")
+        pipeline.report("failed")
+        return False
+    pipeline.report("completed")
+    return True
+
+
+def add_arguments(parser):
+    """Pipeline options, shared with daemon.py."""
+    parser.add_argument("--db", help="Path to FreshRSS SQLite database file (overrides DB_PATH in .env)")
+    parser.add_argument("--hours", type=int, default=168, help="Time window in hours (default: 168)")
+    parser.add_argument("--end-hour", type=int, default=17, help="End hour of day (0-23) for the window end (default: 17)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse the last extracted articles and resume abstracts from their checkpoint")
+    parser.add_argument("--filter", action="store_true", help="Run the local AI-relevance filter before abstracts")
+    parser.add_argument("--incremental", action="store_true", help="Incremental extraction (see 0_sqlite_to_articles.py)")
+    parser.add_argument("--store", action="store_true", help="Write articles into a single articles.sqlite store")
+    parser.add_argument("--stream", action="store_true",
+                        help="Overlap stages: stream articles into the abstract workers and upload files as they appear")
+    parser.add_argument("--batch", action="store_true",
+                        help="Generate abstracts through the provider's batch API (cheaper, slower; not with --stream)")
+    parser.add_argument("--archive", action="store_true",
+                        help="Reuse abstracts from the cross-run archive by URL and add this run to it (see archive.py)")
+    parser.add_argument("--digests",
+                        help="JSON file of digest definitions: abstract their union once, then summarize each (see digests.py)")
+    parser.add_argument("--force", action="store_true", help="Run every stage even if its inputs are unchanged")
+    parser.add_argument("--no-upload", action="store_true", help="Skip the Dropbox upload")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help=f"Pipeline state file (default: {DEFAULT_STATE_PATH})")
+    parser.add_argument("--report-dir", default=DEFAULT_REPORT_DIR,
+                        help=f"Directory for the JSON run reports (default: {DEFAULT_REPORT_DIR})")
+    parser.add_argument("--prometheus-textfile",
+                        help="Also write run metrics to this Prometheus textfile (default: PROMETHEUS_TEXTFILE from .env)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the AI news pipeline in a single process")
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    args.db = args.db or os.getenv("DB_PATH")
+    args.prometheus_textfile = args.prometheus_textfile or os.getenv("PROMETHEUS_TEXTFILE")
+    if not args.db:
+        print("Error: --db <DB_PATH> is required (or set DB_PATH in .env).")
+        sys.exit(1)
+    if args.digests and args.stream:
+        print("Error: --digests cannot be combined with --stream.")
+        sys.exit(1)
+    if args.batch and args.stream:
+        # Streaming submits each article as it is extracted, so there is no batch to send
+        print("Error: --batch cannot be combined with --stream.")
+        sys.exit(1)
+    sys.exit(0 if run_pipeline(args) else 1)
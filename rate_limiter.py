@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token-bucket rate limiter shared by the abstract (stage 2) and summary (stage 3) calls.
+
+Two buckets are enforced at once: requests per minute and tokens per minute.
+Callers reserve capacity under a lock and then sleep *outside* it, so waiting
+threads/coroutines never block each other. Provider feedback is honored too:
+429s and Retry-After / x-ratelimit-* headers pause the whole limiter, and
+retries use jittered exponential backoff.
+
+Limits come from <PREFIX>_RPM / <PREFIX>_TPM in the environment (e.g.
+Volcengine_RPM, Gemini_TPM); 0 disables a bucket.
+"""
+import os
+import re
+import time
+import random
+import asyncio
+from threading import Lock
+
+DEFAULT_RPM = 1000
+DEFAULT_TPM = 0
+# Bucket capacity in seconds of refill: bounds the burst after an idle period
+DEFAULT_BURST_SECONDS = 10
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def parse_duration(value):
+    """Parse header durations such as '2', '1.5s', '250ms' or '6m0s' into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(num) * scale[unit] for num, unit in parts)
+
+
+class _Bucket:
+    def __init__(self, per_minute, burst_seconds):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """Take `amount` from the bucket (possibly going into debt) and return seconds until it is covered."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single request larger than the whole bucket would otherwise wait forever
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class TokenBucketRateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM,
+                 burst_seconds=DEFAULT_BURST_SECONDS, base_backoff=1.0, max_backoff=60.0):
+        self.requests = _Bucket(requests_per_minute, burst_seconds) if requests_per_minute and requests_per_minute > 0 else None
+        self.tokens = _Bucket(tokens_per_minute, burst_seconds) if tokens_per_minute and tokens_per_minute > 0 else None
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.blocked_until = 0.0
+        self.lock = Lock()
+
+    def _reserve(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(self, tokens=0):
+        """Blocking acquire for threaded callers. Returns the time spent waiting."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0):
+        """Event-loop friendly acquire for asyncio callers. Returns the time spent waiting."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a call is known."""
+        if self.tokens is None or actual_tokens is None:
+            return
+        with self.lock:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds):
+        """Hold every caller back for `seconds` (e.g. after a 429 or an exhausted quota header)."""
+        if not seconds or seconds <= 0:
+            return
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers):
+        """Pause until the provider's reset time when a x-ratelimit-remaining-* header reaches zero."""
+        if not headers:
+            return
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                exhausted = remaining is not None and float(remaining) <= 0
+            except ValueError:
+                exhausted = False
+            if exhausted:
+                self.pause(parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 1.0)
+
+    def retry_delay(self, error, attempt):
+        """
+        Seconds to wait before retry number `attempt` (1-based) after `error`.
+        Uses Retry-After style headers when the provider sends them, otherwise
+        full-jitter exponential backoff. 429s also pause the whole limiter.
+        """
+        status = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        delay = None
+        if headers.get("retry-after-ms") is not None:
+            delay = (parse_duration(headers.get("retry-after-ms")) or 0) / 1000.0
+        elif headers.get("retry-after") is not None:
+            delay = parse_duration(headers.get("retry-after"))
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** (attempt - 1))))
+        if status == 429:
+            self.pause(delay)
+        return delay
+
+
+def limiter_from_env(prefix, default_rpm=DEFAULT_RPM, default_tpm=DEFAULT_TPM):
+    """Build a limiter from <prefix>_RPM / <prefix>_TPM environment variables."""
+    rpm = int(os.getenv(f"{prefix}_RPM", default_rpm))
+    tpm = int(os.getenv(f"{prefix}_TPM", default_tpm))
+    return TokenBucketRateLimiter(rpm, tpm)
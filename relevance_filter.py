@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Score articles for AI relevance locally (no network, no GPU) and drop or demote
+off-topic ones before abstract generation.
+
+Two scorers are available:
+  keyword  weighted AI lexicon (English + Chinese), title hits count triple
+  tfidf    cosine similarity to a TF-IDF centroid trained on past abstracts
+           (abstract_md/*.md), built with --train
+
+Usage:
+    python relevance_filter.py <articles_list.txt> [--method keyword|tfidf] [--threshold 0.3] [--action drop|demote]
+    python relevance_filter.py --train [--abstract-dir abstract_md]
+"""
+import os
+import re
+import sys
+import json
+import math
+import glob
+import argparse
+from collections import Counter
+
+from article_store import read_article_list
+from dedup_articles import read_article
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abstract_md", "relevance_model.json")
+DEFAULT_THRESHOLDS = {"keyword": 0.3, "tfidf": 0.05}
+
+# Term -> weight. Matching is case-insensitive; English terms match on word boundaries.
+AI_KEYWORDS = {
+    "ai": 2, "a.i.": 2, "artificial intelligence": 3, "machine learning": 3, "deep learning": 3,
+    "llm": 3, "large language model": 3, "gpt": 3, "chatgpt": 3, "openai": 3, "anthropic": 3, "claude": 2,
+    "gemini": 2, "deepmind": 3, "llama": 2, "mistral": 2, "deepseek": 3, "qwen": 3, "kimi": 2,
+    "transformer": 2, "diffusion": 1, "neural network": 3, "inference": 1, "fine-tuning": 2, "fine-tune": 2,
+    "agent": 1, "agents": 1, "copilot": 2, "multimodal": 2, "reasoning model": 3, "foundation model": 3,
+    "nvidia": 2, "gpu": 2, "tpu": 2, "hbm": 2, "cuda": 2, "data center": 1, "datacenter": 1, "compute": 1,
+    "人工智能": 3, "大模型": 3, "大语言模型": 3, "机器学习": 3, "深度学习": 3, "神经网络": 3, "智能体": 2,
+    "生成式": 2, "多模态": 2, "推理": 1, "训练": 1, "微调": 2, "算力": 2, "芯片": 1, "英伟达": 2,
+    "语言模型": 3, "具身智能": 3, "机器人": 1, "自动驾驶": 1, "通义": 2, "文心": 2, "豆包": 2, "混元": 2,
+    "智谱": 2, "月之暗面": 2, "百川": 1, "零一万物": 2, "阶跃星辰": 2, "昇腾": 2, "数据中心": 1, "云计算": 1,
+}
+# Weighted hits per 1000 characters of body that count as "fully on topic"
+BODY_SATURATION = 6.0
+TITLE_SATURATION = 3.0
+
+_ASCII_TERM = re.compile(r"^[a-z0-9 .\-]+$")
+_WORD_RE = re.compile(r"[a-z][a-z0-9\-]+")
+_CJK_RUN_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def _compile_keywords(keywords):
+    patterns = []
+    for term, weight in keywords.items():
+        if _ASCII_TERM.match(term):
+            patterns.append((re.compile(r"(?<![a-z0-9])" + re.escape(term) + r"(?![a-z0-9])"), weight))
+        else:
+            patterns.append((re.compile(re.escape(term)), weight))
+    return patterns
+
+
+_KEYWORD_PATTERNS = _compile_keywords(AI_KEYWORDS)
+
+
+def _weighted_hits(text):
+    text = text.lower()
+    return sum(weight * len(pattern.findall(text)) for pattern, weight in _KEYWORD_PATTERNS)
+
+
+def keyword_score(title, body):
+    """0..1: title hits and body hit density, each saturating, combined as 1 - (1-a)(1-b)."""
+    title_part = min(1.0, _weighted_hits(title) / TITLE_SATURATION)
+    density = _weighted_hits(body) * 1000.0 / max(len(body), 1000)
+    body_part = min(1.0, density / BODY_SATURATION)
+    return 1 - (1 - title_part) * (1 - body_part)
+
+
+def tokenize(text):
+    """Lowercase English words plus Chinese character bigrams."""
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def train_tfidf_model(abstract_dir, model_path=DEFAULT_MODEL_PATH, max_terms=5000):
+    """Build an IDF table and a normalized centroid from past abstracts (one document per ### entry)."""
+    docs = []
+    for path in glob.glob(os.path.join(abstract_dir, "*.md")):
+        with open(path, "r", encoding="utf-8") as f:
+            docs.extend(d for d in re.split(r"^#{1,3} ", f.read(), flags=re.MULTILINE) if d.strip())
+    if not docs:
+        print(f"Error: no abstracts found under {abstract_dir}")
+        return None
+    df = Counter()
+    tfs = []
+    for doc in docs:
+        tf = Counter(tokenize(doc))
+        tfs.append(tf)
+        df.update(tf.keys())
+    n = len(docs)
+    idf = {t: math.log((1 + n) / (1 + c)) + 1 for t, c in df.items()}
+    centroid = Counter()
+    for tf in tfs:
+        for t, c in tf.items():
+            centroid[t] += (1 + math.log(c)) * idf[t] / n
+    top = dict(centroid.most_common(max_terms))
+    norm = math.sqrt(sum(v * v for v in top.values())) or 1.0
+    model = {
+        "documents": n,
+        "default_idf": math.log(1 + n) + 1,
+        "idf": {t: idf[t] for t in top},
+        "centroid": {t: v / norm for t, v in top.items()},
+    }
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    with open(model_path, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False)
+    print(f"Trained relevance model on {n} abstracts ({len(top)} terms): {model_path}")
+    return model
+
+
+def tfidf_score(model, title, body):
+    tf = Counter(tokenize(f"{title}\n{title}\n{body}"))
+    if not tf:
+        return 0.0
+    idf, centroid, default_idf = model["idf"], model["centroid"], model["default_idf"]
+    dot = sq = 0.0
+    for t, c in tf.items():
+        w = (1 + math.log(c)) * idf.get(t, default_idf)
+        sq += w * w
+        dot += w * centroid.get(t, 0.0)
+    return dot / math.sqrt(sq) if sq else 0.0
+
+
+def load_scorer(method="keyword", model_path=DEFAULT_MODEL_PATH):
+    """Returns score(title, body) for the chosen method; exits if the TF-IDF model is missing."""
+    if method != "tfidf":
+        return keyword_score
+    if not os.path.exists(model_path):
+        print(f"Error: relevance model '{model_path}' not found. Run with --train first.")
+        sys.exit(1)
+    with open(model_path, "r", encoding="utf-8") as f:
+        model = json.load(f)
+    return lambda title, body: tfidf_score(model, title, body)
+
+
+def default_threshold(method="keyword"):
+    # The scorers have different scales, so each has its own setting (RELEVANCE_THRESHOLD_KEYWORD / _TFIDF)
+    return float(os.getenv(f"RELEVANCE_THRESHOLD_{method.upper()}", DEFAULT_THRESHOLDS[method]))
+
+
+def filter_article_list(list_file, method="keyword", threshold=None, action="drop",
+                        model_path=DEFAULT_MODEL_PATH, output_list=None, report_file=None):
+    """
+    Score every article in list_file and write the filtered list plus relevance_report.json.
+    With action="demote", low-scoring articles are moved to the end of the list instead of dropped.
+    Returns the path of the filtered list.
+    """
+    base_dir = os.path.dirname(list_file)
+    output_list = output_list or os.path.join(base_dir, "relevant_articles.txt")
+    report_file = report_file or os.path.join(base_dir, "relevance_report.json")
+    if threshold is None:
+        threshold = default_threshold(method)
+    score_article = load_scorer(method, model_path)
+
+    paths = read_article_list(list_file)
+
+    kept, low = [], []
+    for path in paths:
+        try:
+            link, title, _, body = read_article(path)
+        except OSError as e:
+            print(f"Skipping unreadable article {path}: {e}")
+            continue
+        score = score_article(title, body)
+        entry = {"path": path, "link": link, "title": title, "score": round(score, 4)}
+        (kept if score >= threshold else low).append(entry)
+
+    ordered = kept + sorted(low, key=lambda e: -e["score"]) if action == "demote" else kept
+    with open(output_list, "w", encoding="utf-8") as f:
+        for entry in ordered:
+            f.write(entry["path"] + "\n")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump({"method": method, "threshold": threshold, "action": action,
+                   "kept": len(kept), "below_threshold": low}, f, ensure_ascii=False, indent=2)
+
+    verb = "Demoted" if action == "demote" else "Dropped"
+    print(f"Relevance filter ({method}, threshold {threshold}): kept {len(kept)}/{len(kept) + len(low)}, "
+          f"{verb.lower()} {len(low)}. Report: {report_file}")
+    for entry in sorted(low, key=lambda e: e["score"])[:10]:
+        print(f"  {verb} [{entry['score']:.2f}] {entry['title']}")
+    return output_list
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local AI-relevance pre-filter for extracted articles")
+    parser.add_argument("list_file", nargs="?", help="Article list produced by 0_sqlite_to_articles.py / dedup_articles.py")
+    parser.add_argument("--method", choices=["keyword", "tfidf"], default="keyword", help="Scoring method (default: keyword)")
+    parser.add_argument("--threshold", type=float, help="Minimum score to keep (default: RELEVANCE_THRESHOLD_KEYWORD or 0.3 / RELEVANCE_THRESHOLD_TFIDF or 0.05)")
+    parser.add_argument("--action", choices=["drop", "demote"], default="drop", help="What to do with low-scoring articles")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path of the TF-IDF model file")
+    parser.add_argument("--train", action="store_true", help="Train the TF-IDF model from past abstracts and exit")
+    parser.add_argument("--abstract-dir", default="abstract_md", help="Directory of past abstract markdown files for --train")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.train:
+        sys.exit(0 if train_tfidf_model(args.abstract_dir, args.model) else 1)
+    if not args.list_file or not os.path.exists(args.list_file):
+        print("Error: an existing article list file is required.")
+        sys.exit(1)
+    filter_article_list(args.list_file, args.method, args.threshold, args.action, args.model)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Section-level render cache for 3_md_to_pdf.py.
+
+A deliverable is split into sections at its page-break lines (`---`). Each
+section's converted HTML fragment and rendered PDF are stored under a SHA-256
+of the section's Markdown plus everything else that affects the output (the
+stylesheet and fonts for PDFs, the Markdown extensions for HTML). Re-running
+after an edit to the summary therefore only converts and lays out the summary
+section; the abstracts section's pages come from the cache.
+
+Markdown resolves reference-style links and footnotes within one conversion
+only, so a `[label]: url` or `[^note]:` definition in one section can't serve a
+use in another. cross_section_labels() finds such labels; 3_md_to_pdf.py then
+converts the document as a whole instead of section by section.
+
+The cache is a single SQLite file (default: deliverable/render_cache.sqlite,
+PDF_RENDER_CACHE_PATH) holding at most PDF_RENDER_CACHE_MAX_ENTRIES entries of
+each kind, least recently used first out.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+
+from article_store import BUSY_TIMEOUT
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deliverable", "render_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 200
+PAGE_BREAK_RE = re.compile(r'^---\s*$', re.MULTILINE)
+# Reference-link and footnote definitions: "[label]: url" / "[^label]: text"
+REFERENCE_DEF_RE = re.compile(r'^ {0,3}\[(\^?[^\]\n]+)\]:', re.MULTILINE)
+
+
+def split_sections(md_content):
+    """Markdown between page-break lines. Joining the sections with page breaks gives back the document."""
+    return PAGE_BREAK_RE.split(md_content)
+
+
+def cross_section_labels(sections):
+    """Reference-link and footnote labels defined in one section and used in another."""
+    labels = set()
+    for i, section in enumerate(sections):
+        for label in REFERENCE_DEF_RE.findall(section):
+            # Labels are case-insensitive; "[label]" also matches "[text][label]" and "[^label]" footnote uses
+            use = re.compile(r'\[' + re.escape(label) + r'\]', re.IGNORECASE)
+            if any(use.search(other) for j, other in enumerate(sections) if j != i):
+                labels.add(label)
+    return sorted(labels)
+
+
+def section_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        data = (part or "").encode("utf-8")
+        # Length-prefix each part so boundaries can't be shifted between fields
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class RenderCache:
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or os.getenv("PDF_RENDER_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("PDF_RENDER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.hits = 0
+        self.misses = 0
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        for table, column in (("fragments", "html TEXT"), ("pdfs", "pdf BLOB")):
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, {column} NOT NULL, accessed_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def _get(self, table, column, key):
+        row = self.conn.execute(f"SELECT {column} FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.conn.execute(f"UPDATE {table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def _put(self, table, column, key, value):
+        self.conn.execute(f"INSERT OR REPLACE INTO {table} (key, {column}, accessed_at) VALUES (?, ?, ?)",
+                          (key, value, time.time()))
+        self.conn.commit()
+
+    def get_html(self, key):
+        return self._get("fragments", "html", key)
+
+    def put_html(self, key, html):
+        self._put("fragments", "html", key, html)
+
+    def get_pdf(self, key):
+        data = self._get("pdfs", "pdf", key)
+        return bytes(data) if data is not None else None
+
+    def put_pdf(self, key, pdf_bytes):
+        self._put("pdfs", "pdf", key, sqlite3.Binary(pdf_bytes))
+
+    def evict(self):
+        """Keep the max_entries most recently used fragments and PDFs. Returns rows removed."""
+        removed = 0
+        if self.max_entries > 0:
+            for table in ("fragments", "pdfs"):
+                removed += self.conn.execute(
+                    f"DELETE FROM {table} WHERE key IN ("
+                    f" SELECT key FROM {table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            self.conn.commit()
+        return removed
+
+    def stats_line(self):
+        return f"render cache hits={self.hits} misses={self.misses}"
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token estimation and budget-aware truncation of article bodies.
+
+Token counts use tiktoken (cl100k_base) when it is installed and fall back to
+a CJK-aware character heuristic otherwise. truncate_article() keeps the
+link/title/source header written by 0_sqlite_to_articles.py, then fills the
+remaining budget with the lead paragraphs and the highest-scoring later
+paragraphs (title overlap, figures, quotes), preserving their original order.
+"""
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_DIGIT_RE = re.compile(r"\d")
+_TERM_RE = re.compile(r"[a-z0-9]{3,}|[\u4e00-\u9fff]{2}")
+# Share of the body budget reserved for the opening paragraphs
+LEAD_SHARE = 0.5
+TRUNCATION_MARK = "\n\n[...]"
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # The BPE file is downloaded on first use; stay on the heuristic when offline
+            _encoding_failed = True
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Token count of `text`: exact cl100k_base count with tiktoken, else ~1 per CJK char and ~4 chars per token."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate_to_tokens(text, budget):
+    """Cut `text` to roughly `budget` tokens on a character boundary."""
+    if budget <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    end = max(1, int(len(text) * budget / tokens))
+    while end > 1 and estimate_tokens(text[:end]) > budget:
+        end = int(end * 0.9)
+    return text[:end]
+
+
+def _paragraph_score(paragraph, title_terms):
+    lowered = paragraph.lower()
+    overlap = sum(1 for term in title_terms if term in lowered)
+    figures = min(5, len(_DIGIT_RE.findall(paragraph)))
+    quotes = paragraph.count("“") + paragraph.count('"') + paragraph.count("「")
+    # Normalise by length so one huge paragraph doesn't win on raw counts
+    return (overlap * 3 + figures + min(2, quotes)) / (1 + len(paragraph) / 500)
+
+
+def truncate_article(article_content, max_tokens):
+    """
+    Fit an article into `max_tokens`. Returns (text, original_tokens, kept_tokens).
+    max_tokens <= 0 disables truncation.
+    """
+    original = estimate_tokens(article_content)
+    if max_tokens <= 0 or original <= max_tokens:
+        return article_content, original, original
+
+    parts = article_content.split("\n\n", 3)
+    header = "\n\n".join(parts[:3])
+    body = parts[3] if len(parts) > 3 else ""
+    budget = max_tokens - estimate_tokens(header) - estimate_tokens(TRUNCATION_MARK) - 2
+    if budget <= 0 or not body:
+        text = _truncate_to_tokens(article_content, max_tokens)
+        return text, original, estimate_tokens(text)
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n|\n", body) if p.strip()]
+    costs = [estimate_tokens(p) + 1 for p in paragraphs]
+    chosen = set()
+    used = 0
+
+    # Lead: opening paragraphs up to LEAD_SHARE of the budget (the first one is always kept, cut if needed)
+    lead_budget = max(int(budget * LEAD_SHARE), 1)
+    for i, cost in enumerate(costs):
+        if used + cost > lead_budget and chosen:
+            break
+        if cost > budget:
+            paragraphs[i] = _truncate_to_tokens(paragraphs[i], budget)
+            cost = costs[i] = estimate_tokens(paragraphs[i]) + 1
+        chosen.add(i)
+        used += cost
+
+    # Key paragraphs: best remaining ones by score, while they fit
+    title_terms = set(_TERM_RE.findall((parts[1] if len(parts) > 1 else "").lower()))
+    ranked = sorted((i for i in range(len(paragraphs)) if i not in chosen),
+                    key=lambda i: _paragraph_score(paragraphs[i], title_terms), reverse=True)
+    for i in ranked:
+        if used + costs[i] <= budget:
+            chosen.add(i)
+            used += costs[i]
+
+    kept_body = "\n".join(paragraphs[i] for i in sorted(chosen))
+    text = f"{header}\n\n{kept_body}{TRUNCATION_MARK}"
+    return text, original, estimate_tokens(text)